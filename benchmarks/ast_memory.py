@@ -0,0 +1,110 @@
+"""Memory benchmark for the AST
+
+Parses a large generated program and reports how many bytes the AST nodes
+take. A node is counted with the objects it owns: its __dict__ (if it has
+one), its list of children and its data tuple. Exits with status 1 if a node
+takes more than the budget on average.
+
+    python benchmarks/ast_memory.py [--functions N] [--budget BYTES]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FUNCTION_TEMPLATE = """
+func f{i}(a int, b int) int {{
+    var x int = a * 2
+    y := b + {i}
+    for j := 0; j < 10; j++ {{
+        if x > j {{
+            x = x + j * y
+        }} else {{
+            y = y - 1
+        }}
+    }}
+    return x + y
+}}
+"""
+
+
+def generate_program(num_functions: int) -> str:
+    parts = ['package main\n\nimport "fmt"\n']
+    parts.extend(FUNCTION_TEMPLATE.format(i=i) for i in range(num_functions))
+    parts.append("\nfunc main() {\n    fmt.Println(f0(1, 2))\n}\n")
+
+    return "".join(parts)
+
+
+def node_size(node) -> int:
+    size = sys.getsizeof(node) + sys.getsizeof(node.children)
+    if hasattr(node, "__dict__"):
+        size += sys.getsizeof(node.__dict__)
+    if isinstance(node.data, tuple):
+        size += sys.getsizeof(node.data)
+
+    return size
+
+
+def measure(ast):
+    """Returns the number of nodes, their total size and the nodes by class"""
+    num_nodes = 0
+    total = 0
+    classes = Counter()
+
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        num_nodes += 1
+        total += node_size(node)
+        classes[type(node).__name__] += 1
+        stack.extend(node.children)
+
+    return num_nodes, total, classes
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument(
+        "--functions",
+        type=int,
+        default=2000,
+        help="number of functions in the generated program (default: 2000)",
+    )
+    arg_parser.add_argument(
+        "--budget",
+        type=float,
+        default=200,
+        help="average size of a node in bytes (default: 200)",
+    )
+    args = arg_parser.parse_args(argv)
+
+    from compiler import CompilerSession
+
+    source = generate_program(args.functions)
+
+    # the parser reports its progress and the unused symbols on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        ast = CompilerSession().parse(source)
+
+    num_nodes, total, classes = measure(ast)
+    per_node = total / num_nodes
+
+    for name, count in classes.most_common():
+        print(f"{name:<14} {count:8d}")
+    print(f"{num_nodes} nodes, {total / 1024:.1f} KiB, {per_node:.1f} bytes/node")
+
+    if per_node > args.budget:
+        print(f"over budget of {args.budget:.0f} bytes/node")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
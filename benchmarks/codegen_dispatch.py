@@ -0,0 +1,109 @@
+"""Micro-benchmark for the dispatch of the code generation functions
+
+Parses a large generated program and reports, per AST node, the time taken
+to find the code generation functions of the node: by the name of its class
+in the module globals (how the code generator used to do it) and in the
+dispatch table of tac.py. The time of the whole code generation is reported
+for comparison.
+
+    python benchmarks/codegen_dispatch.py [--functions N] [--runs N]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ast_memory import generate_program
+
+
+def lookup_by_name(module_globals: dict, node):
+    node_class_name = node.__class__.__name__
+
+    pre = None
+    tac_pre_fn_name = f"tac_pre_{node_class_name}"
+    if tac_pre_fn_name in module_globals:
+        pre = module_globals[tac_pre_fn_name]
+
+    post = None
+    tac_fn_name = f"tac_{node_class_name}"
+    if tac_fn_name in module_globals:
+        post = module_globals[tac_fn_name]
+
+    return pre, post
+
+
+def lookup_in_table(tac, node):
+    node_class = node.__class__
+    return tac._dispatch.get(node_class) or tac._resolve_handlers(node_class)
+
+
+def best_time(fn, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument(
+        "--functions",
+        type=int,
+        default=1000,
+        help="number of functions in the generated program (default: 1000)",
+    )
+    arg_parser.add_argument("--runs", type=int, default=5)
+    args = arg_parser.parse_args(argv)
+
+    import syntree
+    import tac
+    from compiler import CompilerSession
+
+    session = CompilerSession()
+    source = generate_program(args.functions)
+
+    def parse():
+        # the parser reports its progress and the unused symbols on stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            return session.parse(source)
+
+    nodes = []
+    syntree.walk(parse(), pre=nodes.append)
+    module_globals = vars(tac)
+
+    def by_name():
+        for node in nodes:
+            lookup_by_name(module_globals, node)
+
+    def in_table():
+        for node in nodes:
+            lookup_in_table(tac, node)
+
+    # the code generator modifies the AST, so every run needs a new one
+    codegen_time = float("inf")
+    for _ in range(args.runs):
+        ast = parse()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            session.codegen(ast)
+            codegen_time = min(codegen_time, time.perf_counter() - start)
+
+    per_node = lambda seconds: seconds / len(nodes) * 1e9
+    print(f"{len(nodes)} nodes")
+    print(f"lookup by name   {per_node(best_time(by_name, args.runs)):8.1f} ns/node")
+    print(f"dispatch table   {per_node(best_time(in_table, args.runs)):8.1f} ns/node")
+    print(f"whole codegen    {per_node(codegen_time):8.1f} ns/node")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Benchmark of the on-disk compile cache
+
+Compiles generated programs (or the Go files given) without a cache, into an
+empty cache (a miss, which also stores the result) and from the cache (a
+hit), and reports the times and the size of the cache entries.
+
+    python benchmarks/compile_cache.py [--functions N ...] [--runs N] [files ...]
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ast_memory import generate_program
+from parse_tables import best_time
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument(
+        "--functions",
+        type=int,
+        nargs="+",
+        default=[10, 50, 200],
+        help="numbers of functions in the generated programs (default: 10 50 200)",
+    )
+    arg_parser.add_argument("--runs", type=int, default=3)
+    args = arg_parser.parse_args(argv)
+
+    from compile_cache import CompileCache
+    from compiler import CompilerSession
+
+    if args.files:
+        sources = []
+        for path in args.files:
+            with open(path, "rt") as f:
+                sources.append((os.path.basename(path), f.read()))
+    else:
+        sources = [
+            (f"{functions} functions", generate_program(functions))
+            for functions in args.functions
+        ]
+
+    directory = tempfile.mkdtemp(prefix="compile-cache-")
+    cache = CompileCache(directory)
+    plain = CompilerSession()
+    cached = CompilerSession(cache=cache)
+
+    def miss(source):
+        cache.clear()
+        cached.compile(source)
+
+    rows = []
+    try:
+        # the compiler prints its errors and the optimizer trace
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, source in sources:
+                try:
+                    plain_time = best_time(lambda: plain.compile(source), args.runs)
+                except Exception:
+                    # failed compiles are not cached
+                    rows.append((name, None, None, None, None))
+                    continue
+                miss_time = best_time(lambda: miss(source), args.runs)
+                hit_time = best_time(lambda: cached.compile(source), args.runs)
+                entry_bytes = os.path.getsize(cache.path(cache.key(source)))
+                rows.append((name, plain_time, miss_time, hit_time, entry_bytes))
+    finally:
+        shutil.rmtree(directory)
+
+    print(f"{'source':>16}{'compile (ms)':>14}{'miss (ms)':>11}{'hit (ms)':>10}"
+          f"{'entry (KB)':>12}")
+    for name, plain_time, miss_time, hit_time, entry_bytes in rows:
+        if plain_time is None:
+            print(f"{name:>16}  fails to compile")
+            continue
+        print(
+            f"{name:>16}{plain_time * 1e3:14.1f}{miss_time * 1e3:11.1f}"
+            f"{hit_time * 1e3:10.1f}{entry_bytes / 1024:12.1f}"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
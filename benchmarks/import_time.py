@@ -0,0 +1,78 @@
+"""Cold start benchmark for the compiler modules
+
+Imports each compiler entry point in a fresh interpreter a few times and
+reports the best time. Exits with status 1 if a dependency only needed for
+presentation (tables, AST pictures and trees, colors) is imported at startup,
+or if the import takes longer than the budget given with --budget (import
+times depend on the machine, so there is none by default).
+
+    python benchmarks/import_time.py [--budget MS] [--runs N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that must only be imported when their output is requested
+PRESENTATION_MODULES = ("pydot", "tabulate", "pptree", "colorama", "tree_vis")
+
+ENTRY_POINTS = ("go_parser", "compiler")
+
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [m for m in {presentation!r} if m in sys.modules]
+print(json.dumps({{"time": elapsed, "loaded": loaded}}))
+"""
+
+
+def measure(module: str) -> dict:
+    code = CHILD_CODE.format(module=module, presentation=PRESENTATION_MODULES)
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    ).stdout
+
+    return json.loads(out.decode().splitlines()[-1])
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument(
+        "--budget", type=float, help="import budget in ms (default: none)"
+    )
+    arg_parser.add_argument("--runs", type=int, default=5)
+    args = arg_parser.parse_args(argv)
+
+    # the first import may have to build the parser tables
+    measure("go_parser")
+
+    ok = True
+    for module in ENTRY_POINTS:
+        runs = [measure(module) for _ in range(args.runs)]
+        best = min(r["time"] for r in runs) * 1000
+        loaded = sorted(set(m for r in runs for m in r["loaded"]))
+
+        status = "ok"
+        if args.budget is not None and best > args.budget:
+            status = f"over budget of {args.budget:.0f} ms"
+            ok = False
+        if loaded:
+            status = f"imports {', '.join(loaded)} at startup"
+            ok = False
+
+        print(f"{module:<12} {best:8.1f} ms  {status}")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
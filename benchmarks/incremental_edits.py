@@ -0,0 +1,97 @@
+"""Check of the incremental front end on edits
+
+Compiles every file of tests/ with an IncrementalSession, then compiles edited
+versions of it (a function added in the middle of a function body, a
+declaration after an import on the same line or indented, a syntax error at
+the start of a declaration) and checks that the output, the symbol and type
+tables and the intermediate code are the same as those of a fresh
+CompilerSession. Exits with status 1 on a difference.
+
+    python benchmarks/incremental_edits.py [FILE ...]
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# a function inserted before the closing brace of a function body
+NESTED_FUNCTION = "func extra1() int {\n    var q int = 3\n    return q\n}\n"
+
+
+def edited_versions(source: str) -> dict:
+    """Edited versions of source, by name (the edits that do not apply to
+    source are left out)"""
+    versions = {}
+    closing = source.rfind("\n}")
+    if closing != -1:
+        versions["nested function"] = (
+            source[: closing + 1] + NESTED_FUNCTION + source[closing + 1 :]
+        )
+    imports = re.search(r"^import [^\n(]*$", source, re.MULTILINE)
+    if imports:
+        end = imports.end()
+        versions["declaration after import"] = (
+            source[:end] + "; var zz int = 1" + source[end:]
+        )
+        versions["indented declaration"] = (
+            source[:end] + "\n    var zz int = 1" + source[end:]
+        )
+    decl = re.search(r"^func ", source, re.MULTILINE)
+    if decl:
+        start = decl.start()
+        versions["syntax error"] = source[:start] + "func ( {\n" + source[start:]
+    return versions
+
+
+def compile_source(session, source: str) -> tuple:
+    """What compiling source printed and returned, or the error it raised"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            result = session.compile(source)
+        except Exception as e:
+            outcome = (type(e).__name__, str(e))
+        else:
+            # the rows hold TypeInfo objects, compared by identity
+            outcome = (
+                [list(map(str, row)) for row in result.symbol_rows],
+                [list(map(str, row)) for row in result.type_rows],
+                result.tac,
+                [str(quad) for quad in result.ico.code_list],
+            )
+    return output.getvalue(), outcome
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("files", nargs="*", help="Go files (default: tests/*.go)")
+    args = arg_parser.parse_args(argv)
+
+    from compiler import CompilerSession
+    from incremental import IncrementalSession
+
+    paths = args.files or sorted(glob.glob(os.path.join(ROOT, "tests", "*.go")))
+    checked = failed = 0
+    for path in paths:
+        with open(path) as f:
+            source = f.read()
+        for name, edited in edited_versions(source).items():
+            incremental = IncrementalSession()
+            compile_source(incremental, source)
+            checked += 1
+            if compile_source(incremental, edited) != compile_source(CompilerSession(), edited):
+                failed += 1
+                print(f"{os.path.relpath(path)}: {name}: differs from a fresh session")
+
+    print(f"{checked} edits, {failed} different")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Benchmark of the incremental front end against a full parse
+
+Edits large generated programs (a statement changed in the function in the
+middle of the file, then a line added at the top, which moves all the other
+declarations) and reports the time from the edit to the diagnostics, that is
+parsing, type checking and the unused variable check, with a CompilerSession
+parsing the whole file and an IncrementalSession reusing the declarations
+that did not change.
+
+    python benchmarks/incremental_parse.py [--functions N ...] [--runs N]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ast_memory import generate_program
+from parse_tables import best_time
+
+
+def edited_versions(source: str, functions: int) -> list:
+    """The source with a statement of the function in the middle changed, and
+    with a comment line added at the top as well"""
+    middle = functions // 2
+    statement = f"y := b + {middle}\n"
+    body_edit = source.replace(statement, f"y := b + {middle} + 1\n", 1)
+    top_edit = body_edit.replace('import "fmt"\n', 'import "fmt"\n\n// edited\n', 1)
+
+    return [body_edit, top_edit]
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument(
+        "--functions",
+        type=int,
+        nargs="+",
+        default=[100, 500, 2000],
+        help="numbers of functions in the generated programs (default: 100 500 2000)",
+    )
+    arg_parser.add_argument("--runs", type=int, default=5)
+    args = arg_parser.parse_args(argv)
+
+    from compiler import CompilerSession
+    from incremental import IncrementalSession
+
+    rows = []
+    for functions in args.functions:
+        source = generate_program(functions)
+        full = CompilerSession()
+        incremental = IncrementalSession()
+
+        # errors in the sources are reported on stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, edited in zip(("body", "top"), edited_versions(source, functions)):
+                full_time = best_time(lambda: full.parse(edited), args.runs)
+
+                # every run goes from the original source to the edited one
+                incr_time = float("inf")
+                for _ in range(args.runs):
+                    incremental.parse(source)
+                    incr_time = min(incr_time, best_time(lambda: incremental.parse(edited), 1))
+
+                chunks = incremental.reused + incremental.parsed
+                rows.append(
+                    (functions, source.count("\n"), name, full_time, incr_time,
+                     f"{incremental.reused}/{chunks}")
+                )
+
+    print(f"{'functions':>10}{'lines':>8}{'edit':>6}{'full (ms)':>12}{'incr (ms)':>12}"
+          f"{'speedup':>9}{'reused':>12}")
+    for functions, lines, name, full_time, incr_time, reused in rows:
+        print(
+            f"{functions:>10}{lines:>8}{name:>6}{full_time * 1e3:12.1f}"
+            f"{incr_time * 1e3:12.1f}{full_time / incr_time:9.1f}{reused:>12}"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Lexer benchmark: the PLY lexer against the hand-written Scanner
+
+Lexes a large generated program (or the Go files given) with both lexers,
+checks that they produce the same tokens and reports their throughput.
+
+    python benchmarks/lex_throughput.py [--functions N] [--runs N] [files ...]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ast_memory import generate_program
+
+
+def lex_all(go_lexer, lexer, sources) -> list:
+    """Tokens of all the sources as (type, value, lineno, lexpos) tuples"""
+    go_lexer.lexer = lexer
+    tokens = []
+    for source in sources:
+        go_lexer.set_input(source)
+        tokens.extend((t.type, t.value, t.lineno, t.lexpos) for t in lexer)
+
+    return tokens
+
+
+def best_time(fn, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument(
+        "--functions",
+        type=int,
+        default=2000,
+        help="number of functions in the generated program (default: 2000)",
+    )
+    arg_parser.add_argument("--runs", type=int, default=5)
+    args = arg_parser.parse_args(argv)
+
+    if args.files:
+        sources = []
+        for path in args.files:
+            with open(path, "rt") as f:
+                sources.append(f.read())
+    else:
+        sources = [generate_program(args.functions)]
+
+    import go_lexer
+    from ply import lex
+
+    ply_lexer = lex.lex(module=go_lexer)
+    scanner = go_lexer.Scanner()
+
+    # errors in the sources are reported on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        tokens = lex_all(go_lexer, scanner, sources)
+        if tokens != lex_all(go_lexer, ply_lexer, sources):
+            print("the PLY lexer and the Scanner do not produce the same tokens")
+            return 1
+
+        ply_time = best_time(lambda: lex_all(go_lexer, ply_lexer, sources), args.runs)
+        scanner_time = best_time(lambda: lex_all(go_lexer, scanner, sources), args.runs)
+
+    size = sum(len(source) for source in sources)
+    print(f"{len(sources)} sources, {size / 1024:.0f} KiB, {len(tokens)} tokens")
+    print(f"PLY lexer  {len(tokens) / ply_time / 1000:8.1f} k tokens/s")
+    print(f"Scanner    {len(tokens) / scanner_time / 1000:8.1f} k tokens/s")
+    print(f"speedup    {ply_time / scanner_time:8.2f}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Lexer benchmark on very long lines
+
+Lexes a function whose body is a single line of N statements, for growing N,
+with the PLY lexer and the hand-written Scanner, and reports the time per
+token. The column of every identifier is computed while lexing, which used to
+search back to the start of the line: the time per token grew with the length
+of the line. Exits with status 1 if the time per token on the longest line is
+more than --max-growth times the time on the shortest one.
+
+    python benchmarks/long_lines.py [--max-growth X] [--runs N]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STATEMENTS = (2000, 4000, 8000, 16000, 32000)
+
+
+def long_line_program(num_statements: int) -> str:
+    body = "a = a + b; " * num_statements
+    return f"package main\n\nfunc main() {{\n    var a, b int\n    {body}\n}}\n"
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument(
+        "--max-growth",
+        type=float,
+        default=2.0,
+        help="allowed growth of the time per token (default: 2)",
+    )
+    arg_parser.add_argument("--runs", type=int, default=3)
+    args = arg_parser.parse_args(argv)
+
+    import go_lexer
+    from ply import lex
+
+    lexers = {"PLY lexer": lex.lex(module=go_lexer), "Scanner": go_lexer.Scanner()}
+
+    print(f"{'statements':>10} {'line (KiB)':>10}", end="")
+    for name in lexers:
+        print(f" {name + ' (ns/token)':>22}", end="")
+    print()
+
+    per_token = {name: [] for name in lexers}
+    for num_statements in STATEMENTS:
+        source = long_line_program(num_statements)
+        print(f"{num_statements:>10} {len(source) / 1024:>10.0f}", end="")
+
+        for name, lexer in lexers.items():
+            go_lexer.lexer = lexer
+            best = float("inf")
+            for _ in range(args.runs):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    go_lexer.set_input(source)
+                    start = time.perf_counter()
+                    num_tokens = sum(1 for _ in lexer)
+                    best = min(best, time.perf_counter() - start)
+
+            per_token[name].append(best / num_tokens * 1e9)
+            print(f" {per_token[name][-1]:>22.1f}", end="")
+        print()
+
+    status = 0
+    for name, times in per_token.items():
+        growth = times[-1] / times[0]
+        if growth > args.max_growth:
+            print(f"{name}: time per token grew {growth:.1f}x with the line length")
+            status = 1
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
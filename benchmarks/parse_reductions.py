@@ -0,0 +1,97 @@
+"""Parser benchmark: reductions per token and parse throughput
+
+Parses every Go file given (tests/*.go by default) and reports the number
+of tokens, the number of reductions done by the LR parser (each one runs
+the Python action of a grammar rule) and the parse time. The most frequent
+reductions are listed with --top.
+
+    python benchmarks/parse_reductions.py [--runs N] [--top N] [files ...]
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def count_reductions(parser, counter: Counter):
+    """Wrap the actions of the grammar rules of parser to count how many
+    times each rule is reduced"""
+
+    def counted(name, fn):
+        def action(p):
+            counter[name] += 1
+            fn(p)
+
+        return action
+
+    for production in parser.productions:
+        if production.callable is not None:
+            production.callable = counted(production.str, production.callable)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    arg_parser.add_argument(
+        "--top", type=int, default=0, help="list the N most frequent reductions"
+    )
+    args = arg_parser.parse_args(argv)
+
+    files = args.files or sorted(glob.glob(os.path.join(ROOT, "tests", "*.go")))
+    sources = []
+    for path in files:
+        with open(path, "rt") as f:
+            sources.append(f.read())
+
+    import go_parser
+    from compiler import CompilerSession
+
+    session = CompilerSession()
+
+    # errors in the test files are reported on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        num_tokens = sum(len(session.tokenize(source)) for source in sources)
+
+    def parse_all():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for source in sources:
+                session.reset()
+                go_parser.parse(source)
+
+    best = float("inf")
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        parse_all()
+        best = min(best, time.perf_counter() - start)
+
+    reductions = Counter()
+    count_reductions(go_parser.parser, reductions)
+    parse_all()
+    num_reductions = sum(reductions.values())
+
+    print(f"{len(sources)} files, {num_tokens} tokens")
+    print(
+        f"{num_reductions} reductions, "
+        f"{num_reductions / num_tokens:.2f} reductions/token"
+    )
+    print(
+        f"parse time {best * 1000:.1f} ms, "
+        f"{num_tokens / best / 1000:.1f} k tokens/s"
+    )
+
+    for rule, count in reductions.most_common(args.top):
+        print(f"{count:8d}  {rule}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Benchmark of the dict and the packed LR tables of the parser
+
+Builds the parser on both kinds of tables and reports the memory taken by
+the action and goto tables (and by the arrays of the packed tables saved in
+the table file), the time of an action lookup and the parse throughput on
+every Go file given (tests/*.go by default).
+
+    python benchmarks/parse_tables.py [--runs N] [files ...]
+"""
+import argparse
+import contextlib
+import gc
+import glob
+import io
+import os
+import pickle
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class TokenList:
+    """Lexer handing out the tokens of a list"""
+
+    def __init__(self, tokens: list):
+        self.next_token = iter(tokens).__next__
+        self.lineno = tokens[-1].lineno if tokens else 1
+        self.lexpos = tokens[-1].lexpos if tokens else 0
+
+    def token(self):
+        try:
+            return self.next_token()
+        except StopIteration:
+            return None
+
+
+def deep_size(obj, seen: set) -> int:
+    """Size of the dicts, lists and ints in obj (strings are shared with the
+    grammar)"""
+    if id(obj) in seen or isinstance(obj, str):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, list):
+        for item in obj:
+            size += deep_size(item, seen)
+
+    return size
+
+
+def best_time(fn, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    args = arg_parser.parse_args(argv)
+
+    files = args.files or sorted(glob.glob(os.path.join(ROOT, "tests", "*.go")))
+    sources = []
+    for path in files:
+        with open(path, "rt") as f:
+            sources.append(f.read())
+
+    import go_parser
+    from compiler import CompilerSession
+    from ply import yacc
+
+    def build(packed):
+        return yacc.yacc(
+            module=go_parser, tabfile=go_parser.PARSETAB_FILE, packed=packed
+        )
+
+    start = time.perf_counter()
+    dict_parser = build(packed=False)
+    dict_build = time.perf_counter() - start
+    start = time.perf_counter()
+    packed_parser = build(packed=True)
+    packed_build = time.perf_counter() - start
+
+    seen = set()
+    dict_bytes = deep_size(dict_parser.action, seen) + deep_size(dict_parser.goto, seen)
+    tables = packed_parser.tables
+    seen = set()
+    packed_bytes = sum(deep_size(getattr(tables, name), seen) for name in tables.array_names)
+    with open(go_parser.PARSETAB_FILE, "rb") as f:
+        array_bytes = pickle.load(f)["packed"].nbytes()
+
+    # every action of the table is looked up once, the packed parser gets the
+    # code of a token once per token and not per lookup
+    actions = dict_parser.action
+    tables = packed_parser.tables
+    codes = tables.token_codes
+    base, check, value = tables.action_base, tables.action_check, tables.action_value
+    lookups = [
+        (state, tok, codes[tok]) for state, row in actions.items() for tok in row
+    ]
+
+    def dict_lookups():
+        for state, tok, code in lookups:
+            actions[state].get(tok)
+
+    def packed_lookups():
+        for state, tok, code in lookups:
+            i = base[state] + code
+            if check[i] == state:
+                value[i]
+
+    # the files are lexed once, only the parser is timed
+    session = CompilerSession()
+    with contextlib.redirect_stdout(io.StringIO()):
+        token_lists = [session.tokenize(source) for source in sources]
+    num_tokens = sum(len(tokens) for tokens in token_lists)
+
+    def parse_all(parser):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for source, tokens in zip(sources, token_lists):
+                session.reset()
+                # for the error messages
+                go_parser.go_lexer.set_input(source)
+                parser.parse(lexer=TokenList(tokens), tracking=True)
+
+    # the runs of the two parsers alternate so that both see the same load
+    gc.disable()
+    parse_times = {dict_parser: float("inf"), packed_parser: float("inf")}
+    for _ in range(args.runs):
+        for parser in parse_times:
+            start = time.perf_counter()
+            parse_all(parser)
+            parse_times[parser] = min(parse_times[parser], time.perf_counter() - start)
+    gc.enable()
+
+    per_lookup = lambda seconds: seconds / len(lookups) * 1e9
+    throughput = lambda seconds: num_tokens / seconds / 1000
+
+    print(f"{len(actions)} states, {len(lookups)} actions")
+    print(f"{len(sources)} files, {num_tokens} tokens")
+    print(f"{'':14}{'dict':>12}{'packed':>12}")
+    print(f"{'tables (KiB)':14}{dict_bytes / 1024:12.1f}{packed_bytes / 1024:12.1f}")
+    print(f"{'(arrays)':14}{'':12}{array_bytes / 1024:12.1f}")
+    print(f"{'build (ms)':14}{dict_build * 1000:12.1f}{packed_build * 1000:12.1f}")
+    print(
+        f"{'lookup (ns)':14}"
+        f"{per_lookup(best_time(dict_lookups, args.runs)):12.1f}"
+        f"{per_lookup(best_time(packed_lookups, args.runs)):12.1f}"
+    )
+    print(
+        f"{'k tokens/s':14}"
+        f"{throughput(parse_times[dict_parser]):12.1f}"
+        f"{throughput(parse_times[packed_parser]):12.1f}"
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Benchmark of the token buffer against a list of LexToken objects
+
+Lexes a large generated program (or the Go files given) into a list of
+LexToken objects and into a TokenBuffer and reports the memory taken by the
+tokens, the lexing time and the parse time of both. The tokens of the list
+are built by the lexer and those of the buffer by the parser, as it reads
+them, so the lexing and parse times are also reported together, along with
+the time of parsing the tokens as the lexer scans them (what go_parser.parse()
+does unless TOKEN_BUFFER is set).
+
+    python benchmarks/token_buffer.py [--functions N] [--runs N] [files ...]
+"""
+import argparse
+import contextlib
+import gc
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ast_memory import generate_program
+from parse_tables import TokenList, best_time
+
+
+def token_list_size(tokens: list) -> int:
+    """Size of the list, the tokens, their dicts and the tuples of their values
+    (strings and numbers are not counted)"""
+    size = sys.getsizeof(tokens)
+    for tok in tokens:
+        size += sys.getsizeof(tok) + sys.getsizeof(tok.__dict__)
+        if isinstance(tok.value, tuple):
+            size += sys.getsizeof(tok.value)
+
+    return size
+
+
+def buffer_size(buffer) -> int:
+    """Size of the arrays of buffer and of its table of values (strings and
+    numbers are not counted)"""
+    size = sum(
+        sys.getsizeof(a) for a in (buffer.kinds, buffer.offsets, buffer.lines, buffer.values)
+    )
+    size += sys.getsizeof(buffer.table) + sys.getsizeof(buffer.table_index)
+    size += sum(sys.getsizeof(value) for value in buffer.table if isinstance(value, tuple))
+
+    return size
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument(
+        "--functions",
+        type=int,
+        default=2000,
+        help="number of functions in the generated program (default: 2000)",
+    )
+    arg_parser.add_argument("--runs", type=int, default=5)
+    args = arg_parser.parse_args(argv)
+
+    if args.files:
+        sources = []
+        for path in args.files:
+            with open(path, "rt") as f:
+                sources.append(f.read())
+    else:
+        sources = [generate_program(args.functions)]
+
+    import go_lexer
+    import go_parser
+
+    def lex_lists():
+        lists = []
+        for source in sources:
+            go_lexer.set_input(source)
+            lists.append(list(go_lexer.lexer))
+        return lists
+
+    def lex_buffers():
+        return [go_lexer.scan(source) for source in sources]
+
+    # errors in the sources are reported on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        token_lists = lex_lists()
+        buffers = lex_buffers()
+        list_time = best_time(lex_lists, args.runs)
+        buffer_time = best_time(lex_buffers, args.runs)
+
+    num_tokens = sum(len(buffer) for buffer in buffers)
+    list_bytes = sum(token_list_size(tokens) for tokens in token_lists)
+    buffer_bytes = sum(buffer_size(buffer) for buffer in buffers)
+    array_bytes = sum(buffer.nbytes() for buffer in buffers)
+
+    def parse_all(lexers):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for source, lexer in zip(sources, lexers()):
+                go_parser.reset()
+                go_lexer.set_input(source)
+                go_parser.parser.parse(lexer=lexer, tracking=True)
+
+    def rewound_buffers():
+        for buffer in buffers:
+            buffer.rewind()
+            yield buffer
+
+    # the runs of the parses alternate so that all see the same load
+    gc.disable()
+    parse_times = {"list": float("inf"), "buffer": float("inf"), "stream": float("inf")}
+    for _ in range(args.runs):
+        for name, lexers in (
+            ("list", lambda: map(TokenList, token_lists)),
+            ("buffer", rewound_buffers),
+            # parse_all gives the source to the lexer
+            ("stream", lambda: [go_lexer.lexer] * len(sources)),
+        ):
+            start = time.perf_counter()
+            parse_all(lexers)
+            parse_times[name] = min(parse_times[name], time.perf_counter() - start)
+    gc.enable()
+
+    per_token = lambda value: value / num_tokens
+    print(f"{len(sources)} sources, {num_tokens} tokens")
+    print(f"{'':16}{'list':>12}{'buffer':>12}{'stream':>12}")
+    print(f"{'bytes/token':16}{per_token(list_bytes):12.1f}{per_token(buffer_bytes):12.1f}")
+    print(f"{'(arrays)':16}{'':12}{per_token(array_bytes):12.1f}")
+    print(
+        f"{'lex (ns/token)':16}"
+        f"{per_token(list_time) * 1e9:12.1f}{per_token(buffer_time) * 1e9:12.1f}"
+    )
+    print(
+        f"{'parse (ns/token)':16}"
+        f"{per_token(parse_times['list']) * 1e9:12.1f}"
+        f"{per_token(parse_times['buffer']) * 1e9:12.1f}"
+    )
+    print(
+        f"{'both (ns/token)':16}"
+        f"{per_token(list_time + parse_times['list']) * 1e9:12.1f}"
+        f"{per_token(buffer_time + parse_times['buffer']) * 1e9:12.1f}"
+        f"{per_token(parse_times['stream']) * 1e9:12.1f}"
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
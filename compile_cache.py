@@ -0,0 +1,188 @@
+"""Content-addressed on-disk cache of compile results
+
+A compile result is stored under a hash of the source text and of the
+compiler version (a hash of the code of the compiler modules and of the
+Python version, so changing the compiler makes the old entries unreachable).
+An entry holds:
+ - everything the compiler printed (errors and the optimizer trace)
+ - the AST returned by parse (type checked and optimized), pickled together
+   with the rows of the symbol and type tables, before the code generator
+   takes it apart
+ - the TAC (as text, as in CompileResult) and the optimized code
+
+Entries are written to a temporary file in the cache directory and then
+renamed, so builds sharing a directory never see a partial entry. Reading an
+entry updates its modification time, and when the entries take more than
+max_bytes the ones used least recently are removed.
+
+Usage:
+
+    cache = CompileCache(".gopy-cache")
+    session = CompilerSession(cache=cache)
+    session.compile_file("tests/binary_search.go")  # compiled and stored
+    session.compile_file("tests/binary_search.go")  # read back
+"""
+import hashlib
+import importlib.util
+import os
+import pickle
+import sys
+import tempfile
+from typing import Optional, Tuple, Union
+
+from utils import SourceFile
+
+# modules whose code decides what the compiler produces
+COMPILER_MODULES = (
+    "compiler",
+    "go_lexer",
+    "go_parser",
+    "syntree",
+    "symbol_table",
+    "tac",
+    "ico",
+    "utils",
+    "ply.lex",
+    "ply.yacc",
+)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# entries are named by their key, temporary files start with TEMP_PREFIX
+TEMP_PREFIX = ".tmp-"
+
+_version = None
+
+
+def compiler_version() -> str:
+    """Hash of the code of the compiler and of the Python version"""
+    global _version
+
+    if _version is None:
+        digest = hashlib.sha256(sys.version.encode("utf-8"))
+        for name in COMPILER_MODULES:
+            with open(importlib.util.find_spec(name).origin, "rb") as f:
+                digest.update(f.read())
+        _version = digest.hexdigest()
+
+    return _version
+
+
+def dump_front(ast, symbol_rows: list, type_rows: list) -> bytes:
+    """Serialize the AST and the table rows (together, so that the symbols
+    and types they share are stored once)"""
+    return pickle.dumps((ast, symbol_rows, type_rows), pickle.HIGHEST_PROTOCOL)
+
+
+class CompileCache:
+    """Compile results stored as files in directory, one per source"""
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # bytes taken by the entries, counted when the first entry is added
+        # and then kept up to date with the entries added by this process
+        self.total_bytes: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source: Union[str, SourceFile]) -> str:
+        text = source.text if isinstance(source, SourceFile) else source
+        digest = hashlib.sha256(compiler_version().encode("ascii"))
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[Tuple[str, tuple, list, object]]:
+        """The output, the (AST, symbol rows, type rows), the TAC and the
+        optimized code stored under key, or None"""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            front = pickle.loads(entry["front"])
+            ico = pickle.loads(entry["ico"])
+        except Exception:
+            # missing, or not readable by this version of the classes
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            # removed by another build in the meantime
+            pass
+
+        return entry["output"], front, entry["tac"], ico
+
+    def put(self, key: str, output: str, front: bytes, tac: list, ico):
+        """Store an entry under key (front is made by dump_front) and remove
+        the entries used least recently if the cache is then too large"""
+        data = pickle.dumps(
+            {
+                "output": output,
+                "front": front,
+                "tac": tac,
+                "ico": pickle.dumps(ico, pickle.HIGHEST_PROTOCOL),
+            },
+            pickle.HIGHEST_PROTOCOL,
+        )
+
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self.path(key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        if self.total_bytes is None:
+            self.evict()
+        else:
+            self.total_bytes += len(data)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def entries(self) -> list:
+        """(modification time, size, path) of every entry"""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith(TEMP_PREFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return entries
+
+    def evict(self):
+        """Remove the entries used least recently until the others take at
+        most max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # removed by another build
+                pass
+            total -= size
+
+        self.total_bytes = total
+
+    def clear(self):
+        """Remove all the entries"""
+        for _, _, path in self.entries():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self.total_bytes = 0
@@ -0,0 +1,164 @@
+"""Compile server (daemon) listening on a Unix socket
+
+The server imports the compiler and builds the parser tables once. Every
+request is handled in a child forked from this warm process, so the module
+global compiler state (symbol table, type table, AST) of one request never
+leaks into another, and no request pays for interpreter startup or imports.
+
+Start the server:
+
+    python compile_server.py serve
+
+(add --cache-dir DIR to keep the results in an on-disk cache, see
+compile_cache.py)
+
+Compile a file through it:
+
+    python compile_server.py compile tests/binary_search.go
+
+Protocol: the client sends one JSON object on a single line, either
+{"path": "/abs/path/file.go"} or {"source": "package main ..."}, and the
+server answers with one JSON object on a single line (see handle_request)
+before closing the connection.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import time
+import traceback
+from typing import Optional
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"gopy-{os.getuid()}.sock")
+
+# created by serve(), so that clients do not have to import the compiler
+session = None
+
+
+def handle_request(request: dict) -> dict:
+    """Compile the file or source in request and build the response
+
+    The response has:
+     - ok: False if the compiler raised an exception
+     - error: the exception, if any
+     - time: wall time of the compilation in seconds
+     - output: everything the compiler printed
+     - symtab, tac, ico: symbol/type tables, TAC and optimized TAC
+    """
+    response = {"ok": True, "error": None}
+    output = io.StringIO()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        try:
+            if "source" in request:
+                result = session.compile(request["source"], request.get("path"))
+            else:
+                result = session.compile_file(request["path"])
+
+            response["symtab"] = (
+                result.symbol_table_str() + "\n" + result.type_table_str()
+            )
+            response["tac"] = result.tac_str()
+            response["ico"] = result.ico_str()
+        except Exception as e:
+            traceback.print_exc(file=output)
+            response["ok"] = False
+            response["error"] = f"{e.__class__.__name__}: {e}"
+
+    response["time"] = time.perf_counter() - start
+    response["output"] = output.getvalue()
+
+    return response
+
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+    """Runs in a freshly forked child for every connection"""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = handle_request(request)
+        except ValueError as e:
+            response = {"ok": False, "error": f"Bad request: {e}"}
+
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class ForkingUnixServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def serve(socket_path: str = DEFAULT_SOCKET, cache_dir: Optional[str] = None):
+    """Serve requests on socket_path, keeping the compile results in an
+    on-disk cache if cache_dir is given"""
+    global session
+
+    from compiler import CompilerSession, open_cache
+
+    session = CompilerSession(cache=open_cache(cache_dir))
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    with ForkingUnixServer(socket_path, CompileRequestHandler) as server:
+        print(f"Compile server listening on {socket_path}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+
+def request_compile(request: dict, socket_path: str = DEFAULT_SOCKET) -> dict:
+    """Send a request to a running server and return its response"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="GoPy compile server")
+    arg_parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET,
+        help=f"path of the Unix socket (default: {DEFAULT_SOCKET})",
+    )
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    serve_cmd = commands.add_parser("serve", help="start the server")
+    serve_cmd.add_argument(
+        "--cache-dir", help="directory of the on-disk cache of compile results"
+    )
+    compile_cmd = commands.add_parser("compile", help="compile files using the server")
+    compile_cmd.add_argument("paths", nargs="+")
+    args = arg_parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.socket, args.cache_dir)
+        return 0
+
+    status = 0
+    for path in args.paths:
+        response = request_compile({"path": os.path.abspath(path)}, args.socket)
+
+        print(response["output"], end="")
+        if response["ok"]:
+            print(response["ico"])
+        else:
+            print(response["error"], file=sys.stderr)
+            status = 1
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,489 @@
+"""Importable compiler pipeline
+
+Compiles Go source code through all the phases
+(source -> tokens -> AST -> TAC -> optimized TAC) in the current process.
+The lexer, the parser and its tables are built once, when this module is
+imported, and are reused for every file compiled afterwards.
+
+Usage:
+
+    session = CompilerSession()
+    result = session.compile_file("tests/binary_search.go")
+    result.ico.print_three_address_code()
+
+It can also be run as a script to compile many files in one go:
+
+    python compiler.py -o build tests/*.go
+
+Pass --jobs N to spread the files over N worker processes, and --cache-dir
+DIR to keep the results in an on-disk cache (see compile_cache.py) shared by
+the builds, so that the files which did not change are not compiled again.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple, Union
+
+import go_lexer
+import go_parser
+import syntree
+from go_lexer import symtab, type_table
+from symbol_table import SymbolTable, TypeTable
+from tac import IntermediateCode, intermediate_codegen, pack_ic, unpack_ic
+from utils import SourceFile, strip_colors, use_colors
+from ico import optimize_ic
+
+
+@dataclass
+class CompileResult:
+    """Artifacts of compiling one source file"""
+
+    filename: Optional[str]
+    ast: syntree.Node
+    # rows of the symbol and type tables, taken right after parsing
+    symbol_rows: list
+    type_rows: list
+    # three address code before optimization (the IC is modified in place
+    # by the optimizer, so it is saved as text)
+    tac: List[str]
+    ico: IntermediateCode
+
+    def symbol_table_str(self) -> str:
+        from tabulate import tabulate
+
+        return str(
+            tabulate(
+                self.symbol_rows, headers=SymbolTable.table_headers, tablefmt="psql"
+            )
+        )
+
+    def type_table_str(self) -> str:
+        from tabulate import tabulate
+
+        return str(
+            tabulate(self.type_rows, headers=TypeTable.table_headers, tablefmt="psql")
+        )
+
+    def tac_str(self) -> str:
+        return "\n".join(self.tac)
+
+    def ico_str(self) -> str:
+        return "\n".join(str(q) for q in self.ico.code_list)
+
+
+class CompilerSession:
+    """Compiles source files one after the other in the same process
+
+    The compiler keeps its state (symbol table, type table, AST) in module
+    globals, so it is reset before every file. Only one file can be compiled
+    at a time in a process.
+
+    With a cache (a compile_cache.CompileCache), compile reads the result of
+    a source compiled before from the cache instead of compiling it.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+
+    def reset(self):
+        """Clear all state left behind by the previous file"""
+        go_parser.reset()
+
+    def tokenize(self, source: Union[str, SourceFile]) -> list:
+        """Return the list of tokens in source"""
+        self.reset()
+        go_lexer.set_input(source)
+
+        return list(go_lexer.lexer)
+
+    def parse(self, source: Union[str, SourceFile]) -> syntree.Node:
+        """Parse source and return the post-processed AST"""
+        self.reset()
+        ast = go_parser.parse(source)
+        ast = syntree.postprocess_AST(ast)
+
+        symtab.check_unused()
+
+        return ast
+
+    def codegen(self, ast: syntree.Node) -> IntermediateCode:
+        """Generate intermediate code for an AST returned by parse"""
+        return intermediate_codegen(ast)
+
+    def optimize(self, ic: IntermediateCode) -> IntermediateCode:
+        """Optimize the intermediate code. ic is modified in the process."""
+        return optimize_ic(ic)
+
+    def compile(
+        self, source: Union[str, SourceFile], filename: Optional[str] = None
+    ) -> CompileResult:
+        """Run all phases of the compiler on source
+
+        If source is in the cache, what the compiler printed when it was
+        compiled is printed again and the stored result is returned (the
+        module globals are then left as they were). Its AST is the one parse
+        returned, before the code generator took it apart.
+        """
+        if self.cache is None:
+            return self._back_end(filename, *self._front_end(source))
+
+        from compile_cache import dump_front
+
+        key = self.cache.key(source)
+        entry = self.cache.get(key)
+        if entry is not None:
+            output, front, tac, ico = entry
+            # the entry may have been stored by a compiler printing colors
+            if not use_colors():
+                output = strip_colors(output)
+            sys.stdout.write(output)
+            return CompileResult(filename, *front, tac, ico)
+
+        # the output is stored with the result, to be printed on a hit
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                front = self._front_end(source)
+                # the code generator takes the AST apart, so it is saved first
+                try:
+                    saved_front = dump_front(*front)
+                except RecursionError:
+                    # too deep for pickle, the result is not cached
+                    saved_front = None
+                result = self._back_end(filename, *front)
+        finally:
+            sys.stdout.write(output.getvalue())
+
+        if saved_front is not None:
+            self.cache.put(key, output.getvalue(), saved_front, result.tac, result.ico)
+
+        return result
+
+    def _front_end(self, source: Union[str, SourceFile]) -> tuple:
+        """The AST and the rows of the symbol and type tables"""
+        ast = self.parse(source)
+        return ast, symtab.rows(), type_table.rows()
+
+    def _back_end(
+        self, filename: Optional[str], ast: syntree.Node, symbol_rows: list, type_rows: list
+    ) -> CompileResult:
+        ic = self.codegen(ast)
+        tac = [str(q) for q in ic.code_list]
+
+        ico = self.optimize(ic)
+
+        return CompileResult(filename, ast, symbol_rows, type_rows, tac, ico)
+
+    def compile_file(self, path: str) -> CompileResult:
+        return self.compile(SourceFile.read(path), path)
+
+
+@dataclass
+class BatchEntry:
+    """Outcome of compiling one file in batch mode"""
+
+    path: str
+    wall_time: float
+    ok: bool
+    error: Optional[str] = None
+
+
+def expand_paths(patterns: Iterable[str]) -> List[str]:
+    """Expand directories and glob patterns into a list of .go files"""
+    paths = []
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(glob.glob(os.path.join(pattern, "*.go"))))
+        elif glob.has_magic(pattern):
+            paths.extend(sorted(glob.glob(pattern)))
+        else:
+            paths.append(pattern)
+
+    return paths
+
+
+def artifact_names(paths: List[str]) -> List[str]:
+    """Unique base names (without extension) for the artifacts of each file"""
+    names = []
+    seen = set()
+
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        unique_name = name
+        n = 1
+        while unique_name in seen:
+            n += 1
+            unique_name = f"{name}_{n}"
+        seen.add(unique_name)
+        names.append(unique_name)
+
+    return names
+
+
+def write_artifacts(result: CompileResult, out_prefix: str, ico: bool = True):
+    """Write the symbol table, TAC and optimized TAC of a compiled file"""
+    with open(f"{out_prefix}.symtab.txt", "wt", encoding="utf-8") as f:
+        print(result.symbol_table_str(), file=f)
+        print(result.type_table_str(), file=f)
+
+    with open(f"{out_prefix}.tac.txt", "wt", encoding="utf-8") as f:
+        print(result.tac_str(), file=f)
+
+    if ico:
+        with open(f"{out_prefix}.ico.txt", "wt", encoding="utf-8") as f:
+            print(result.ico_str(), file=f)
+
+
+def _compile_one(
+    session: CompilerSession, path: str, out_prefix: str, ico: bool = True
+) -> Tuple[Optional[CompileResult], float, Optional[str]]:
+    """Compile path with its output redirected to <out_prefix>.log
+
+    The log is plain text: the colors of the errors (printed when the
+    compiler runs in a terminal) are left out.
+
+    Returns the result (None on failure), the wall time and the error.
+    """
+    result = None
+    error = None
+
+    start = time.perf_counter()
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        try:
+            result = session.compile_file(path)
+            write_artifacts(result, out_prefix, ico=ico)
+        except Exception as e:
+            traceback.print_exc(file=log)
+            result = None
+            error = f"{e.__class__.__name__}: {e}"
+    with open(f"{out_prefix}.log", "wt", encoding="utf-8") as f:
+        f.write(strip_colors(log.getvalue()))
+    wall_time = time.perf_counter() - start
+
+    return result, wall_time, error
+
+
+def compile_batch(
+    paths: List[str], out_dir: str, session: Optional[CompilerSession] = None
+) -> List[BatchEntry]:
+    """Compile all paths with one session, writing artifacts to out_dir
+
+    Everything the compiler prints for a file (errors, optimizer trace) goes
+    to <out_dir>/<name>.log instead of the terminal.
+    """
+    if session is None:
+        session = CompilerSession()
+
+    os.makedirs(out_dir, exist_ok=True)
+    entries = []
+
+    for path, name in zip(paths, artifact_names(paths)):
+        out_prefix = os.path.join(out_dir, name)
+        _, wall_time, error = _compile_one(session, path, out_prefix)
+        entries.append(BatchEntry(path, wall_time, error is None, error))
+
+    return entries
+
+
+def open_cache(cache_dir: Optional[str], cache_bytes: Optional[int] = None):
+    """The CompileCache in cache_dir (None without a directory)"""
+    if cache_dir is None:
+        return None
+
+    from compile_cache import CompileCache, DEFAULT_MAX_BYTES
+
+    return CompileCache(cache_dir, DEFAULT_MAX_BYTES if cache_bytes is None else cache_bytes)
+
+
+# session of a worker process, created once by _init_worker
+_worker_session: Optional[CompilerSession] = None
+
+
+def _init_worker(cache_dir: Optional[str] = None, cache_bytes: Optional[int] = None):
+    global _worker_session
+    _worker_session = CompilerSession(cache=open_cache(cache_dir, cache_bytes))
+
+
+def _compile_in_worker(path: str, out_prefix: str):
+    """Compile one file in a worker process
+
+    The optimized code is packed with pack_ic and handed back through a
+    shared memory block, whose name and size are returned. The parent is
+    responsible for unlinking it.
+    """
+    result, wall_time, error = _compile_one(_worker_session, path, out_prefix, ico=False)
+
+    if result is None:
+        return wall_time, error, None, 0
+
+    from multiprocessing import shared_memory
+
+    data = pack_ic(result.ico)
+    shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    shm.buf[: len(data)] = data
+    shm.close()
+
+    return wall_time, error, shm.name, len(data)
+
+
+def _read_shared_ic(name: str, size: int) -> list:
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return unpack_ic(data)
+
+
+def _unlink_shared_ic(name: str):
+    from multiprocessing import shared_memory
+
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def compile_parallel(
+    paths: List[str],
+    out_dir: str,
+    jobs: int,
+    cache_dir: Optional[str] = None,
+    cache_bytes: Optional[int] = None,
+) -> List[BatchEntry]:
+    """Like compile_batch, but spreads the files over jobs worker processes
+    (which share the cache in cache_dir, if given)"""
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import resource_tracker
+
+    os.makedirs(out_dir, exist_ok=True)
+    out_prefixes = [os.path.join(out_dir, name) for name in artifact_names(paths)]
+    entries = []
+
+    # The workers create the shared memory blocks and this process unlinks
+    # them. Started here, the resource tracker is shared with the workers, so
+    # that it sees both, and it only removes the blocks left over if this
+    # process dies.
+    resource_tracker.ensure_running()
+
+    futures = []
+    # names of the blocks read (and unlinked) so far
+    read = set()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(cache_dir, cache_bytes)
+        ) as executor:
+            for path, out_prefix in zip(paths, out_prefixes):
+                futures.append(executor.submit(_compile_in_worker, path, out_prefix))
+
+            for path, out_prefix, future in zip(paths, out_prefixes, futures):
+                try:
+                    wall_time, error, shm_name, size = future.result()
+                except Exception as e:
+                    wall_time, error, shm_name = 0.0, f"{e.__class__.__name__}: {e}", None
+
+                if shm_name is not None:
+                    ico = _read_shared_ic(shm_name, size)
+                    read.add(shm_name)
+                    with open(f"{out_prefix}.ico.txt", "wt", encoding="utf-8") as f:
+                        print("\n".join(str(q) for q in ico), file=f)
+
+                entries.append(BatchEntry(path, wall_time, error is None, error))
+    finally:
+        # After an exception, the blocks of the results not read yet (the
+        # executor waits for all of them on exit) are unlinked here
+        for future in futures:
+            if future.cancelled() or future.exception() is not None:
+                continue
+            shm_name = future.result()[2]
+            if shm_name is not None and shm_name not in read:
+                _unlink_shared_ic(shm_name)
+
+    return entries
+
+
+def format_summary(entries: List[BatchEntry]) -> str:
+    from tabulate import tabulate
+
+    rows = [
+        [e.path, f"{e.wall_time * 1000:.1f}", "ok" if e.ok else e.error]
+        for e in entries
+    ]
+    total = sum(e.wall_time for e in entries)
+    failed = sum(1 for e in entries if not e.ok)
+
+    table = tabulate(rows, headers=["File", "Time (ms)", "Status"], tablefmt="psql")
+
+    return (
+        f"{table}\n"
+        f"{len(entries)} files, {failed} failed, total {total * 1000:.1f} ms"
+    )
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Compile many Go files in a single process"
+    )
+    arg_parser.add_argument(
+        "paths", nargs="+", help="files, directories or glob patterns to compile"
+    )
+    arg_parser.add_argument(
+        "-o",
+        "--out-dir",
+        default="build",
+        help="directory for the per-file artifacts (default: build)",
+    )
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes (default: 1, compile in this process)",
+    )
+    arg_parser.add_argument(
+        "--cache-dir",
+        help="directory of the on-disk cache of compile results (default: no cache)",
+    )
+    arg_parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=256,
+        help="size of the cache in MB, the entries used least recently are "
+        "removed beyond it (default: 256)",
+    )
+    args = arg_parser.parse_args(argv)
+
+    paths = expand_paths(args.paths)
+    cache_bytes = args.cache_size * 1024 * 1024
+    if args.jobs > 1:
+        entries = compile_parallel(
+            paths, args.out_dir, args.jobs, args.cache_dir, cache_bytes
+        )
+    else:
+        session = CompilerSession(cache=open_cache(args.cache_dir, cache_bytes))
+        entries = compile_batch(paths, args.out_dir, session)
+
+    summary = format_summary(entries)
+    print(summary)
+    with open(os.path.join(args.out_dir, "summary.txt"), "wt", encoding="utf-8") as f:
+        print(summary, file=f)
+
+    return 0 if all(e.ok for e in entries) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
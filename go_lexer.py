@@ -1,27 +1,19 @@
+import functools
+import re
 import sys
-
-import colorama
-from colorama import Fore, Style
+from array import array
+from typing import Union
 
 from ply import lex
 
 from symbol_table import SymbolTable, TypeTable
 import utils
-from utils import print_line, print_marker, print_lexer_error
-
-colorama.init()
-
-with open(sys.argv[1], "r") as f:
-    input_code = f.read()
-
-if input_code[len(input_code) - 1] != "\n":
-    input_code += "\n"
+from utils import SourceFile, colors, print_line, print_marker, print_lexer_error
 
 
 # Find column number of token
 def find_column(token):
-    line_start = input_code.rfind("\n", 0, token.lexpos) + 1
-    return (token.lexpos - line_start) + 1
+    return utils.source.column(token.lexpos)
 
 
 # Lexing states
@@ -158,7 +150,7 @@ unused_tokens = {
     "RIGHT_SHIFT",
     "RIGHT_SHIFT_EQ",
 }
-required_tokens_for_parser = list(set(tokens) - unused_tokens)
+required_tokens_for_parser = [tok for tok in tokens if tok not in unused_tokens]
 #  print(required_tokens_for_parser)
 
 # tokens to ignore in ANY state
@@ -246,15 +238,7 @@ t_ELLIPSIS = r"\.\.\."
 def t_ANY_UNCLOSED_MULTI_COMMENT(t):
     r"/\*(.|\n)*"
 
-    print_lexer_error("Unclosed Multiline comment")
-    col = find_column(t)
-    print(f"at line {t.lineno}, column {col}")
-    print(
-        f"{Fore.GREEN}{t.lineno:>10}:\t{Style.RESET_ALL}",
-        lines[t.lineno - 1],
-        sep="",
-    )
-    print_marker(col - 1, 1)
+    report_error_at("Unclosed Multiline comment", t)
 
 
 # token in InsertSemi state
@@ -345,22 +329,7 @@ def t_STRING_LIT(t):
     #      return
 
     if "\n" in t.value:
-        print_lexer_error("string cannot contain line breaks")
-        lineno = t.lexer.lineno
-        pos = find_column(t)
-        splits = list(t.value.split("\n"))
-        for i, line_ in enumerate(splits):
-            print_line(lineno)
-            line_actual = lines[lineno - 1]
-
-            if i == 0:
-                print_marker(pos - 1, len(line_actual) - pos + 1)
-            elif i == len(splits) - 1:
-                print_marker(0, line_actual.find('"') + 1)
-            else:
-                print_marker(0, len(line_actual))
-
-            lineno += 1
+        report_multiline_string(t)
         t.lexer.lineno += t.value.count("\n")
 
         return
@@ -413,7 +382,7 @@ def t_IDENTIFIER(t):
         t.type = types[t.value][0]
     else:
         t.type = "IDENTIFIER"
-        t.value = ("identifier", t.value, find_column(t))
+        t.value = ("identifier", sys.intern(t.value), find_column(t))
 
     t.lexer.begin('InsertSemi')
     return t
@@ -421,32 +390,495 @@ def t_IDENTIFIER(t):
 
 # Error handling rule for ANY state
 def t_ANY_error(t):
-    print_lexer_error(f"Illegal character {t.value[0]}")
+    report_error_at(f"Illegal character {t.value[0]}", t)
+
+    t.lexer.skip(1)
+
+
+# errors reported by both the PLY lexer and the Scanner
+
+# buffer being filled by scan()
+scanning = None
+
+
+def deferred_while_scanning(report):
+    """While scan() fills a buffer, the report is kept in the buffer and
+    made when the parser reaches the next token, so that lexer and syntax
+    errors come out in the order of the source"""
+
+    @functools.wraps(report)
+    def wrapper(*args):
+        if scanning is None:
+            report(*args)
+        else:
+            scanning.reports.append((len(scanning), report, args))
+
+    return wrapper
+
+
+@deferred_while_scanning
+def report_error_at(message: str, t):
+    """Report an error at the first character of the token t"""
+    print_lexer_error(message)
     col = find_column(t)
     print(f"at line {t.lineno}, column {col}")
+    Fore, Style = colors()
     print(
         f"{Fore.GREEN}{t.lineno:>10}:\t{Style.RESET_ALL}",
-        lines[t.lineno - 1],
+        utils.source.line(t.lineno),
         sep="",
     )
     print_marker(col - 1, 1)
 
-    t.lexer.skip(1)
 
+@deferred_while_scanning
+def report_multiline_string(t):
+    """Report a string literal spanning several lines and mark all of them"""
+    print_lexer_error("string cannot contain line breaks")
+    lineno = t.lineno
+    pos = find_column(t)
+    splits = list(t.value.split("\n"))
+    for i, line_ in enumerate(splits):
+        print_line(lineno)
+        line_actual = utils.source.line(lineno)
+
+        if i == 0:
+            print_marker(pos - 1, len(line_actual) - pos + 1)
+        elif i == len(splits) - 1:
+            print_marker(0, line_actual.find('"') + 1)
+        else:
+            print_marker(0, len(line_actual))
+
+        lineno += 1
+
+
+# Hand-written scanner
+#
+# Produces the same tokens as the PLY lexer built from the rules above in one
+# pass over the source: the token is chosen from its first character instead
+# of trying the rules of the master regex in turn, semicolons are inserted with
+# a flag instead of the InsertSemi state (and its rescan of the next
+# character) and the start of the current line is tracked for the columns of
+# identifiers.
+
+ASCII_LETTERS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
+# the regexes of t_FLOAT_LIT, t_INT_LIT and t_IDENTIFIER, matched at one position
+# (PLY compiles its rules in verbose mode)
+FLOAT_LIT_RE = re.compile(t_FLOAT_LIT.__doc__, re.VERBOSE)
+INT_LIT_RE = re.compile(r"\d+")
+IDENTIFIER_RE = re.compile(r"[a-zA-Z][a-zA-Z0-9_]*")
+
+# operators by length, the longest one is taken
+OPERATORS_3 = {"&^=": "AMP_CARET_EQ", ">>=": "RIGHT_SHIFT_EQ", "<<=": "LEFT_SHIFT_EQ"}
+OPERATORS_2 = {
+    "^=": "CARET_EQ",
+    "|=": "BAR_EQ",
+    "&=": "AMP_EQ",
+    ">>": "RIGHT_SHIFT",
+    "<<": "LEFT_SHIFT",
+    "&&": "AMPER_AMPER",
+    "||": "BAR_BAR",
+    ":=": "WALRUS",
+    "+=": "ADD_EQ",
+    "-=": "SUB_EQ",
+    "*=": "MUL_EQ",
+    "/=": "DIV_EQ",
+    "%=": "MOD_EQ",
+    "==": "EQ_EQ",
+    "!=": "NOT_EQ",
+    "<=": "LT_EQ",
+    ">=": "GT_EQ",
+}
+OPERATORS_1 = {"^": "CARET", "&": "AMPERSAND", "|": "BAR", ":": "COLON", "<": "LT", ">": "GT"}
+
+
+class Scanner:
+    """Hand-written replacement of the PLY lexer of this module
+
+    Has the interface of a PLY lexer used by the parser and set_input. While
+    buffer is set (see scan()), the tokens are appended to it instead of being
+    returned: token() then returns True until the end of the input.
+    """
+
+    def __init__(self):
+        self.lexdata = ""
+        self.lexpos = 0
+        self.lexlen = 0
+        self.lineno = 1
+        self.line_start = 0  # position of the first character of the line
+        self.insert_semi = False
+        self.buffer = None
+
+    def input(self, data: str):
+        self.lexdata = data
+        self.lexpos = 0
+        self.lexlen = len(data)
+        self.line_start = 0
+
+    def begin(self, state: str):
+        self.insert_semi = state == "InsertSemi"
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        tok = self.token()
+        if tok is None:
+            raise StopIteration
+        return tok
+
+    def make_token(self, type_: str, value, pos: int, end: int):
+        self.lexpos = end
+        if self.buffer is not None:
+            self.buffer.append(type_, value, pos, self.lineno)
+            return True
+
+        return self.error_token(type_, value, pos)
+
+    def error_token(self, type_: str, value, pos: int) -> lex.LexToken:
+        """Token at pos, also used for the error reports (never buffered)"""
+        tok = lex.LexToken()
+        tok.type = type_
+        tok.value = value
+        tok.lineno = self.lineno
+        tok.lexpos = pos
+        return tok
+
+    def token(self):
+        data = self.lexdata
+        length = self.lexlen
+        pos = self.lexpos
+
+        while pos < length:
+            c = data[pos]
+
+            # ignored in both states
+            if c == " " or c == "\t":
+                pos += 1
+                continue
+            if c == "/" and pos + 1 < length:
+                nxt = data[pos + 1]
+                if nxt == "/":
+                    pos = data.find("\n", pos, length)
+                    if pos < 0:
+                        pos = length
+                    continue
+                if nxt == "*":
+                    end = data.find("*/", pos + 2, length)
+                    if end < 0:
+                        tok = self.error_token("UNCLOSED_MULTI_COMMENT", data[pos:], pos)
+                        report_error_at("Unclosed Multiline comment", tok)
+                        pos = length
+                        continue
+                    end += 2
+                    newlines = data.count("\n", pos, end)
+                    if newlines:
+                        self.lineno += newlines
+                        self.line_start = data.rfind("\n", pos, end) + 1
+                    pos = end
+                    continue
+
+            if c == "\n":
+                if self.insert_semi:
+                    self.insert_semi = False
+                    self.lineno += 1
+                    self.line_start = pos + 1
+                    return self.make_token(";", ";", pos + 1, pos + 1)
+
+                end = pos + 1
+                while end < length and data[end] == "\n":
+                    end += 1
+                self.lineno += end - pos
+                self.line_start = end
+                pos = end
+                continue
+
+            self.insert_semi = False
+
+            if c in ASCII_LETTERS or c == "_":
+                if c == "t" and data.startswith("true", pos):
+                    end = pos + 4
+                    tok = self.make_token("BOOL_LIT", ("bool", "true"), pos, end)
+                elif c == "f" and data.startswith("false", pos):
+                    end = pos + 5
+                    tok = self.make_token("BOOL_LIT", ("bool", "false"), pos, end)
+                else:
+                    end = IDENTIFIER_RE.match(data, pos).end() if c != "_" else pos + 1
+                    name = data[pos:end]
+                    if name in keywords:
+                        tok = self.make_token(keywords[name], name, pos, end)
+                    elif name in types:
+                        tok = self.make_token(types[name][0], name, pos, end)
+                    elif self.buffer is not None:
+                        # the buffer finds the column again from the offset
+                        tok = self.make_token("IDENTIFIER", sys.intern(name), pos, end)
+                    else:
+                        value = ("identifier", sys.intern(name), pos - self.line_start + 1)
+                        tok = self.make_token("IDENTIFIER", value, pos, end)
+                self.insert_semi = True
+                return tok
+
+            if c == ")" or c == "]" or c == "}":
+                self.insert_semi = True
+                return self.make_token(c, c, pos, pos + 1)
+
+            if c.isdecimal() or c in ".+-":
+                if (c == "+" or c == "-") and data.startswith(c, pos + 1):
+                    self.insert_semi = True
+                    type_ = "INCREMENT" if c == "+" else "DECREMENT"
+                    return self.make_token(type_, c + c, pos, pos + 2)
+
+                m = FLOAT_LIT_RE.match(data, pos)
+                if m:
+                    self.insert_semi = True
+                    value = ("float64", float(m.group()))
+                    return self.make_token("FLOAT_LIT", value, pos, m.end())
+                if c.isdecimal():
+                    end = INT_LIT_RE.match(data, pos).end()
+                    self.insert_semi = True
+                    value = ("int", int(data[pos:end]))
+                    return self.make_token("INT_LIT", value, pos, end)
+                if data.startswith("...", pos):
+                    return self.make_token("ELLIPSIS", "...", pos, pos + 3)
+
+            if c == '"':
+                end = data.find('"', pos + 1, length) + 1
+                if end:
+                    text = data[pos:end]
+                    if "\n" in text:
+                        report_multiline_string(self.error_token("STRING_LIT", text, pos))
+                        self.lineno += text.count("\n")
+                        self.line_start = data.rfind("\n", pos, end) + 1
+                        pos = end
+                        continue
+
+                    self.insert_semi = True
+                    return self.make_token("STRING_LIT", ("string", text), pos, end)
+
+            op = data[pos : pos + 3]
+            if op in OPERATORS_3:
+                return self.make_token(OPERATORS_3[op], op, pos, pos + 3)
+            op = data[pos : pos + 2]
+            if op in OPERATORS_2:
+                return self.make_token(OPERATORS_2[op], op, pos, pos + 2)
+            if c in OPERATORS_1:
+                return self.make_token(OPERATORS_1[c], c, pos, pos + 1)
+            if c in literals:
+                return self.make_token(c, c, pos, pos + 1)
+
+            report_error_at(f"Illegal character {c}", self.error_token("error", data[pos:], pos))
+            pos += 1
+
+        self.lexpos = pos + 1
+        return None
+
+
+# Token buffer
+#
+# The tokens of a whole file in parallel arrays instead of a list of LexToken
+# objects (with a dict each, and a tuple for every identifier and literal):
+# 14 bytes a token plus one entry per distinct value. The parser reads the
+# tokens by index, LexToken objects are only built when it asks for them.
+
+TOKEN_KINDS = tokens + tuple(literals)
+KIND_CODES = {kind: code for code, kind in enumerate(TOKEN_KINDS)}
+IDENTIFIER_KIND = KIND_CODES["IDENTIFIER"]
+
+
+class Token(lex.LexToken):
+    """LexToken handed out by a TokenBuffer
+
+    One is built for every token the parser reads, slots make that cheaper.
+    """
+
+    __slots__ = ("type", "value", "lineno", "lexpos")
+
+
+class TokenBuffer:
+    """Tokens of a source file as a struct of arrays
+
+    For the token at index i, kinds[i] is the index of its type in
+    TOKEN_KINDS, offsets[i] and lines[i] its position and values[i] the index
+    of its value in table. The table holds every distinct value once: the
+    interned names of identifiers (their column is found again from the
+    offset), the text of keywords and operators and the tuples of literals.
+    The lexer errors are in reports, with the index of the token that
+    follows them.
+
+    Has the interface of a PLY lexer used by the parser: token() hands out the
+    tokens from next_index on. lexpos is the offset of the last token handed
+    out (PLY has its end there) and lineno its line, or the last line of the
+    source once all the tokens are out.
+    """
+
+    def __init__(self, source: SourceFile):
+        self.source = source
+        self.kinds = array("H")
+        self.offsets = array("I")
+        self.lines = array("I")
+        self.values = array("I")
+        self.table = []
+        self.table_index = {}
+        self.reports = []
+        self.end_lineno = 1
+        self.rewind()
+
+    def rewind(self, index: int = 0):
+        """Hand out the tokens (and make the reports) from index on"""
+        self.next_index = index
+        self.next_report = sum(1 for report in self.reports if report[0] < index)
+        self.lineno = self.lines[index - 1] if index else 1
+        self.lexpos = self.offsets[index - 1] if index else 0
+
+    def append(self, type_: str, value, pos: int, lineno: int):
+        """Add a token, the value of an identifier is its (interned) name"""
+        # literals are keyed by their text: 0.0 and -0.0 are equal floats
+        key = value if value.__class__ is str else (value[0], str(value[1]))
+        index = self.table_index.get(key)
+        if index is None:
+            index = self.table_index[key] = len(self.table)
+            self.table.append(value)
+
+        self.kinds.append(KIND_CODES[type_])
+        self.offsets.append(pos)
+        self.lines.append(lineno)
+        self.values.append(index)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, index: int) -> Token:
+        tok = Token()
+        kind = self.kinds[index]
+        tok.type = TOKEN_KINDS[kind]
+        tok.lineno = lineno = self.lines[index]
+        tok.lexpos = pos = self.offsets[index]
+        value = self.table[self.values[index]]
+        if kind == IDENTIFIER_KIND:
+            column = pos - self.source.line_starts[lineno - 1] + 1
+            value = ("identifier", value, column)
+        tok.value = value
+        return tok
+
+    def _make_reports(self, index: int):
+        """Make the reports of the tokens up to index"""
+        reports = self.reports
+        while self.next_report < len(reports) and reports[self.next_report][0] <= index:
+            _, report, args = reports[self.next_report]
+            self.next_report += 1
+            report(*args)
+
+    def token(self):
+        # called for every token the parser reads: the token is built here
+        # rather than by __getitem__, with no lookups it can do without
+        index = self.next_index
+        if self.next_report < len(self.reports):
+            self._make_reports(index)
+
+        if index >= len(self.kinds):
+            self.lineno = self.end_lineno
+            return None
+
+        self.next_index = index + 1
+        tok = Token()
+        kind = self.kinds[index]
+        tok.type = TOKEN_KINDS[kind]
+        self.lineno = tok.lineno = lineno = self.lines[index]
+        self.lexpos = tok.lexpos = pos = self.offsets[index]
+        value = self.table[self.values[index]]
+        if kind == IDENTIFIER_KIND:
+            value = ("identifier", value, pos - self.source.line_starts[lineno - 1] + 1)
+        tok.value = value
+        return tok
+
+    def nbytes(self) -> int:
+        """Bytes taken by the arrays (the table is not counted)"""
+        arrays = (self.kinds, self.offsets, self.lines, self.values)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+
+# Scan with the hand-written Scanner, set to False to use the PLY lexer built
+# from the rules above
+HAND_WRITTEN_SCANNER = True
+
+lexer = Scanner() if HAND_WRITTEN_SCANNER else lex.lex()
+
+
+def set_input(code: Union[str, SourceFile]):
+    """Give new source code (a str or a utils.SourceFile) to the lexer and
+    reset its state"""
+    if not isinstance(code, SourceFile):
+        code = SourceFile(code)
+
+    utils.source = code
+
+    lexer.input(code.text)
+    lexer.lineno = 1
+    lexer.begin("INITIAL")
+
+
+def scan(code: Union[str, SourceFile]) -> TokenBuffer:
+    """Lex the whole source code (a str or a utils.SourceFile) into a
+    TokenBuffer"""
+    set_input(code)
+    buffer = TokenBuffer(utils.source)
+    fill(buffer)
+
+    return buffer
+
+
+def scan_range(start: int, end: int, lineno: int, buffer: TokenBuffer) -> TokenBuffer:
+    """Lex the source given to set_input from offset start to offset end into
+    buffer (after the tokens already in it)
+
+    start is the first character of line lineno and end the first character
+    of a line (or the end of the source): the range is lexed as if the source
+    ended there.
+    """
+    if isinstance(lexer, Scanner):
+        lexer.lexlen = end
+        lexer.line_start = start
+    else:
+        # PLY matches its rules on lexdata, which has to end at end
+        lexer.input(utils.source.text[:end])
+    lexer.lexpos = start
+    lexer.lineno = lineno
+    lexer.begin("INITIAL")
+
+    fill(buffer)
+
+    return buffer
 
-# Build the lexer
-lexer = lex.lex()
 
-# Give input to the lexer
-lexer.input(input_code)
+def fill(buffer: TokenBuffer):
+    """Append the tokens up to the end of the input of the lexer to buffer"""
+    global scanning
+
+    scanning = buffer
+    try:
+        if isinstance(lexer, Scanner):
+            lexer.buffer = buffer
+            while lexer.token():
+                pass
+        else:
+            for tok in lexer:
+                value = tok.value[1] if tok.type == "IDENTIFIER" else tok.value
+                buffer.append(tok.type, value, tok.lexpos, tok.lineno)
+    finally:
+        scanning = None
+        if isinstance(lexer, Scanner):
+            lexer.buffer = None
+
+    buffer.end_lineno = lexer.lineno
 
-lines = input_code.split("\n")
-utils.lines = lines
 
 type_table = TypeTable()
 symtab = SymbolTable(type_table)
 
 if __name__ == "__main__":
+    set_input(SourceFile.read(sys.argv[1]))
+
     # Tokenize
     for tok in lexer:
         print(tok)
@@ -1,8 +1,5 @@
-import sys
-from typing import Tuple
-
-from pptree_mod import print_tree
-from colorama import Fore, Style
+import os
+from typing import Tuple, Union
 
 from ply import yacc
 
@@ -15,11 +12,10 @@ from go_lexer import (
     type_table,
 )
 import utils
-from utils import print_error, print_line, print_marker
+from utils import colors, print_error, print_line, print_marker
 import syntree
 from tac import intermediate_codegen
 from ico import optimize_ic
-from tree_vis import draw_AST
 
 
 # def eval_numeric_op(p1, p2=None, op=None):
@@ -35,6 +31,9 @@ from tree_vis import draw_AST
 
 ast = syntree.Node("start", children=[])
 
+# number of syntax errors reported since the last reset()
+syntax_errors = 0
+
 precedence = (
     # ('left', 'IDENTIFIER'),
     # ('left', 'INT', 'BOOL', 'FLOAT64'),
@@ -53,6 +52,27 @@ precedence = (
 )
 
 
+def prepend_flat(item, items):
+    """Add item in front of items, the List built so far by a right recursive
+    rule (so it is stored last element first)
+
+    If item is a List (a declaration or a block), its elements are added
+    instead, so the statements and declarations of a block end up in a
+    single flat List and no List is allocated just to wrap them.
+    """
+    if items is None:
+        if isinstance(item, syntree.List):
+            return item
+        return syntree.List([item])
+
+    if isinstance(item, syntree.List):
+        items.children.extend(item.children)
+    else:
+        items.append(item)
+
+    return items
+
+
 def p_SourceFile(p):
     """SourceFile : PackageClause ';' ImportDeclList TopLevelDeclList"""
     ast.data = p[1]
@@ -76,11 +96,7 @@ def p_ImportDeclList(p):
     | ImportDecl ';' ImportDeclList
     """
     if len(p) == 4:
-        if p[3] is not None:
-            p[3].append(p[1])
-            p[0] = p[3]
-        else:
-            p[0] = syntree.List([p[1]])
+        p[0] = prepend_flat(p[1], p[3])
 
 
 def p_ImportDecl(p):
@@ -88,7 +104,7 @@ def p_ImportDecl(p):
     | KW_IMPORT '(' ImportSpecList ')'
     """
     if len(p) == 3:
-        p[0] = syntree.List([p[2]])
+        p[0] = p[2]
     elif len(p) == 5:
         p[0] = p[3]
 
@@ -98,11 +114,7 @@ def p_ImportSpecList(p):
     | ImportSpec ';' ImportSpecList
     """
     if len(p) == 4:
-        if p[3] is not None:
-            p[3].append(p[1])
-            p[0] = p[3]
-        else:
-            p[0] = syntree.List([p[1]])
+        p[0] = prepend_flat(p[1], p[3])
 
 
 def p_ImportSpec(p):
@@ -126,11 +138,7 @@ def p_TopLevelDeclList(p):
     | TopLevelDecl ';' TopLevelDeclList
     """
     if len(p) == 4:
-        if p[3] is not None:
-            p[3].append(p[1])
-            p[0] = p[3]
-        else:
-            p[0] = syntree.List([p[1]])
+        p[0] = prepend_flat(p[1], p[3])
 
 
 def p_TopLevelDecl(p):
@@ -146,9 +154,22 @@ def p_FunctionDecl(p):
     | KW_FUNC FunctionName Signature FunctionBody
     """
     if len(p) == 4:
-        p[0] = syntree.Function(p[2], p[3], lineno=p.lineno(2))
+        p[0] = syntree.Function(
+            p[2],
+            p[3],
+            lineno=p.lineno(2),
+            scope_id=symtab.cur_scope,
+            body_scope_id=symtab.cur_scope,
+        )
     elif len(p) == 5:
-        p[0] = syntree.Function(p[2], p[3], body=p[4], lineno=p.lineno(2))
+        p[0] = syntree.Function(
+            p[2],
+            p[3],
+            body=p[4],
+            lineno=p.lineno(2),
+            scope_id=symtab.cur_scope,
+            body_scope_id=symtab.last_child_scope(),
+        )
     symtab.leave_scope()
 
 
@@ -188,7 +209,10 @@ def p_Parameters(p):
 def p_Result(p):
     """Result : Parameters
     | TypeName
-    | TypeLit
+    | ArrayType
+    | PointerType
+    | FunctionType
+    | SliceType
     """
     p[0] = p[1]
 
@@ -239,6 +263,7 @@ def p_Block(p):
 def p_new_scope(p):
     """new_scope :"""
     symtab.enter_scope()
+    p[0] = symtab.cur_scope
 
 
 def p_leave_scope(p):
@@ -251,11 +276,7 @@ def p_StatementList(p):
     | Statement ';' StatementList
     """
     if len(p) == 4:
-        if p[3] is not None:
-            p[3].append(p[1])
-            p[0] = p[3]
-        else:
-            p[0] = syntree.List([p[1]])
+        p[0] = prepend_flat(p[1], p[3])
 
 
 def p_Statement(p):
@@ -313,17 +334,33 @@ def p_IfStmt(p):
     | KW_IF new_scope SimpleStmt ';' Expression Block leave_scope KW_ELSE IfStmt
     | KW_IF new_scope SimpleStmt ';' Expression Block leave_scope KW_ELSE Block
     """
+    # the scopes were created by new_scope and the Blocks. An else Block is
+    # not inside the scope of the if, so it is the last scope created in the
+    # current one.
+    scopes = dict(scope_id=p[2], body_scope_id=symtab.last_child_scope(p[2]))
+    if len(p) in (8, 10) and not isinstance(p[len(p) - 1], syntree.IfStmt):
+        scopes["else_scope_id"] = symtab.last_child_scope()
+
     if len(p) == 5:
-        p[0] = syntree.IfStmt(body=p[4], expr=p[3], lineno=p.lineno(1))
+        p[0] = syntree.IfStmt(body=p[4], expr=p[3], lineno=p.lineno(1), **scopes)
         symtab.leave_scope()
     elif len(p) == 7:
-        p[0] = syntree.IfStmt(body=p[6], expr=p[5], statement=p[3], lineno=p.lineno(1))
+        p[0] = syntree.IfStmt(
+            body=p[6], expr=p[5], statement=p[3], lineno=p.lineno(1), **scopes
+        )
         symtab.leave_scope()
     elif len(p) == 8:
-        p[0] = syntree.IfStmt(body=p[4], expr=p[3], next_=p[7], lineno=p.lineno(1))
+        p[0] = syntree.IfStmt(
+            body=p[4], expr=p[3], next_=p[7], lineno=p.lineno(1), **scopes
+        )
     elif len(p) == 10:
         p[0] = syntree.IfStmt(
-            body=p[6], statement=p[3], expr=p[5], next_=p[9], lineno=p.lineno(1)
+            body=p[6],
+            statement=p[3],
+            expr=p[5],
+            next_=p[9],
+            lineno=p.lineno(1),
+            **scopes,
         )
 
 
@@ -333,12 +370,17 @@ def p_ForStmt(p):
     | KW_FOR new_scope ForClause Block leave_scope
     | KW_FOR new_scope RangeClause Block leave_scope
     """
+    scopes = dict(scope_id=p[2], body_scope_id=symtab.last_child_scope(p[2]))
+
     if len(p) == 5:
         p[0] = syntree.ForStmt(
-            body=p[3], clause=syntree.Literal("bool", "true"), lineno=p.lineno(1)
+            body=p[3],
+            clause=syntree.Literal("bool", "true"),
+            lineno=p.lineno(1),
+            **scopes,
         )
     elif len(p) == 6:
-        p[0] = syntree.ForStmt(body=p[4], clause=p[3], lineno=p.lineno(1))
+        p[0] = syntree.ForStmt(body=p[4], clause=p[3], lineno=p.lineno(1), **scopes)
 
 
 def p_Condition(p):
@@ -432,7 +474,9 @@ def p_ShortVarDecl(p):
     for ident in ident_list:
         ident.add_symtab()
     expr_list = p[3]
-    p[0] = syntree.make_variable_decls(ident_list, expression_list=expr_list)
+    p[0] = syntree.make_variable_decls(
+        ident_list, expression_list=expr_list, reuse_identifier_list=True
+    )
 
 
 def p_Declaration(p):
@@ -448,7 +492,7 @@ def p_VarDecl(p):
     | KW_VAR '(' VarSpecList ')'
     """
     if len(p) == 3:
-        p[0] = syntree.List([p[2]])
+        p[0] = p[2]
     elif len(p) == 5:
         p[0] = p[3]
 
@@ -458,11 +502,7 @@ def p_VarSpecList(p):
     | VarSpec ';' VarSpecList
     """
     if len(p) == 4:
-        if p[3] is not None:
-            p[3].append(p[1])
-            p[0] = p[3]
-        else:
-            p[0] = syntree.List([p[1]])
+        p[0] = prepend_flat(p[1], p[3])
 
 
 def p_VarSpec(p):
@@ -474,11 +514,15 @@ def p_VarSpec(p):
         ident.add_symtab()
 
     if len(p) == 3:
-        p[0] = syntree.make_variable_decls(p[1], p[2])
+        p[0] = syntree.make_variable_decls(p[1], p[2], reuse_identifier_list=True)
     elif len(p) == 4:
-        p[0] = syntree.make_variable_decls(p[1], expression_list=p[3])
+        p[0] = syntree.make_variable_decls(
+            p[1], expression_list=p[3], reuse_identifier_list=True
+        )
     elif len(p) == 5:
-        p[0] = syntree.make_variable_decls(p[1], p[2], p[4])
+        p[0] = syntree.make_variable_decls(
+            p[1], p[2], p[4], reuse_identifier_list=True
+        )
 
 
 def p_ConstDecl(p):
@@ -486,7 +530,7 @@ def p_ConstDecl(p):
     | KW_CONST '(' ConstSpecList ')'
     """
     if len(p) == 3:
-        p[0] = syntree.List([p[2]])
+        p[0] = p[2]
     elif len(p) == 5:
         p[0] = p[3]
 
@@ -496,11 +540,7 @@ def p_ConstSpecList(p):
     | ConstSpec ';' ConstSpecList
     """
     if len(p) == 4:
-        if p[3] is not None:
-            p[3].append(p[1])
-            p[0] = p[3]
-        else:
-            p[0] = syntree.List([p[1]])
+        p[0] = prepend_flat(p[1], p[3])
 
 
 def p_ConstSpec(p):
@@ -512,11 +552,17 @@ def p_ConstSpec(p):
         ident.add_symtab()
 
     if len(p) == 2:
-        p[0] = syntree.make_variable_decls(p[1], const=True)
+        p[0] = syntree.make_variable_decls(
+            p[1], const=True, reuse_identifier_list=True
+        )
     elif len(p) == 4:
-        p[0] = syntree.make_variable_decls(p[1], expression_list=p[3], const=True)
+        p[0] = syntree.make_variable_decls(
+            p[1], expression_list=p[3], const=True, reuse_identifier_list=True
+        )
     elif len(p) == 5:
-        p[0] = syntree.make_variable_decls(p[1], p[2], p[4], const=True)
+        p[0] = syntree.make_variable_decls(
+            p[1], p[2], p[4], const=True, reuse_identifier_list=True
+        )
 
 
 def p_TypeDecl(p):
@@ -524,7 +570,7 @@ def p_TypeDecl(p):
     | KW_TYPE '(' TypeSpecList ')'
     """
     if len(p) == 3:
-        p[0] = syntree.List([p[2]])
+        p[0] = p[2]
     elif len(p) == 5:
         p[0] = p[3]
 
@@ -534,11 +580,7 @@ def p_TypeSpecList(p):
     | TypeSpec ';' TypeSpecList
     """
     if len(p) == 4:
-        if p[3] is not None:
-            p[3].append(p[1])
-            p[0] = p[3]
-        else:
-            p[0] = syntree.List([p[1]])
+        p[0] = prepend_flat(p[1], p[3])
 
 
 def p_TypeSpec(p):
@@ -581,7 +623,8 @@ def p_ExpressionList(p):
 
 
 def p_Expression(p):
-    """Expression : UnaryExpr
+    """Expression : PrimaryExpr
+    | UnaryOp Expression %prec UNARY
     | Expression '+' Expression
     | Expression '-' Expression
     | Expression '*' Expression
@@ -600,22 +643,14 @@ def p_Expression(p):
     # TODO : Add Logical Operators
     # TODO : Add other binary operators
 
+    # unary expressions are not a rule of their own, the UNARY precedence
+    # makes them bind tighter than binary ones. This saves a reduction for
+    # every operand.
     if len(p) == 4:
         p[0] = syntree.BinOp(p[2], left=p[1], right=p[3], lineno=p.lineno(2))
-    else:
-        p[0] = p[1]
-
-
-def p_UnaryExpr(p):
-    """UnaryExpr : PrimaryExpr
-    | UnaryOp UnaryExpr
-    """
-    if len(p) == 3:
+    elif len(p) == 3:
         p[0] = syntree.UnaryOp(p[1], p[2])
     else:
-        # TODO : handle more stuff in PrimaryExpr
-        # also change the PrimaryExpr class in syntree when doing so
-        # p[0] = syntree.UnaryOp(None, p[1])
         p[0] = p[1]
 
 
@@ -628,18 +663,40 @@ def p_UnaryOp(p):
     p[0] = p[1]
 
 
+# token types of basic literals, their values are (type, value)
+BASIC_LIT_TOKENS = {"INT_LIT", "FLOAT_LIT", "STRING_LIT", "BOOL_LIT"}
+
+
 def p_PrimaryExpr(p):
-    """PrimaryExpr : Operand
+    """PrimaryExpr : IDENTIFIER %prec '='
+    | QualifiedIdent
+    | INT_LIT
+    | FLOAT_LIT
+    | STRING_LIT
+    | BOOL_LIT
+    | FunctionLit
+    | CompositeLit
+    | '(' Expression ')'
     | PrimaryExpr Arguments
     | PrimaryExpr Index
     """
     # TODO : This is too less! Many more to add
+    # TODO : Add other basic literals
+
+    # operands (names, literals and parenthesized expressions) are
+    # alternatives of this rule rather than rules of their own, so an
+    # operand takes a single reduction to become a PrimaryExpr
     if len(p) == 2:
-        if isinstance(p[1], syntree.Node):
-            # p[0] = syntree.PrimaryExpr(operand=None, children=[p[1]])
-            p[0] = p[1]
-        else:
+        token_type = p.slice[1].type
+        if token_type == "IDENTIFIER":
+            use_identifier(p[1], p.lineno(1))
             p[0] = syntree.PrimaryExpr(operand=p[1])
+        elif token_type in BASIC_LIT_TOKENS:
+            p[0] = syntree.Literal(p[1][0], p[1][1])
+        else:
+            p[0] = p[1]
+    elif len(p) == 4:
+        p[0] = p[2]
     elif len(p) == 3:
         if isinstance(p[2], syntree.Arguments):
             p[0] = syntree.FunctionCall(p[1], p[2])
@@ -647,6 +704,22 @@ def p_PrimaryExpr(p):
             p[0] = syntree.PrimaryExpr(operand=None, children=[p[1], p[2]])
 
 
+def use_identifier(ident: Tuple, lineno: int):
+    """Record a use of the identifier in an expression, or report it if it is
+    not declared"""
+    sym = symtab.get_symbol(ident[1])
+    if not symtab.is_declared(ident[1]):
+        print_error()
+        print(f"Undeclared symbol '{ident[1]}' at line {lineno}")
+        print_line(lineno)
+        # TODO: get correct position of token rather than searching
+        pos = ident[2] - 1
+        width = len(ident[1])
+        print_marker(pos, width)
+    else:
+        sym.uses.append(lineno)
+
+
 def p_Arguments(p):
     """Arguments : '(' ')'
     | '(' ExpressionList ')'
@@ -662,53 +735,11 @@ def p_Index(p):
     p[0] = syntree.Index(p[2])
 
 
-def p_Operand(p):
-    """Operand : OperandName
-    | Literal
-    | '(' Expression ')'
-    """
-    if len(p) == 2:
-        p[0] = p[1]
-    elif len(p) == 4:
-        p[0] = p[2]
-
-
-def p_OperandName(p):
-    """OperandName : IDENTIFIER %prec '='
-    | QualifiedIdent
-    """
-    if not isinstance(p[1], syntree.QualifiedIdent):
-        ident: Tuple = p[1]
-        sym = symtab.get_symbol(ident[1])
-        lineno = p.lineno(1)
-        if not symtab.is_declared(ident[1]):
-            print_error()
-            print(f"Undeclared symbol '{ident[1]}' at line {lineno}")
-            print_line(lineno)
-            line: str = utils.lines[lineno - 1]
-            # TODO: get correct position of token rather than searching
-            pos = ident[2] - 1
-            width = len(ident[1])
-            print_marker(pos, width)
-        else:
-            sym.uses.append(lineno)
-
-    p[0] = p[1]
-
-
 def p_QualifiedIdent(p):
     """QualifiedIdent : PackageName '.' IDENTIFIER"""
     p[0] = syntree.QualifiedIdent(p[1], p[3])
 
 
-def p_Literal(p):
-    """Literal : BasicLit
-    | FunctionLit
-    | CompositeLit"""
-    # TODO : Add FunctionLit
-    p[0] = p[1]
-
-
 def p_CompositeLit(p):
     """CompositeLit : LiteralType LiteralValue"""
     p[0] = syntree.Literal(type_=p[1], value=p[2])
@@ -716,7 +747,7 @@ def p_CompositeLit(p):
 
 def p_LiteralType(p):
     """LiteralType : ArrayType
-    | '[' '.' '.' '.' ']' ElementType
+    | '[' '.' '.' '.' ']' Type
     | TypeName
     | SliceType
     """
@@ -729,7 +760,7 @@ def p_LiteralType(p):
 
 
 def p_LiteralValue(p):
-    """LiteralValue : '{' ElementList '}'"""
+    """LiteralValue : '{' KeyedElementList '}'"""
     if len(p) == 3:
         p[0] = None
     elif len(p) == 4:
@@ -740,19 +771,11 @@ def p_LiteralValue(p):
         raise Exception("Bad grammar or rules!")
 
 
-def p_ElementList(p):
-    """ElementList : KeyedElementList"""
-    if len(p) == 2:
-        p[0] = p[1]
-    else:
-        # p[0] = syntree.List([p[1], *p[2]])
-        raise Exception("Invalid semantic rules here!")
-
-
 def p_KeyedElementList(p):
-    """KeyedElementList : KeyedElement
-    | KeyedElement ',' KeyedElementList
+    """KeyedElementList : Element
+    | Element ',' KeyedElementList
     """
+    # TODO: add `Key ':' Element`
     if len(p) == 2:
         p[0] = syntree.List([p[1]])
     elif len(p) == 4:
@@ -762,18 +785,6 @@ def p_KeyedElementList(p):
         raise Exception("Bad grammar or rules!")
 
 
-def p_KeyedElement(p):
-    """KeyedElement : Element"""
-    # TODO: add `Key ':' Element`
-    if len(p) == 2:
-        p[0] = p[1]
-    elif len(p) == 4:
-        raise Exception("Bad grammar or rules!")
-        # p[0] = (p[1], p[3])
-    else:
-        raise Exception("Bad grammar or rules!")
-
-
 # def p_Key(p):
 #     """Key : FieldName
 #     | Expression
@@ -795,63 +806,27 @@ def p_Element(p):
     p[0] = p[1]
 
 
-def p_BasicLit(p):
-    """BasicLit : int_lit
-    | float_lit
-    | string_lit
-    | bool_lit
-    """
-    # TODO : Add other basic literals
-    p[0] = syntree.Literal(p[1][0], p[1][1])
-
-
 def p_FunctionLit(p):
     """FunctionLit : KW_FUNC Signature FunctionBody"""
-    p[0] = syntree.Function(None, p[2], p[3])
-
-
-def p_int_lit(p):
-    """int_lit : INT_LIT"""
-
-    # TODO :
-    # '''int_lit : decimal_lit
-    #            | binary_lit
-    #            | octal_lit
-    #            | hex_lit
-    # '''
-    p[0] = p[1]
-
-
-def p_float_lit(p):
-    """float_lit : FLOAT_LIT"""
-
-    # TODO :
-    # '''float_lit : decimal_float_lit
-    #              | hex_float_lit
-    # '''
-    p[0] = p[1]
-
-
-def p_string_lit(p):
-    """string_lit : STRING_LIT"""
-
-    # TODO :
-    # '''string_lit : raw_string_lit
-    #               | interpreted_string_lit
-    # '''
-    p[0] = p[1]
-
-
-def p_bool_lit(p):
-    """bool_lit : BOOL_LIT"""
-    p[0] = p[1]
+    p[0] = syntree.Function(
+        None,
+        p[2],
+        lineno=p.lineno(1),
+        body=p[3],
+        body_scope_id=symtab.last_child_scope(),
+    )
 
 
 def p_Type(p):
     """Type : TypeName
-    | TypeLit
+    | ArrayType
+    | PointerType
+    | FunctionType
+    | SliceType
     | '(' Type ')'
     """
+    # TODO : Add other type literals
+    # TODO : add StructType
     if len(p) == 2:
         p[0] = p[1]
     elif len(p) == 4:
@@ -859,16 +834,7 @@ def p_Type(p):
 
 
 def p_TypeName(p):
-    """TypeName : BasicType"""
-    # TODO: QualifiedIdent here gives R/R conflict
-    if isinstance(p[1], tuple) and p[1][0] == "identifier":
-        p[0] = p[1][1]
-    else:
-        p[0] = p[1]
-
-
-def p_BasicType(p):
-    """BasicType : INT
+    """TypeName : INT
     | INT8
     | INT16
     | INT32
@@ -887,37 +853,17 @@ def p_BasicType(p):
     | BOOL
     | RUNE
     """
+    # TODO: QualifiedIdent here gives R/R conflict
     p[0] = syntree.Type(name="BasicType", children=[], data=p[1])
 
 
-def p_TypeLit(p):
-    """TypeLit : ArrayType
-    | PointerType
-    | FunctionType
-    | SliceType
-    """
-    # TODO : Add other type literals
-    # TODO : add StructType
-    p[0] = p[1]
-
-
 def p_ArrayType(p):
-    """ArrayType : '[' ArrayLength ']' ElementType"""
+    """ArrayType : '[' Expression ']' Type"""
     p[0] = syntree.Array(p[4], p[2])
 
 
-def p_ArrayLength(p):
-    """ArrayLength : Expression"""
-    p[0] = p[1]
-
-
-def p_ElementType(p):
-    """ElementType : Type"""
-    p[0] = p[1]
-
-
 def p_SliceType(p):
-    """SliceType : '[' ']' ElementType"""
+    """SliceType : '[' ']' Type"""
     p[0] = syntree.Slice(p[3])
 
 
@@ -984,6 +930,10 @@ def p_empty(p):
 
 
 def p_error(p: lex.LexToken):
+    global syntax_errors
+    syntax_errors += 1
+
+    Fore, Style = colors()
     print(f"{Fore.RED}SYNTAX ERROR:{Style.RESET_ALL}")
     if p is not None:
         col = find_column(p)
@@ -995,54 +945,122 @@ def p_error(p: lex.LexToken):
         print("Unexpected end of file")
 
 
-parser = yacc.yacc(debug=True)
+# LALR tables are cached here and only rebuilt when the grammar changes
+PARSETAB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parsetab.pickle")
+
+# Parse on the packed LR tables (row displacement, integer token codes), set
+# to False to get the dict tables of PLY and its parse debugging
+PACKED_TABLES = True
+
+parser = yacc.yacc(debug=True, tabfile=PARSETAB_FILE, packed=PACKED_TABLES)
+
+# Parse the tokens as the lexer scans them, set to True to lex the whole file
+# into a TokenBuffer first (less memory per token, but the parser builds every
+# token again as it reads it, which makes lexing and parsing slower)
+TOKEN_BUFFER = False
+
+
+def reset():
+    """Reset the AST and the symbol and type tables before parsing a new file"""
+    global ast, syntax_errors
+
+    ast = syntree.Node("start", children=[])
+    syntax_errors = 0
+    syntree.declarations.clear()
+    symtab.reset()
+    type_table.reset()
+    utils.package_name = None
+
+
+def parse(input_code: Union[str, utils.SourceFile]) -> syntree.Node:
+    """Parse the given source code and return the (unprocessed) AST
+
+    Global state is not reset, call reset() before parsing another file.
+    """
+    if TOKEN_BUFFER:
+        parser.parse(lexer=go_lexer.scan(input_code), tracking=True)
+    else:
+        go_lexer.set_input(input_code)
+        parser.parse(lexer=go_lexer.lexer, tracking=True)
+
+    return ast
 
 
 if __name__ == "__main__":
-    with open(sys.argv[1], "rt") as f:
-        input_code = f.read()
-        if input_code[len(input_code) - 1] != "\n":
-            input_code += "\n"
-        go_lexer.input_code = input_code
-        lines = input_code.split("\n")
-        go_lexer.lines = lines
-        utils.lines = lines
-        result = parser.parse(input_code, tracking=True, debug=False)
-        # print(result)
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Compile a Go file")
+    arg_parser.add_argument("file")
+    arg_parser.add_argument(
+        "--ast-dot", action="store_true", help="write the AST to ast.dot"
+    )
+    arg_parser.add_argument(
+        "--ast-png",
+        action="store_true",
+        help="write the AST to ast.dot and render it to ast.png with Graphviz",
+    )
+    arg_parser.add_argument(
+        "--ast-function",
+        metavar="NAME",
+        help="only draw the AST of the function NAME",
+    )
+    arg_parser.add_argument(
+        "--ast-text",
+        action="store_true",
+        help="write the AST as text to syntax_tree.txt",
+    )
+    arg_parser.add_argument(
+        "--ast-max-nodes",
+        metavar="N",
+        type=int,
+        help="draw at most N nodes, deeper subtrees are collapsed",
+    )
+    args = arg_parser.parse_args()
+
+    parse(utils.SourceFile.read(args.file))
+
+    ast = syntree.postprocess_AST(ast)
+
+    if args.ast_dot or args.ast_png:
+        from tree_vis import draw_AST
+
+        draw_AST(
+            ast,
+            png=args.ast_png,
+            function=args.ast_function,
+            max_nodes=args.ast_max_nodes,
+        )
 
-        ast = syntree.postprocess_AST(ast)
-        draw_AST(ast)
+    if args.ast_text:
+        from pptree_mod import print_tree
 
-        # with open("syntax_tree.txt", "wt", encoding="utf-8") as ast_file:
-        #     sys.stdout = ast_file
-        #     print_tree(ast, nameattr=None, horizontal=True)
-        #     sys.stdout = sys.__stdout__
+        with open("syntax_tree.txt", "wt", encoding="utf-8") as ast_file:
+            print_tree(ast, nameattr=None, horizontal=True, file=ast_file)
 
-        symtab.check_unused()
+    symtab.check_unused()
 
-        print("Finished Parsing!")
-        print("Symbol Table: ")
-        print(symtab)
-        with open("symbol_table.txt", "wt", encoding="utf-8") as symtab_file:
-            print(symtab, file=symtab_file)
+    print("Finished Parsing!")
+    print("Symbol Table: ")
+    print(symtab)
+    with open("symbol_table.txt", "wt", encoding="utf-8") as symtab_file:
+        print(symtab, file=symtab_file)
 
-        print("Type Table: ")
-        print(type_table)
+    print("Type Table: ")
+    print(type_table)
 
-        symtab.reset_depth()
-        # Intermediate Code gen
-        ic = intermediate_codegen(ast)
+    # Intermediate Code gen
+    ic = intermediate_codegen(ast)
 
-        print("Intermediate code:")
-        print(ic)
-        ic.print_three_address_code()
+    print("Intermediate code:")
+    print(ic)
+    ic.print_three_address_code()
 
-        print(symtab)
+    print(symtab)
 
-        ico = optimize_ic(ic)
+    ico = optimize_ic(ic)
 
-        # print("Optimized intermediate code:")
-        # print(ico)
-        ico.print_three_address_code()
+    # print("Optimized intermediate code:")
+    # print(ico)
+    ico.print_three_address_code()
 
-        print(symtab)
+    print(symtab)
@@ -1,5 +1,6 @@
 from math import log2, floor, ceil
 
+from go_lexer import type_table
 from tac import IntermediateCode, Label, Quad, Assign, Operand, TempVar, ActualVar
 from syntree import Literal
 
@@ -33,11 +34,9 @@ def binary_eval(q: Quad):
         elif operator == "*":
             dest.value = op1.value * op2.value
         elif operator == "/":
-            ints = {"int", "int8", "int16", "int32", "int64"}
-            floats = {"float32", "float64"}
-            if dest.type_ in ints:
+            if dest.type_ in type_table.integer_types:
                 dest.value = op1.value // op2.value
-            elif dest.type_ in floats:
+            elif dest.type_ in type_table.float_types:
                 dest.value = op1.value / op2.value
             else:
                 # raise NotImplementedError(
@@ -258,7 +257,7 @@ def pack_temps(ic):
 def remove_deadcode(ic):
     ico1 = IntermediateCode()
 
-    curr_scope = "0"
+    curr_scope = None
     discard = False
     for q in ic.code_list:
         if discard:
@@ -0,0 +1,608 @@
+"""Incremental front end
+
+Parses the new version of a file after an edit by reusing the top-level
+declarations that did not change.
+
+The source is cut into chunks at the lines that start a top-level declaration
+(a line beginning with func, var, const, type or import, as gofmt lays them
+out). Every chunk is lexed and parsed on its own, after the tokens of the
+package clause, and then type checked, and its effects are recorded: its
+subtrees, the scopes, symbols and types it created, the names of the package
+scope and the types it looked up, and the uses it added to the symbols of the
+other chunks. When a new version of the file is parsed, a chunk whose text did
+not change and whose lookups find the same symbols and types is not parsed
+again: what it recorded is put back, moved to its new lines, scopes and symbol
+ids.
+
+Only chunks that printed nothing are kept, and a file with a lexer or syntax
+error is parsed in full, as error recovery can span several declarations. Code
+generation and the optimizer still run on the whole file.
+
+Usage:
+
+    session = IncrementalSession()
+    session.compile(source)
+    session.compile(edited_source)  # parses the edited declarations only
+"""
+import contextlib
+import io
+import re
+import sys
+from typing import Dict, List, Union
+
+import go_lexer
+import go_parser
+import syntree
+import utils
+from compiler import CompilerSession
+from go_lexer import symtab, type_table, TokenBuffer
+from symbol_table import ROOT_SCOPE, SymbolInfo
+from utils import SourceFile
+
+# a line starting a top-level declaration
+TOP_LEVEL_RE = re.compile(r"^(?:func|var|const|type|import)\b", re.MULTILINE)
+
+# tokens of the package clause, the text before the first chunk
+HEADER_KINDS = ["KW_PACKAGE", "IDENTIFIER", ";"]
+
+# nodes whose children are removed by the code generator
+CONSUMED_BY_CODEGEN = (syntree.VarDecl, syntree.IfStmt, syntree.ForStmt, syntree.ForClause)
+
+# the value looked up for a key that was not in a table
+MISSING = object()
+
+
+class FullParse(Exception):
+    """The file has to be parsed in full"""
+
+
+class Retry(Exception):
+    """Reused chunks were dropped from the cache, the file has to be parsed
+    again"""
+
+
+class RecordingDict(dict):
+    """Dict remembering the value every key had when it was first accessed
+
+    Records in before (and the keys set, in order, in written) while before
+    is not None. The table is read and written through the methods of dict
+    itself when nothing has to be recorded.
+    """
+
+    __slots__ = ("before", "written")
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.before = None
+        self.written = []
+
+    def record(self, key):
+        before = self.before
+        if before is not None and key not in before:
+            before[key] = dict.get(self, key, MISSING)
+
+    def record_write(self, key):
+        self.record(key)
+        if self.before is not None:
+            self.written.append(key)
+
+    def __contains__(self, key):
+        self.record(key)
+        return dict.__contains__(self, key)
+
+    def __getitem__(self, key):
+        self.record(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        self.record(key)
+        return dict.get(self, key, default)
+
+    def __setitem__(self, key, value):
+        self.record_write(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.record_write(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        self.record_write(key)
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        self.record_write(key)
+        return dict.setdefault(self, key, default)
+
+
+class ScopeDict(RecordingDict):
+    """RecordingDict for the package scope, which also takes a snapshot of the
+    symbols it hands out, to find what a chunk changed in them"""
+
+    __slots__ = ("states",)
+
+    def record(self, key):
+        before = self.before
+        if before is not None and key not in before:
+            value = before[key] = dict.get(self, key, MISSING)
+            if value is not MISSING:
+                self.states[key] = symbol_state(value)
+
+
+def symbol_state(sym: SymbolInfo) -> tuple:
+    """The fields of sym that parsing, type checking and code generation
+    change"""
+    return (
+        sym.lineno,
+        sym.col_num,
+        sym.type_,
+        sym.const,
+        sym.const_flag,
+        sym.value,
+        tuple(sym.uses),
+    )
+
+
+def restore_symbol(sym: SymbolInfo, state: tuple):
+    (
+        sym.lineno,
+        sym.col_num,
+        sym.type_,
+        sym.const,
+        sym.const_flag,
+        sym.value,
+        uses,
+    ) = state
+    sym.uses = list(uses)
+
+
+def move_state(state: tuple, delta: int) -> tuple:
+    lineno = state[0]
+    uses = tuple(line + delta for line in state[6])
+    return (None if lineno is None else lineno + delta,) + state[1:6] + (uses,)
+
+
+def unchanged(tables: tuple, lookups: tuple) -> bool:
+    """Whether every key looked up still has the same value in tables"""
+    for table, before in zip(tables, lookups):
+        for key, value in before.items():
+            if dict.get(table, key, MISSING) is not value:
+                return False
+    return True
+
+
+_slots = {}
+
+
+def node_slots(cls) -> tuple:
+    """All the slots of a Node class"""
+    slots = _slots.get(cls)
+    if slots is None:
+        slots = _slots[cls] = tuple(
+            slot for klass in cls.__mro__ for slot in getattr(klass, "__slots__", ())
+        )
+    return slots
+
+
+class Chunk:
+    """A top-level declaration (or import) and what parsing and type checking
+    it did
+
+    The objects it created are kept and put back in the tables when the chunk
+    is reused. lineno is the line the chunk started on and first_scope its
+    first scope the last time it was parsed or reused: the line numbers and
+    the scope ids held by its nodes and symbols are moved from there.
+    """
+
+    def __init__(self, text: str, kind: str, lineno: int):
+        self.text = text
+        self.kind = kind
+        self.lineno = lineno
+        self.cacheable = True
+        # the List elements, in the order of the List (last first)
+        self.items = []
+
+        self.first_scope = 0
+        # (parent, child number, symbols) of every scope created, the parent
+        # relative to first_scope (or -1 for the package scope, the child
+        # number then relative to the scopes it had before the chunk)
+        self.scopes = []
+        self.symbols: List[SymbolInfo] = []
+        self.types = []
+
+        # lookups in (package scope, type_map, composite_types), for the
+        # parse and the type checking
+        self.parse_lookups = ()
+        self.check_lookups = ()
+        # the changes made to the three tables while parsing, in the order the
+        # keys were set (the order of the types in the type table)
+        self.writes = ()
+        # (symbol, lines) of the uses added to the symbols of other chunks
+        self.foreign_uses = []
+        # the states of the symbols after parsing and after type checking
+        self.parse_states = []
+        self.check_states = []
+
+        # (node, slot) holding a line, nodes with a line in data[1] and
+        # (node, slot) holding a scope id
+        self.line_slots = []
+        self.line_data = []
+        self.scope_slots = []
+        # (node, children) of the nodes changed by the code generator
+        self.children = []
+
+    def move(self, lineno: int):
+        """Move the lines of the chunk so that it starts on lineno"""
+        delta = lineno - self.lineno
+        if not delta:
+            return
+
+        for node, slot in self.line_slots:
+            setattr(node, slot, getattr(node, slot) + delta)
+        for node in self.line_data:
+            data = node.data
+            node.data = (data[0], data[1] + delta) + data[2:]
+        for type_ in self.types:
+            if type_.lineno is not None:
+                type_.lineno += delta
+        self.parse_states = [move_state(state, delta) for state in self.parse_states]
+        self.check_states = [move_state(state, delta) for state in self.check_states]
+        self.foreign_uses = [
+            (sym, [line + delta for line in lines]) for sym, lines in self.foreign_uses
+        ]
+        self.lineno = lineno
+
+    def install(self, tables: tuple):
+        """Put the scopes, symbols and types of the chunk back in the tables,
+        as parsing it again would"""
+        first_scope = len(symtab.scope_parent)
+        root_children = len(symtab.scope_children[ROOT_SCOPE])
+        for parent, n, symbols in self.scopes:
+            scope = len(symtab.scope_parent)
+            if parent < 0:
+                parent = ROOT_SCOPE
+                n += root_children
+            else:
+                parent += first_scope
+            symtab.scope_parent.append(parent)
+            symtab.scope_children.append([])
+            symtab.scope_children[parent].append(scope)
+            symtab.scope_names.append(f"{symtab.scope_names[parent]}.{n + 1}")
+            symtab.scope_symbols.append(dict(symbols))
+
+        delta = first_scope - self.first_scope
+        if delta:
+            old_first = self.first_scope
+            for node, slot in self.scope_slots:
+                scope = getattr(node, slot)
+                if scope >= old_first:
+                    setattr(node, slot, scope + delta)
+            for sym in self.symbols:
+                if sym.scope_id >= old_first:
+                    sym.scope_id += delta
+            self.first_scope = first_scope
+
+        for sym, state in zip(self.symbols, self.parse_states):
+            restore_symbol(sym, state)
+            sym.uid = symtab.next_uid
+            symtab.next_uid += 1
+            symtab.symbols[sym.uid] = sym
+
+        for type_ in self.types:
+            type_.id = len(type_table.types)
+            type_table.types.append(type_)
+
+        for table, writes in zip(tables, self.writes):
+            for key, value in writes.items():
+                if value is MISSING:
+                    dict.pop(table, key, None)
+                else:
+                    dict.__setitem__(table, key, value)
+
+        for sym, lines in self.foreign_uses:
+            sym.uses.extend(lines)
+
+        for node, children in self.children:
+            node.children[:] = children
+
+    def find_references(self):
+        """Find the lines, scope ids and children to restore in the subtrees
+        of the chunk (after type checking, which changes the tree)"""
+        line_slots = self.line_slots = []
+        line_data = self.line_data = []
+        scope_slots = self.scope_slots = []
+        children = self.children = []
+
+        seen = set()
+        stack = list(self.items)
+        while stack:
+            obj = stack.pop()
+            if obj.__class__ is tuple or obj.__class__ is list:
+                stack.extend(obj)
+                continue
+            if not isinstance(obj, syntree.Node) or id(obj) in seen:
+                continue
+            seen.add(id(obj))
+
+            for slot in node_slots(obj.__class__):
+                value = getattr(obj, slot, None)
+                if value.__class__ is int:
+                    if slot == "lineno":
+                        line_slots.append((obj, slot))
+                    elif slot.endswith("scope_id"):
+                        scope_slots.append((obj, slot))
+                elif slot == "data" and isinstance(obj, (syntree.Identifier, syntree.Function)):
+                    if value[1].__class__ is int:
+                        line_data.append(obj)
+                    stack.append(value)
+                elif isinstance(value, (syntree.Node, tuple, list)):
+                    stack.append(value)
+
+            if isinstance(obj, CONSUMED_BY_CODEGEN):
+                children.append((obj, list(obj.children)))
+
+
+class IncrementalSession(CompilerSession):
+    """CompilerSession that parses only the top-level declarations changed
+    since the previous call to parse
+
+    Meant for the successive versions of one file: the chunks of the last
+    version parsed are kept. parsed and reused are the numbers of chunks
+    parsed and reused by the last call to parse.
+    """
+
+    def __init__(self, cache=None):
+        super().__init__(cache)
+        self.chunks: Dict[str, List[Chunk]] = {}
+        self.parsed = 0
+        self.reused = 0
+
+    def parse(self, source: Union[str, SourceFile]) -> syntree.Node:
+        """Parse source and return the post-processed AST, reusing the chunks
+        of the previous version"""
+        if not isinstance(source, SourceFile):
+            source = SourceFile(source)
+
+        # the output is held back until the parse succeeds
+        output = io.StringIO()
+        while True:
+            try:
+                with contextlib.redirect_stdout(output):
+                    ast = self._parse_chunks(source)
+            except Retry:
+                output = io.StringIO()
+                continue
+            except FullParse:
+                break
+            sys.stdout.write(output.getvalue())
+            return ast
+
+        self.parsed = self.reused = 0
+        return super().parse(source)
+
+    def _parse_chunks(self, source: SourceFile) -> syntree.Node:
+        self.reset()
+        go_lexer.set_input(source)
+        text = source.text
+
+        starts = [m.start() for m in TOP_LEVEL_RE.finditer(text)]
+        if not starts:
+            raise FullParse
+        header_end = starts[0]
+        header = go_lexer.scan_range(0, header_end, 1, TokenBuffer(source))
+        if header.reports or [header[i].type for i in range(len(header))] != HEADER_KINDS:
+            raise FullParse
+        package = header[1].value[1]
+
+        root = ScopeDict()
+        symtab.scope_symbols[ROOT_SCOPE] = symtab.stack[0] = root
+        type_table.type_map = RecordingDict(type_table.type_map)
+        type_table.composite_types = RecordingDict(type_table.composite_types)
+        tables = (root, type_table.type_map, type_table.composite_types)
+
+        cached = {key: list(chunks) for key, chunks in self.chunks.items()}
+        chunks = []
+        parsed = []
+        reused = []
+        starts.append(len(text))
+        for start, end in zip(starts, starts[1:]):
+            chunk_text = text[start:end]
+            lineno = source.lineno(start)
+            candidates = cached.get(chunk_text)
+            if candidates and unchanged(tables, candidates[-1].parse_lookups):
+                chunk = candidates.pop()
+                chunk.move(lineno)
+                chunk.install(tables)
+                reused.append(chunk)
+            else:
+                chunk = self._parse_chunk(source, header_end, start, end, lineno, tables)
+                parsed.append(chunk)
+
+            if chunks and chunk.kind == "import" and chunks[-1].kind != "import":
+                raise FullParse
+            chunks.append(chunk)
+
+        # the type checks of the reused chunks look at the tables as they
+        # are once everything is parsed
+        stale = [chunk for chunk in reused if not unchanged(tables, chunk.check_lookups)]
+        if stale:
+            for chunk in stale:
+                self.chunks[chunk.text].remove(chunk)
+            raise Retry
+
+        parsed_ids = set(map(id, parsed))
+        for chunk in chunks:
+            if id(chunk) in parsed_ids:
+                self._check_chunk(chunk, tables)
+            else:
+                # the uses are left alone: type checking adds none, while
+                # the chunks after this one may have
+                for sym, state in zip(chunk.symbols, chunk.check_states):
+                    restore_symbol(sym, state[:6] + (sym.uses,))
+
+        symtab.scope_symbols[ROOT_SCOPE] = symtab.stack[0] = dict(root)
+        type_table.type_map = dict(type_table.type_map)
+        type_table.composite_types = dict(type_table.composite_types)
+
+        ast = go_parser.ast = syntree.Node("start", children=[], data=package)
+        utils.package_name = package
+        for kind in ("import", "decl"):
+            group = [chunk for chunk in chunks if chunk.kind == kind]
+            if group:
+                items = syntree.List([])
+                for chunk in reversed(group):
+                    items.children.extend(chunk.items)
+                ast.add_child(syntree.postprocess_subtree(items, shallow=True))
+        syntree.postprocess_subtree(ast, shallow=True)
+        syntree.check_declarations()
+
+        symtab.check_unused()
+
+        self.chunks = {}
+        for chunk in chunks:
+            if chunk.cacheable:
+                self.chunks.setdefault(chunk.text, []).append(chunk)
+        self.parsed = len(parsed)
+        self.reused = len(reused)
+
+        return ast
+
+    def _parse_chunk(
+        self,
+        source: SourceFile,
+        header_end: int,
+        start: int,
+        end: int,
+        lineno: int,
+        tables: tuple,
+    ) -> Chunk:
+        """Parse the chunk of source from start to end, after the package
+        clause"""
+        tokens = go_lexer.scan_range(0, header_end, 1, TokenBuffer(source))
+        go_lexer.scan_range(start, end, lineno, tokens)
+        if tokens.reports or len(tokens) == len(HEADER_KINDS):
+            raise FullParse
+        kind = "import" if tokens[len(HEADER_KINDS)].type == "KW_IMPORT" else "decl"
+        chunk = Chunk(source.text[start:end], kind, lineno)
+
+        root = tables[0]
+        for table in tables:
+            table.before = {}
+            table.written = []
+        root.states = {}
+        first_uid = symtab.next_uid
+        chunk.first_scope = first_scope = len(symtab.scope_parent)
+        first_type = len(type_table.types)
+        root_children = len(symtab.scope_children[ROOT_SCOPE])
+
+        errors = go_parser.syntax_errors
+        go_parser.ast = syntree.Node("start", children=[])
+        symtab.children_entered[0] = root_children
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                go_parser.parser.parse(lexer=tokens, tracking=True)
+        except Exception:
+            # raised again by the full parse, after the same output
+            raise FullParse
+        if go_parser.syntax_errors != errors or symtab.depth != 1:
+            raise FullParse
+        # an import chunk may go on with declarations that do not start a
+        # line (after a ';' or indented), which parse without errors
+        if len(go_parser.ast.children) != 1:
+            raise FullParse
+        sys.stdout.write(output.getvalue())
+        chunk.cacheable = not output.getvalue()
+
+        chunk.parse_lookups = tuple(table.before for table in tables)
+        for table in tables:
+            table.before = None
+        chunk.writes = tuple(
+            {
+                key: dict.get(table, key, MISSING)
+                for key in table.written
+                if dict.get(table, key, MISSING) is not lookups[key]
+            }
+            for table, lookups in zip(tables, chunk.parse_lookups)
+        )
+        chunk.symbols = [symtab.symbols[uid] for uid in range(first_uid, symtab.next_uid)]
+        self._check_foreign_symbols(root, set(map(id, chunk.symbols)))
+        # the uses added to the symbols of the previous chunks
+        chunk.foreign_uses = [
+            (sym, sym.uses[len(root.states[name][6]):])
+            for name, sym in chunk.parse_lookups[0].items()
+            if sym is not MISSING
+            and sym.uid < first_uid
+            and len(sym.uses) > len(root.states[name][6])
+        ]
+
+        (items,) = go_parser.ast.children
+        chunk.items = items.children
+        chunk.parse_states = [symbol_state(sym) for sym in chunk.symbols]
+        chunk.types = type_table.types[first_type:]
+        for scope in range(first_scope, len(symtab.scope_parent)):
+            parent = symtab.scope_parent[scope]
+            n = symtab.scope_children[parent].index(scope)
+            if parent == ROOT_SCOPE:
+                parent = -1
+                n -= root_children
+            else:
+                parent -= first_scope
+            chunk.scopes.append((parent, n, dict(symtab.scope_symbols[scope])))
+
+        return chunk
+
+    def _check_foreign_symbols(self, root: ScopeDict, own: set):
+        """Parse in full if a chunk changed the symbols of other chunks it
+        looked up (other than by adding uses), as redeclarations do
+
+        own holds the ids of the symbols of the chunk.
+        """
+        for name, state in root.states.items():
+            sym = dict.get(root, name)
+            if sym is None or id(sym) in own:
+                continue
+            if symbol_state(sym)[:6] != state[:6] or sym.uses[: len(state[6])] != list(state[6]):
+                raise FullParse
+
+    def _check_chunk(self, chunk: Chunk, tables: tuple):
+        """Type check the subtrees of a parsed chunk and record what it did"""
+        root = tables[0]
+        for table in tables:
+            table.before = {}
+        root.states = {}
+        # the symbols of other chunks that the subtrees refer to were all
+        # looked up while parsing
+        referenced = {
+            name: symbol_state(sym)
+            for name, sym in chunk.parse_lookups[0].items()
+            if sym is not MISSING
+        }
+        num_types = len(type_table.types)
+
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                for item in reversed(chunk.items):
+                    syntree.postprocess_subtree(item)
+        except Exception:
+            raise FullParse
+        sys.stdout.write(output.getvalue())
+        if output.getvalue():
+            chunk.cacheable = False
+
+        chunk.check_lookups = tuple(table.before for table in tables)
+        for table in tables:
+            table.before = None
+        if len(type_table.types) != num_types or any(
+            dict.get(table, key, MISSING) is not value
+            for table, lookups in zip(tables, chunk.check_lookups)
+            for key, value in lookups.items()
+        ):
+            # the type checks of the chunks are independent of each other
+            raise FullParse
+        root.states.update(referenced)
+        self._check_foreign_symbols(root, set(map(id, chunk.symbols)))
+
+        chunk.check_states = [symbol_state(sym) for sym in chunk.symbols]
+        chunk.find_references()
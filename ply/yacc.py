@@ -64,7 +64,11 @@
 import re
 import types
 import sys
+import os
 import inspect
+import hashlib
+import pickle
+from array import array
 
 #-----------------------------------------------------------------------------
 #                     === User configurable parameters ===
@@ -76,6 +80,7 @@ yaccdebug   = False            # Debugging mode.  If set, yacc generates a
                                # a 'parser.out' file in the current directory
 
 debug_file  = 'parser.out'     # Default name of the debugging file
+tab_version = 2                # Version of the format written by write_table()
 error_count = 3                # Number of symbols that must be shifted to leave recovery mode
 resultlimit = 40               # Size limit of results when running in debug mode.
 
@@ -580,6 +585,390 @@ class LRParser:
             # If we'r here, something really bad happened
             raise RuntimeError('yacc: internal parser error!!!\n')
 
+# -----------------------------------------------------------------------------
+#                          === Packed LR Tables ===
+#
+# The dict-of-dict action and goto tables cost a lot of memory (a hash table
+# per state) and two hash lookups per action.  The following classes pack the
+# tables into flat arrays with row displacement: the row of every state is
+# placed at an offset (its base) in one shared array so that its entries fall
+# on unused slots, and a check array records which state owns each slot.
+# Tokens and nonterminals are numbered so that an action lookup is
+#
+#       i = base[state] + code
+#       t = value[i] if check[i] == state else error
+# -----------------------------------------------------------------------------
+
+# pack_rows()
+#
+# Packs rows (a list of {column: value} dicts, one per state) into the arrays
+# (base, check, value).  Rows are placed first fit, the densest first: the
+# first column of a row is tried on every free slot in turn.  A row with the
+# same columns as an earlier row does not fit before it, so its search starts
+# where the earlier one ended.  The arrays are padded so that
+# base[state] + column is always a valid index.
+
+def pack_rows(rows, width):
+    base  = array('i', [0] * len(rows))
+    check = array('i', [-1] * width)
+    value = array('i', [0] * width)
+    used  = bytearray(width)
+    resume = {}                  # Columns of a row -> next slot to try
+
+    for row in sorted(range(len(rows)), key=lambda s: -len(rows[s])):
+        columns = sorted(rows[row])
+        if not columns:
+            continue
+
+        first = columns[0]
+        key = tuple(columns)
+        slot = used.find(0, resume.get(key, first))
+        while True:
+            offset = slot - first
+            grow = offset + width - len(used)
+            if grow > 0:
+                used.extend(bytes(grow))
+                check.extend([-1] * grow)
+                value.extend([0] * grow)
+            for c in columns:
+                if used[offset + c]:
+                    break
+            else:
+                break
+            slot = used.find(0, slot + 1)
+
+        base[row] = offset
+        resume[key] = slot + 1
+        for c in columns:
+            used[offset + c] = 1
+            check[offset + c] = row
+            value[offset + c] = rows[row][c]
+
+    return base, check, value
+
+# -----------------------------------------------------------------------------
+# class PackedLRTable
+#
+# Packed version of the tables of an LRTable (or LRTableCache).  The attributes
+# are:
+#
+#       token_codes     - Maps the type of a token to its code
+#       unknown_code    - Code of the tokens the grammar does not know
+#       action_base     - Offset of the action row of a state
+#       action_check    - State owning an action slot (-1 if free)
+#       action_value    - Action of a slot: > 0 shift, < 0 reduce, 0 accept
+#       goto_base       - Offset of the goto row of a state
+#       goto_value      - Next state of a goto slot
+#       defaulted       - Reduction of a defaulted state (0 if not defaulted)
+#       prod_len        - Length of the right hand side of a production
+#       prod_lhs        - Code of the nonterminal of a production
+#
+# The goto table has no check array: after a reduction the goto entry always
+# exists in a valid LR table.  The packed tables are saved in the table file
+# (see write_table()) as packing them takes longer than reading them back.
+# -----------------------------------------------------------------------------
+
+class PackedLRTable(object):
+    def __init__(self, lrtab, terminals=()):
+        action = lrtab.lr_action
+        goto = lrtab.lr_goto
+        productions = lrtab.lr_productions
+
+        # Tokens that appear in no action still get a code (always an error)
+        names = set(terminals)
+        for row in action.values():
+            names.update(row)
+        names.discard('$end')
+        names.discard('error')
+        self.token_codes = {name: code for code, name in
+                            enumerate(['$end', 'error'] + sorted(names))}
+        self.unknown_code = len(self.token_codes)
+
+        nonterminals = sorted({p.name for p in productions})
+        nonterminal_codes = {name: code for code, name in enumerate(nonterminals)}
+
+        num_states = max(action) + 1
+        codes = self.token_codes
+        rows = [{codes[tok]: t for tok, t in action.get(state, {}).items()}
+                for state in range(num_states)]
+        self.action_base, self.action_check, self.action_value = pack_rows(rows, len(codes) + 1)
+
+        rows = [{nonterminal_codes[name]: t for name, t in goto.get(state, {}).items()}
+                for state in range(num_states)]
+        self.goto_base, _, self.goto_value = pack_rows(rows, len(nonterminal_codes))
+
+        self.defaulted = array('i', [0] * num_states)
+        for state, actions in action.items():
+            rules = list(actions.values())
+            if len(rules) == 1 and rules[0] < 0:
+                self.defaulted[state] = rules[0]
+
+        self.prod_len = array('i', [p.len for p in productions])
+        self.prod_lhs = array('i', [nonterminal_codes[p.name] for p in productions])
+
+    array_names = ('action_base', 'action_check', 'action_value', 'goto_base',
+                   'goto_value', 'defaulted', 'prod_len', 'prod_lhs')
+
+    # Number of bytes taken by the arrays
+    def nbytes(self):
+        return sum(getattr(self, name).itemsize * len(getattr(self, name))
+                   for name in self.array_names)
+
+    # Copy of the tables with lists instead of arrays.  Reading an array boxes
+    # a new int every time while a list holds its (shared) int objects: the
+    # lists take twice the memory of the arrays but are read faster than the
+    # dict tables.
+    def to_lists(self):
+        tables = PackedLRTable.__new__(PackedLRTable)
+        tables.__dict__.update(self.__dict__)
+        ints = {}
+        for name in self.array_names:
+            setattr(tables, name, [ints.setdefault(v, v) for v in getattr(self, name)])
+        return tables
+
+# -----------------------------------------------------------------------------
+# class PackedLRParser
+#
+# LR parsing engine on packed tables.  parse() is a copy of LRParser.parse()
+# without the debugging output and with position tracking always on.  Only the
+# start of a nonterminal is tracked (lineno and lexpos), not its end.  The
+# tables are packed unless lrtab already holds them in lr_packed, and are read
+# from lists (see PackedLRTable.to_lists()).
+# -----------------------------------------------------------------------------
+
+class PackedLRParser(LRParser):
+    def __init__(self, lrtab, errorf, terminals=()):
+        self.tables = (lrtab.lr_packed or PackedLRTable(lrtab, terminals)).to_lists()
+        self.productions = lrtab.lr_productions
+        self.errorfunc = errorf
+        self.set_defaulted_states()
+        self.errorok = True
+
+    def set_defaulted_states(self):
+        self.defaulted_states = self.tables.defaulted
+
+    def disable_defaulted_states(self):
+        self.defaulted_states = [0] * len(self.tables.defaulted)
+
+    def parse(self, input=None, lexer=None, debug=False, tracking=True):
+        if debug:
+            raise YaccError('Debugging needs the unpacked tables, build the parser with packed=False')
+
+        lookahead = None                         # Current lookahead symbol
+        lcode = 0                                # Token code of the lookahead symbol
+        lookaheadstack = []                      # Stack of lookahead symbols
+        tables = self.tables
+        codes = tables.token_codes
+        unknown_code = tables.unknown_code
+        action_base  = tables.action_base
+        action_check = tables.action_check
+        action_value = tables.action_value
+        goto_base    = tables.goto_base
+        goto_value   = tables.goto_value
+        prod_len     = tables.prod_len
+        prod_lhs     = tables.prod_lhs
+        defaulted_states = self.defaulted_states
+        prod_names = [p.name for p in self.productions]
+        callables  = [p.callable for p in self.productions]
+        pslice  = YaccProduction(None)           # Production object passed to grammar rules
+        errorcount = 0                           # Used during error recovery
+
+        # If no lexer was given, we will try to use the lex module
+        if not lexer:
+            from . import lex
+            lexer = lex.lexer
+
+        # Set up the lexer and parser objects on pslice
+        pslice.lexer = lexer
+        pslice.parser = self
+
+        # If input was supplied, pass to lexer
+        if input is not None:
+            lexer.input(input)
+
+        # Set the token function
+        get_token = self.token = lexer.token
+
+        # Set up the state and symbol stacks
+        statestack = self.statestack = []   # Stack of parsing states
+        symstack = self.symstack = []       # Stack of grammar symbols
+        pslice.stack = symstack             # Put in the production
+        errtoken   = None                   # Err token
+
+        # The start state is assumed to be (0,$end)
+
+        statestack.append(0)
+        sym = YaccSymbol()
+        sym.type = '$end'
+        symstack.append(sym)
+        state = 0
+        while True:
+            t = defaulted_states[state]
+            if not t:
+                if not lookahead:
+                    if not lookaheadstack:
+                        lookahead = get_token()     # Get the next token
+                    else:
+                        lookahead = lookaheadstack.pop()
+                    if not lookahead:
+                        lookahead = YaccSymbol()
+                        lookahead.type = '$end'
+                    lcode = codes.get(lookahead.type, unknown_code)
+
+                # Check the action table
+                i = action_base[state] + lcode
+                if action_check[i] != state:
+                    t = None
+                else:
+                    t = action_value[i]
+                    if t > 0:
+                        # shift a symbol on the stack
+                        statestack.append(t)
+                        state = t
+                        symstack.append(lookahead)
+                        lookahead = None
+
+                        # Decrease error count on successful shift
+                        if errorcount:
+                            errorcount -= 1
+                        continue
+
+                    if t == 0:
+                        return getattr(symstack[-1], 'value', None)
+
+            if t is not None:
+                # reduce a symbol on the stack, emit a production
+                pnum = -t
+                plen = prod_len[pnum]
+
+                sym = YaccSymbol()
+                sym.type = prod_names[pnum]
+                sym.value = None
+
+                if plen:
+                    targ = symstack[-plen-1:]
+                    targ[0] = sym
+                    t1 = targ[1]
+                    sym.lineno = t1.lineno
+                    sym.lexpos = t1.lexpos
+                else:
+                    sym.lineno = lexer.lineno
+                    sym.lexpos = lexer.lexpos
+                    targ = [sym]
+
+                pslice.slice = targ
+
+                try:
+                    # Call the grammar rule with our special slice object
+                    if plen:
+                        del symstack[-plen:]
+                    callables[pnum](pslice)
+                    if plen:
+                        del statestack[-plen:]
+                    symstack.append(sym)
+                    state = goto_value[goto_base[statestack[-1]] + prod_lhs[pnum]]
+                    statestack.append(state)
+                except SyntaxError:
+                    # If an error was set. Enter error recovery state
+                    lookaheadstack.append(lookahead)    # Save the current lookahead token
+                    symstack.extend(targ[1:-1])         # Put the production slice back on the stack
+                    statestack.pop()                    # Pop back one state (before the reduce)
+                    state = statestack[-1]
+                    sym.type = 'error'
+                    sym.value = 'error'
+                    lookahead = sym
+                    lcode = codes['error']
+                    errorcount = error_count
+                    self.errorok = False
+
+                continue
+
+            # Syntax error, recover as LRParser.parse() does
+            if errorcount == 0 or self.errorok:
+                errorcount = error_count
+                self.errorok = False
+                errtoken = lookahead
+                if errtoken.type == '$end':
+                    errtoken = None               # End of file!
+                if self.errorfunc:
+                    if errtoken and not hasattr(errtoken, 'lexer'):
+                        errtoken.lexer = lexer
+                    self.state = state
+                    tok = self.errorfunc(errtoken)
+                    if self.errorok:
+                        # User must have done some kind of panic
+                        # mode recovery on their own.  The
+                        # returned token is the next lookahead
+                        lookahead = tok
+                        if lookahead:
+                            lcode = codes.get(lookahead.type, unknown_code)
+                        errtoken = None
+                        continue
+                else:
+                    if errtoken:
+                        if hasattr(errtoken, 'lineno'):
+                            lineno = lookahead.lineno
+                        else:
+                            lineno = 0
+                        if lineno:
+                            sys.stderr.write('yacc: Syntax error at line %d, token=%s\n' % (lineno, errtoken.type))
+                        else:
+                            sys.stderr.write('yacc: Syntax error, token=%s' % errtoken.type)
+                    else:
+                        sys.stderr.write('yacc: Parse error in input. EOF\n')
+                        return
+
+            else:
+                errorcount = error_count
+
+            # case 1:  the statestack only has 1 entry on it.  The entire parse
+            # has been rolled back, the token is discarded.
+
+            if len(statestack) <= 1 and lookahead.type != '$end':
+                lookahead = None
+                errtoken = None
+                state = 0
+                # Nuke the pushback stack
+                del lookaheadstack[:]
+                continue
+
+            # case 2: the statestack has a couple of entries on it, but we're
+            # at the end of the file. nuke the top entry and generate an error token
+
+            # Start nuking entries on the stack
+            if lookahead.type == '$end':
+                # Whoa. We're really hosed here. Bail out
+                return
+
+            if lookahead.type != 'error':
+                sym = symstack[-1]
+                if sym.type == 'error':
+                    # Hmmm. Error is on top of stack, we'll just nuke input
+                    # symbol and continue
+                    lookahead = None
+                    continue
+
+                # Create the error symbol for the first time and make it the new lookahead symbol
+                t = YaccSymbol()
+                t.type = 'error'
+
+                if hasattr(lookahead, 'lineno'):
+                    t.lineno = t.endlineno = lookahead.lineno
+                if hasattr(lookahead, 'lexpos'):
+                    t.lexpos = t.endlexpos = lookahead.lexpos
+                t.value = lookahead
+                lookaheadstack.append(lookahead)
+                lookahead = t
+                lcode = codes['error']
+            else:
+                sym = symstack.pop()
+                lookahead.lineno = sym.lineno
+                lookahead.lexpos = sym.lexpos
+                statestack.pop()
+                state = statestack[-1]
+
+            continue
+
 # -----------------------------------------------------------------------------
 #                          === Grammar Representation ===
 #
@@ -1321,6 +1710,7 @@ class LRTable:
         self.lr_action     = {}        # Action table
         self.lr_goto       = {}        # Goto table
         self.lr_productions  = grammar.Productions    # Copy of grammar Production array
+        self.lr_packed     = None      # PackedLRTable of the tables (if needed)
         self.lr_goto_cache = {}        # Cache of computed gotos
         self.lr0_cidhash   = {}        # Cache of closures
 
@@ -1922,6 +2312,106 @@ class LRTable:
             goto[st] = st_goto
             st += 1
 
+# -----------------------------------------------------------------------------
+#                            === TABLE CACHING ===
+#
+# Building the LALR tables is by far the most expensive part of yacc().  The
+# following functions persist the action/goto tables and a minimal description
+# of the productions to a pickle file so that a later run with an identical
+# grammar can skip table construction entirely.
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# class MiniProduction
+#
+# Stand-in for Production when the tables are read back from a file.  Only the
+# attributes needed by LRParser.parse() are kept.
+# -----------------------------------------------------------------------------
+
+class MiniProduction(object):
+    def __init__(self, str, name, len, func, file, line):
+        self.name     = name
+        self.len      = len
+        self.func     = func
+        self.callable = None
+        self.file     = file
+        self.line     = line
+        self.str      = str
+
+    def __str__(self):
+        return self.str
+
+    def __repr__(self):
+        return 'MiniProduction(%s)' % self.str
+
+    # Bind the production function name to a callable
+    def bind(self, pdict):
+        if self.func:
+            self.callable = pdict[self.func]
+
+# -----------------------------------------------------------------------------
+# class LRTableCache
+#
+# Holds tables loaded by read_table().  Exposes the same attributes as LRTable
+# that LRParser needs.
+# -----------------------------------------------------------------------------
+
+class LRTableCache(object):
+    def __init__(self, action, goto, productions, packed=None):
+        self.lr_action      = action
+        self.lr_goto        = goto
+        self.lr_productions = productions
+        self.lr_packed      = packed
+
+    # Bind all production function names to callable objects in pdict
+    def bind_callables(self, pdict):
+        for p in self.lr_productions:
+            p.bind(pdict)
+
+# Hash used to decide if a table file still matches the grammar
+def table_signature(pinfo):
+    sig = '%d:%s' % (tab_version, pinfo.signature())
+    return hashlib.sha256(sig.encode('utf-8')).hexdigest()
+
+# Read tables written by write_table().  Returns None if the file is missing,
+# unreadable or was built from a different grammar.
+def read_table(tabfile, signature):
+    try:
+        with open(tabfile, 'rb') as f:
+            data = pickle.load(f)
+    except Exception:
+        return None
+
+    if not isinstance(data, dict) or data.get('signature') != signature:
+        return None
+
+    productions = [MiniProduction(*p) for p in data['productions']]
+    return LRTableCache(data['action'], data['goto'], productions, data['packed'])
+
+# Write the tables of lr to tabfile.  The file is first written to a temporary
+# name and then moved in place so that concurrent readers never see a partial
+# file.  The packed tables are written too when lr has them.
+def write_table(lr, tabfile, signature):
+    productions = []
+    for p in lr.lr_productions:
+        if p.func:
+            productions.append((p.str, p.name, p.len, p.func, p.file, p.line))
+        else:
+            productions.append((str(p), p.name, p.len, None, None, None))
+
+    data = {
+        'signature': signature,
+        'action': lr.lr_action,
+        'goto': lr.lr_goto,
+        'productions': productions,
+        'packed': lr.lr_packed,
+    }
+
+    tmpfile = '%s.%d.tmp' % (tabfile, os.getpid())
+    with open(tmpfile, 'wb') as f:
+        pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpfile, tabfile)
+
 # -----------------------------------------------------------------------------
 #                            === INTROSPECTION ===
 #
@@ -2032,9 +2522,10 @@ class ParserReflect(object):
             if self.prec:
                 parts.append(''.join([''.join(p) for p in self.prec]))
             if self.tokens:
-                parts.append(' '.join(self.tokens))
+                parts.append(' '.join(sorted(self.tokens)))
             for f in self.pfuncs:
                 if f[3]:
+                    parts.append(f[2])
                     parts.append(f[3])
         except (TypeError, ValueError):
             pass
@@ -2262,6 +2753,12 @@ class ParserReflect(object):
 
         self.grammar = grammar
 
+# Build the parsing engine for the tables lr, on packed tables if asked for
+def build_parser(lr, pinfo, packed):
+    if packed:
+        return PackedLRParser(lr, pinfo.error_func, pinfo.tokens)
+    return LRParser(lr, pinfo.error_func)
+
 # -----------------------------------------------------------------------------
 # yacc(module)
 #
@@ -2270,7 +2767,7 @@ class ParserReflect(object):
 
 def yacc(*, debug=yaccdebug, module=None, start=None,
          check_recursion=True, optimize=False, debugfile=debug_file,
-         debuglog=None, errorlog=None):
+         debuglog=None, errorlog=None, tabfile=None, packed=False):
 
     # Reference to the parsing method of the last built parser
     global parse
@@ -2303,6 +2800,23 @@ def yacc(*, debug=yaccdebug, module=None, start=None,
     if pinfo.error:
         raise YaccError('Unable to build parser')
 
+    # Try to reuse previously built tables
+    if tabfile:
+        signature = table_signature(pinfo)
+        lr = read_table(tabfile, signature)
+        if lr is not None:
+            if packed and lr.lr_packed is None:
+                lr.lr_packed = PackedLRTable(lr, pinfo.tokens)
+                try:
+                    write_table(lr, tabfile, signature)
+                except IOError as e:
+                    errorlog.warning("Couldn't create %r. %s" % (tabfile, e))
+
+            lr.bind_callables(pinfo.pdict)
+            parser = build_parser(lr, pinfo, packed)
+            parse = parser.parse
+            return parser
+
     if debuglog is None:
         if debug:
             try:
@@ -2474,9 +2988,19 @@ def yacc(*, debug=yaccdebug, module=None, start=None,
                 errorlog.warning('Rule (%s) is never reduced', rejected)
                 warned_never.append(rejected)
 
+    if packed:
+        lr.lr_packed = PackedLRTable(lr, pinfo.tokens)
+
+    # Save the tables for the next run
+    if tabfile:
+        try:
+            write_table(lr, tabfile, signature)
+        except IOError as e:
+            errorlog.warning("Couldn't create %r. %s" % (tabfile, e))
+
     # Build the parser
     lr.bind_callables(pinfo.pdict)
-    parser = LRParser(lr, pinfo.error_func)
+    parser = build_parser(lr, pinfo, packed)
 
     parse = parser.parse
     return parser
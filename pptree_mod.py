@@ -1,8 +1,37 @@
+"""Pretty print a tree in the terminal
+
+Same output as pptree.print_tree, but the size of every subtree is computed
+once (in a single post-order pass) and both layouts walk the tree with an
+explicit stack, so large and deeply nested trees can be printed without
+hitting the recursion limit.
+"""
+import sys
+
 from pptree.utils import *
-from pptree.pptree import print_tree_horizontally, print_tree_vertically
 
 
-def print_tree(current_node, childattr='children', nameattr='name', horizontal=True):
+def subtree_sizes(root, children) -> dict:
+    """Number of nodes under every node (including itself), keyed by id()"""
+    sizes = {}
+    stack = [(root, False)]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            sizes[id(node)] = 1 + sum(sizes[id(child)] for child in children(node))
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children(node))
+
+    return sizes
+
+
+def print_tree(
+    current_node,
+    childattr="children",
+    nameattr="name",
+    horizontal=True,
+    file=None,
+):
     if nameattr is None:
         name = lambda node: str(node)
     elif hasattr(current_node, nameattr):
@@ -11,21 +40,123 @@ def print_tree(current_node, childattr='children', nameattr='name', horizontal=T
         name = lambda node: str(node)
 
     children = lambda node: getattr(node, childattr)
-    nb_children = lambda node: sum(nb_children(child) for child in children(node)) + 1
+    sizes = subtree_sizes(current_node, children)
 
     def balanced_branches(current_node):
-        size_branch = {child: nb_children(child) for child in children(current_node)}
-
-        """ Creation of balanced lists for "a" branch and "b" branch. """
-        a = children(current_node)
+        """Creation of balanced lists for "a" branch and "b" branch."""
+        a = list(children(current_node))
         b = []
-        while a and sum(size_branch[node] for node in b) < sum(size_branch[node] for node in a):
-            b.insert(0, a.pop())
+        size_a = sum(sizes[id(node)] for node in a)
+        size_b = 0
+        while a and size_b < size_a:
+            node = a.pop()
+            size_a -= sizes[id(node)]
+            size_b += sizes[id(node)]
+            b.append(node)
+        b.reverse()
 
         return a, b
 
-    if horizontal:
-        print_tree_horizontally(current_node, balanced_branches, name)
+    if file is None:
+        file = sys.stdout
 
+    if horizontal:
+        lines = tree_lines_horizontal(current_node, balanced_branches, name)
     else:
-        print_tree_vertically(current_node, balanced_branches, name, children)
+        lines = tree_lines_vertical(current_node, balanced_branches, name)
+
+    for line in lines:
+        file.write(line)
+        file.write("\n")
+
+
+def tree_lines_horizontal(root, balanced_branches, name_getter):
+    """Yield the lines of the tree drawn from left to right
+
+    The "up" branch of a node is printed above it and the "down" branch
+    below it.
+    """
+    # items are either a node still to be laid out or a finished line
+    stack = [(root, "", "updown")]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            yield item
+            continue
+
+        current_node, indent, last = item
+        up, down = balanced_branches(current_node)
+        current_name = name_getter(current_node)
+
+        if last == "up":
+            start_shape = "┌"
+        elif last == "down":
+            start_shape = "└"
+        elif last == "updown":
+            start_shape = " "
+        else:
+            start_shape = "├"
+
+        if up:
+            end_shape = "┤"
+        elif down:
+            end_shape = "┐"
+        else:
+            end_shape = ""
+
+        up_indent = "{0}{1}{2}".format(
+            indent, " " if "up" in last else "│", " " * len(current_name)
+        )
+        down_indent = "{0}{1}{2}".format(
+            indent, " " if "down" in last else "│", " " * len(current_name)
+        )
+
+        # pushed in reverse: up branch, current node, down branch
+        for i in range(len(down) - 1, -1, -1):
+            stack.append((down[i], down_indent, "down" if i == len(down) - 1 else ""))
+        stack.append(f"{indent}{start_shape}{current_name}{end_shape}")
+        for i in range(len(up) - 1, -1, -1):
+            stack.append((up[i], up_indent, "up" if i == 0 else ""))
+
+
+def tree_lines_vertical(root, balanced_branches, name_getter):
+    """Return the lines of the tree drawn from top to bottom
+
+    Every node's block is built from the blocks of its children, so the
+    nodes are visited in post-order and each block is dropped as soon as its
+    parent has used it.
+    """
+    blocks = {}
+    stack = [(root, False)]
+    while stack:
+        current_node, visited = stack.pop()
+        sx, dx = balanced_branches(current_node)
+
+        if not visited:
+            stack.append((current_node, True))
+            stack.extend((child, False) for child in sx + dx)
+            continue
+
+        """ Creation of children representation """
+        left = branch_left([blocks.pop(id(node)) for node in sx]) if sx else ()
+        right = branch_right([blocks.pop(id(node)) for node in dx]) if dx else ()
+
+        children_repr = tuple(connect_branches(left, right) if sx or dx else ())
+
+        current_name = name_getter(current_node)
+
+        name_len = len(current_name)
+        name_l, name_r = name_len // 2, name_len // 2
+
+        left_len, right_len = blocklen(left), blocklen(right)
+
+        current_name = (
+            f"{' ' * (left_len - name_l)}{current_name}{' ' * (right_len - name_r)}"
+        )
+
+        blocks[id(current_node)] = (
+            multijoin([[current_name, *children_repr]]),
+            (max(left_len, name_l), max(right_len, name_r)),
+        )
+
+    return blocks[id(root)][0]
@@ -1,21 +1,29 @@
-from dataclasses import dataclass, field
-from collections import defaultdict
-from tabulate import tabulate
+from dataclasses import dataclass
 from typing import Dict, Optional, List, Any
 
 import utils
 from utils import print_marker, print_line, print_error
 
 
-@dataclass
+@dataclass(eq=False)
 class TypeInfo:
-    """Stores information for a particular type"""
+    """Stores information for a particular type
+
+    There is only one TypeInfo for every type in a TypeTable, so types are
+    compared (and hashed) by identity.
+    """
 
     name: str
     lineno: Optional[int] = None
     col_num: Optional[int] = None
     storage: Optional[int] = None
     eltype: Any = None
+    # "basic", "array" or "slice"
+    kind: str = "basic"
+    # number of elements, for arrays
+    length: Optional[int] = None
+    # index of the type in TypeTable.types
+    id: int = -1
 
     def __str__(self):
         s = f"Type({self.name}"
@@ -37,6 +45,8 @@ class TypeInfo:
 class TypeTable:
     """Store information of all types - predefined and user defined"""
 
+    table_headers = ["Type Name", "Storage", "Element Type"]
+
     _predefined = {
         # For INT
         "int": 8,
@@ -62,8 +72,15 @@ class TypeTable:
         "rune": 4,
     }
 
+    _integer_names = ("int", "int8", "int16", "int32", "int64")
+    _float_names = ("float32", "float64")
+
     def __init__(self):
         self.type_map: Dict[str, TypeInfo] = {}
+        # all types ever created, indexed by TypeInfo.id
+        self.types: List[TypeInfo] = []
+        # array and slice types by structure, like ("array", "int", 5)
+        self.composite_types: Dict[tuple, TypeInfo] = {}
 
         for typename, storage in self._predefined.items():
             self.add_type(typename, None, None, storage=storage)
@@ -72,6 +89,20 @@ class TypeTable:
         self.add_type("unknown", None, None, None)
         self.add_type("string", None, None, None, eltype="rune")
 
+        self.predefined_types = list(self.types)
+        self.integer_types = {self.type_map[name] for name in self._integer_names}
+        self.float_types = {self.type_map[name] for name in self._float_names}
+
+    def reset(self):
+        """Remove all user defined types, keeping only the predefined ones
+
+        The TypeInfo objects of the predefined types are kept, so they are
+        the same from one file to the next.
+        """
+        self.type_map = {type_.name: type_ for type_ in self.predefined_types}
+        self.types = list(self.predefined_types)
+        self.composite_types = {}
+
     def is_defined(self, name: str):
         """Check if a type is defined"""
         return name in self.type_map
@@ -79,6 +110,46 @@ class TypeTable:
     def get_type(self, name: str) -> TypeInfo:
         return self.type_map[name]
 
+    def resolve(self, type_) -> Optional[TypeInfo]:
+        """The TypeInfo of a type name (or of a TypeInfo itself)"""
+        if isinstance(type_, TypeInfo):
+            return type_
+        if isinstance(type_, str):
+            return self.type_map.get(type_)
+        return None
+
+    def _new_type(self, name: str, **kwargs) -> TypeInfo:
+        new_type = TypeInfo(name, id=len(self.types), **kwargs)
+        self.types.append(new_type)
+        self.type_map[name] = new_type
+
+        return new_type
+
+    def array_type(self, eltype: str, length: int) -> TypeInfo:
+        """The type of arrays of length elements of type eltype"""
+        key = ("array", eltype, length)
+        if key not in self.composite_types:
+            elem_storage = self.get_type(eltype).storage
+            self.composite_types[key] = self._new_type(
+                f"ARRAY_{length}_{eltype}",
+                storage=None if elem_storage is None else length * elem_storage,
+                eltype=eltype,
+                kind="array",
+                length=length,
+            )
+
+        return self.composite_types[key]
+
+    def slice_type(self, eltype: str) -> TypeInfo:
+        """The type of slices of eltype"""
+        key = ("slice", eltype)
+        if key not in self.composite_types:
+            self.composite_types[key] = self._new_type(
+                f"SLICE_{eltype}", eltype=eltype, kind="slice"
+            )
+
+        return self.composite_types[key]
+
     def add_type(self, name: str, lineno, col_num, storage, eltype=None, check=True):
         """Add a new type definition with the details"""
 
@@ -98,104 +169,185 @@ class TypeTable:
             pos = other_type.col_num - 1
             print_marker(pos, width)
 
-        new_type = TypeInfo(name, lineno, col_num, storage, eltype)
+        self._new_type(
+            name, lineno=lineno, col_num=col_num, storage=storage, eltype=eltype
+        )
 
-        self.type_map[name] = new_type
+    def rows(self) -> list:
+        """Rows of the type table, as shown by str()"""
+        return [
+            [
+                symbol.name,
+                symbol.storage,
+                symbol.eltype,
+            ]
+            for _, symbol in self.type_map.items()
+        ]
 
     def __str__(self):
-        return str(
-            tabulate(
-                [
-                    [
-                        symbol.name,
-                        symbol.storage,
-                        symbol.eltype,
-                    ]
-                    for _, symbol in self.type_map.items()
-                ],
-                headers=[
-                    "Type Name",
-                    "Storage",
-                    "Element Type",
-                ],
-                tablefmt="psql",
-            )
-        )
+        from tabulate import tabulate
+
+        return str(tabulate(self.rows(), headers=self.table_headers, tablefmt="psql"))
 
 
-@dataclass
 class SymbolInfo:
-    """Stores information related to a symbol"""
+    """Stores information related to a symbol
+
+    scope_id is the (integer) scope the symbol is declared in and uid is a
+    number unique to the symbol within its symbol table.
+    """
+
+    __slots__ = (
+        "name",
+        "scope_id",
+        "uid",
+        "lineno",
+        "col_num",
+        "type_",
+        "const",
+        "const_flag",
+        "value",
+        "uses",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        scope_id: int,
+        uid: int = 0,
+        lineno: Optional[int] = None,
+        col_num: Optional[int] = None,
+        type_: Optional[TypeInfo] = None,
+        const: bool = False,
+        const_flag: bool = False,
+        value: Any = None,
+        uses: Optional[list] = None,
+    ):
+        self.name = name
+        self.scope_id = scope_id
+        self.uid = uid
+        self.lineno = lineno
+        self.col_num = col_num
+        self.type_ = type_
+        self.const = const
+        self.const_flag = const_flag
+        self.value = value
+        self.uses = [] if uses is None else uses
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in self.__slots__
+        )
+        return f"SymbolInfo({fields})"
 
-    name: str
-    scope_id: str
-    lineno: Optional[int] = None
-    col_num: Optional[int] = None
-    type_: Optional[TypeInfo] = None
-    # storage: Optional[int] = None
-    # node: Optional[Node] = None
-    const: bool = False
-    const_flag: bool = False
-    value: Any = None
-    uses: list = field(default_factory=list)
+
+# scope id of the outermost (package) scope
+ROOT_SCOPE = 0
 
 
 class SymbolTable:
     """Stores all identifiers, literals and information
     related to them"""
 
-    def __init__(self, type_table: TypeTable):
-        self.symbols: List[SymbolInfo] = []
-        self.reset_depth()
+    table_headers = ["Symbol", "Scope", "Line No.", "Type", "Const", "Value", "Uses"]
 
+    def __init__(self, type_table: TypeTable):
         self.type_table = type_table
+        self.reset()
+
+    def reset(self):
+        """Remove all symbols so that a new file can be compiled"""
+        # all symbols in the order they were added, keyed by uid so that
+        # a symbol can be removed in constant time
+        self.symbols: Dict[int, SymbolInfo] = {}
+        self.next_uid = 0
+
+        # The scopes form a tree, stored as parallel lists indexed by the
+        # scope id. The root scope is ROOT_SCOPE.
+        self.scope_parent: List[Optional[int]] = [None]
+        self.scope_children: List[List[int]] = [[]]
+        # the dotted name shown in the symbol table, like "1.2.1"
+        self.scope_names: List[str] = ["1"]
+        # symbols declared in every scope, by name
+        self.scope_symbols: List[Dict[str, SymbolInfo]] = [{}]
+
+        self.reset_depth()
 
     def reset_depth(self):
-        self.stack: List[Dict[str, SymbolInfo]] = [{}]
-        self.cur_scope = "1"
-        self.depth = 1
-        self.scopes_at_depth: Dict[int, int] = defaultdict(lambda: 0)
+        """Go back to the root scope
 
-        self._add_cur_scope_symbols()
+        Entering scopes after this visits the existing scopes again in the
+        order they were created.
+        """
+        self.cur_scope = ROOT_SCOPE
+        self.depth = 1
+        # symbols of every scope from the root to the current one
+        self.stack: List[Dict[str, SymbolInfo]] = [self.scope_symbols[ROOT_SCOPE]]
+        # number of child scopes entered so far, for every scope in the stack
+        self.children_entered: List[int] = [0]
 
-        self.scopes_at_depth[0] = 1
+    def enter_scope(self):
+        n = self.children_entered[-1]
+        self.children_entered[-1] += 1
 
-    def _add_cur_scope_symbols(self):
-        for symbol in self.symbols:
-            if symbol.scope_id == self.cur_scope:
-                self.stack[-1][symbol.name] = symbol
+        children = self.scope_children[self.cur_scope]
+        if n < len(children):
+            self.cur_scope = children[n]
+        else:
+            new_scope = len(self.scope_parent)
+            self.scope_parent.append(self.cur_scope)
+            self.scope_children.append([])
+            self.scope_names.append(f"{self.scope_names[self.cur_scope]}.{n + 1}")
+            self.scope_symbols.append({})
+            children.append(new_scope)
+            self.cur_scope = new_scope
 
-    def enter_scope(self):
         self.depth += 1
-        self.scopes_at_depth[self.depth] += 1
-        self.cur_scope += f".{self.scopes_at_depth[self.depth]}"
-        self.stack.append({})
-
-        self._add_cur_scope_symbols()
+        self.children_entered.append(0)
+        self.stack.append(self.scope_symbols[self.cur_scope])
 
     def leave_scope(self):
         self.depth -= 1
-        ind_of_dot = self.cur_scope.rfind(".")
-        self.cur_scope = self.cur_scope[:ind_of_dot]
-        self.scopes_at_depth[self.depth + 2] = 0
+        self.cur_scope = self.scope_parent[self.cur_scope]
+        self.children_entered.pop()
         self.stack.pop()
 
+    def scope_name(self, scope_id: int) -> str:
+        """The dotted name of a scope, like "1.2.1" """
+        return self.scope_names[scope_id]
+
+    def last_child_scope(self, scope_id: Optional[int] = None) -> Optional[int]:
+        """The scope most recently created directly inside scope_id
+        (the current scope by default)"""
+        if scope_id is None:
+            scope_id = self.cur_scope
+
+        children = self.scope_children[scope_id]
+        return children[-1] if children else None
+
     def add_if_not_exists(self, symbol: str) -> SymbolInfo:
-        if symbol in self.stack[-1]:
-            return self.stack[-1][symbol]
+        return self.add_to_scope(symbol, self.cur_scope)
 
-        new_symbol = SymbolInfo(symbol, self.cur_scope)
+    def add_to_scope(self, symbol: str, scope_id: int) -> SymbolInfo:
+        """Like add_if_not_exists, but in the given scope instead of the
+        current one"""
+        scope_symbols = self.scope_symbols[scope_id]
+        if symbol in scope_symbols:
+            return scope_symbols[symbol]
 
-        self.symbols.append(new_symbol)
-        self.stack[-1][symbol] = new_symbol
+        new_symbol = SymbolInfo(symbol, scope_id, self.next_uid)
+        self.next_uid += 1
+
+        self.symbols[new_symbol.uid] = new_symbol
+        scope_symbols[symbol] = new_symbol
 
         return new_symbol
 
     def remove_symbol(self, symbol: SymbolInfo):
-        self.symbols.remove(symbol)
-        for symtab_ in reversed(self.stack):
-            if symbol in symtab_:
-                symtab_.pop(symbol.name)
+        del self.symbols[symbol.uid]
+        scope_symbols = self.scope_symbols[symbol.scope_id]
+        if scope_symbols.get(symbol.name) is symbol:
+            scope_symbols.pop(symbol.name)
 
     def get_symbol(self, symbol: str) -> Optional[SymbolInfo]:
         """Finds the symbol in the closest symtab
@@ -213,57 +365,66 @@ class SymbolTable:
         sym.lineno = lineno
         sym.type_ = None
         sym.col_num = col_num
-        # TODO: infer type from value if not given
-        typename = None
+
+        if type_ is not None:
+            self.set_type(sym, type_, lineno)
+
+        if value is not None:
+            sym.value = value
+
+        if const is not None:
+            sym.const = const
+
+    def set_type(self, sym: SymbolInfo, type_, lineno):
+        """Set the type of sym from a TypeInfo, a type name or a syntree.Type
+
+        Prints an error if the type is not defined.
+        """
+        if isinstance(type_, TypeInfo):
+            sym.type_ = type_
+            return
+
+        # sym.storage = self.storage[type_.data]
+        valid_type = True
+        typename = ""
         composite_type = False
         eltype = None
 
-        if type_ is not None:
-            # sym.storage = self.storage[type_.data]
-            valid_type = True
-            typename = ""
-
-            # type_ can sometimes be syntree.Type
-            if hasattr(type_, "data") and hasattr(type_, "name"):
-                if type_.name == "BasicType":
-                    typename = type_.data
-                elif type_.name == "ARRAY" or type_.name == "SLICE":
-                    typename = type_.typename
-                    composite_type = True
-                    eltype = type_.eltype
-                else:
-                    print(f"Unknown node {type_}. Could not determine type")
-                    valid_type = False
-            elif isinstance(type_, str):
-                typename = type_
+        # type_ can sometimes be syntree.Type
+        if hasattr(type_, "data") and hasattr(type_, "name"):
+            if type_.name == "BasicType":
+                typename = type_.data
+            elif type_.name == "ARRAY" or type_.name == "SLICE":
+                typename = type_.typename
+                composite_type = True
+                eltype = type_.eltype
             else:
-                print(f"Could not determine type, issue in code. Found {type_}")
+                print(f"Unknown node {type_}. Could not determine type")
                 valid_type = False
+        elif isinstance(type_, str):
+            typename = type_
+        else:
+            print(f"Could not determine type, issue in code. Found {type_}")
+            valid_type = False
 
-            if valid_type:
-
-                if not self.type_table.is_defined(typename):
-                    print_error()
-                    print(f"Type '{typename}' is not defined at line {lineno}")
-                    print_line(lineno)
-
-                    line = utils.lines[lineno]
-                    pos = line.find(typename)
-                    width = len(typename)
+        if valid_type:
 
-                    print_marker(pos, width)
-                else:
-                    sym.type_ = self.type_table.get_type(typename)
+            if not self.type_table.is_defined(typename):
+                print_error()
+                print(f"Type '{typename}' is not defined at line {lineno}")
+                print_line(lineno)
 
-            # elif composite_type:
+                line = utils.source.line(lineno + 1)
+                pos = line.find(typename)
+                width = len(typename)
 
-            #     self.type_table.add_type(f"{typename}_{eltype}")
+                print_marker(pos, width)
+            else:
+                sym.type_ = self.type_table.get_type(typename)
 
-        if value is not None:
-            sym.value = value
+        # elif composite_type:
 
-        if const is not None:
-            sym.const = const
+        #     self.type_table.add_type(f"{typename}_{eltype}")
 
     def exists_in_cur_symtab(self, symbol: str) -> bool:
         return symbol in self.stack[-1]
@@ -294,7 +455,7 @@ class SymbolTable:
         with declaration set to given line number.
 
         Prints an error if the symbol is already declared at
-        current depth.
+        current depth. Returns True if the symbol was declared.
         """
         if self.is_declared_in_cur_symtab(symbol):
             print_error()
@@ -311,18 +472,22 @@ class SymbolTable:
 
             pos = other_sym.col_num - 1
             print_marker(pos, width)
-        else:
-            self.update_info(
-                symbol, lineno, col_num=col_num, type_=type_, const=const, value=value
-            )
+
+            return False
+
+        self.update_info(
+            symbol, lineno, col_num=col_num, type_=type_, const=const, value=value
+        )
+
+        return True
 
     def check_unused(self):
         func_type = self.type_table.get_type("FUNCTION")
 
-        for symbol in self.symbols:
+        for symbol in self.symbols.values():
             if (
                 symbol.uses == []
-                and symbol.scope_id != "1"
+                and symbol.scope_id != ROOT_SCOPE
                 and symbol.type_ != func_type
             ):
                 print_error("Unused variable", kind="ERROR")
@@ -344,30 +509,22 @@ class SymbolTable:
 
                 print("main function is not declared in a file with 'main' package")
 
+    def rows(self) -> list:
+        """Rows of the symbol table, as shown by str()"""
+        return [
+            [
+                symbol.name,
+                self.scope_names[symbol.scope_id],
+                symbol.lineno,
+                symbol.type_,
+                symbol.const,
+                symbol.value,
+                symbol.uses,
+            ]
+            for symbol in self.symbols.values()
+        ]
+
     def __str__(self):
-        return str(
-            tabulate(
-                [
-                    [
-                        symbol.name,
-                        symbol.scope_id,
-                        symbol.lineno,
-                        symbol.type_,
-                        symbol.const,
-                        symbol.value,
-                        symbol.uses,
-                    ]
-                    for symbol in self.symbols
-                ],
-                headers=[
-                    "Symbol",
-                    "Scope",
-                    "Line No.",
-                    "Type",
-                    "Const",
-                    "Value",
-                    "Uses",
-                ],
-                tablefmt="psql",
-            )
-        )
+        from tabulate import tabulate
+
+        return str(tabulate(self.rows(), headers=self.table_headers, tablefmt="psql"))
@@ -1,6 +1,5 @@
-from symbol_table import SymbolInfo
+from symbol_table import SymbolInfo, TypeInfo
 from typing import Any, Optional
-import traceback
 
 from go_lexer import symtab, type_table
 from utils import (
@@ -8,20 +7,27 @@ from utils import (
     print_line,
     print_line_marker_nowhitespace,
     print_marker,
-    lines,
 )
 
 
 class Node:
     """Node of an AST
 
+    Nodes use __slots__, and a field which is already stored in data or
+    in children is only exposed as a property, so it is not kept twice.
+
     Warning: pls don't change the children values after setting them
     for nodes which depend on it"""
 
-    def __init__(self, name, **kwargs):
+    __slots__ = ("name", "children", "data")
+
+    # signal the AST optimizer to not optimize the immediate children
+    _no_optim = False
+
+    def __init__(self, name, children, data=None):
         self.name = name
-        self.children: list = [c for c in kwargs["children"] if c is not None]
-        self.data = kwargs.get("data", None)
+        self.children: list = [c for c in children if c is not None]
+        self.data = data
 
     def __repr__(self):
         return str(self)
@@ -43,87 +49,44 @@ class Node:
 class BinOp(Node):
     """Node for binary operations"""
 
+    __slots__ = ("lineno", "type_")
+
     rel_ops = {"==", "!=", "<", ">", "<=", ">="}
     logical_ops = {"&&", "||"}
 
     def __init__(self, operator, left=None, right=None, lineno=None):
         super().__init__("Binary", children=[left, right], data=operator)
-        self.operator = self.data
-        self.left = left
-        self.right = right
         self.lineno = lineno
 
-        self.is_relop = self.operator in self.rel_ops
-        self.is_logical = self.operator in self.logical_ops
-
+        # set by check_types
         self.type_ = None
-        try:
-
-            def get_type(child: Node) -> str:
-
-                if isinstance(child, PrimaryExpr):
-                    if len(child.children) > 0 and isinstance(
-                            child.children[0], Index):
-                        x = symtab.get_symbol(child.data[1]).type_.eltype
-
-                    else:
-                        x = symtab.get_symbol(child.data[1]).type_.name
-
-                elif hasattr(child, "type_"):
-                    x = getattr(child, "type_")
-
-                else:
-                    raise Exception("Could not determine type of child", child)
-
-                return x
-
-            x = get_type(self.children[0])
-            y = get_type(self.children[1])
 
-            def check_type(x, y):
-                if x == "int":
-                    if y == "float64":
-                        self.type_ = "float64"
-                        return 1
+    @property
+    def operator(self):
+        return self.data
 
-                return 0
+    @property
+    def left(self):
+        return self.children[0]
 
-            if x != y:
-                val1 = check_type(x, y)
-                val2 = check_type(y, x)
-                if (not isinstance(self.children[0], Literal) and
-                        not isinstance(self.children[1],
-                                       Literal)) or not (val1 | val2):
-                    print_error(
-                        "Type Mismatch",
-                        kind="TYPE ERROR",
-                    )
-                    print(f"Cannot apply operation {self.operator}"
-                          f" on types {x} and {y}")
-                    print_line_marker_nowhitespace(self.lineno)
+    @property
+    def right(self):
+        return self.children[1]
 
-                if self.is_relop:
-                    self.type_ = "bool"
+    @property
+    def is_relop(self) -> bool:
+        return self.data in self.rel_ops
 
-            else:
-                if self.is_relop:
-                    self.type_ = "bool"
-
-                elif self.is_logical:
-                    if x == "bool":
-                        self.type_ = "bool"
-                    else:
-                        print_error("Invalid Operation", kind="Operation Error")
-
-                else:
-                    self.type_ = x
-        except Exception:
-            traceback.format_exc()
+    @property
+    def is_logical(self) -> bool:
+        return self.data in self.logical_ops
 
 
 class Assignment(BinOp):
     """Node for assignment operations"""
 
+    __slots__ = ()
+
     def __init__(self, operator, left=None, right=None, lineno=None):
         if isinstance(left, List) and len(left.children) == 1 and isinstance(left.children[0], PrimaryExpr):
             left_ = left.children[0]
@@ -139,25 +102,23 @@ class Assignment(BinOp):
 class UnaryOp(Node):
     """Node for unary operations"""
 
+    __slots__ = ("type_",)
+
     def __init__(self, operator, operand):
         if isinstance(operand, UnaryOp) and operand.operator is None:
             operand = operand.operand
 
         super().__init__("Unary", children=[operand], data=operator)
-        self.operand = operand
-        self.operator = operator
+        # set by check_types
         self.type_ = None
 
-        if hasattr(operand, "type_"):
-            self.type_ = operand.type_
-        else:
-            self.type_ = operand.data[0]
-
-        if self.type_ == "string":
-            print_error("Type Error", kind="Invalid Operation")
+    @property
+    def operator(self):
+        return self.data
 
-        if self.operator == '!' and self.type_ != "bool":
-            print_error("Type Error", kind="Invalid Operation")
+    @property
+    def operand(self):
+        return self.children[0]
 
 
 class PrimaryExpr(Node):
@@ -166,6 +127,8 @@ class PrimaryExpr(Node):
     Ref: https://golang.org/ref/spec#PrimaryExpr
     """
 
+    __slots__ = ("ident",)
+
     def __init__(self, operand, children=None):
         # small optimization for the case when PrimaryExpr
         # has children of [PrimaryExpr, something]
@@ -193,6 +156,8 @@ class PrimaryExpr(Node):
 class Literal(Node):
     """Node to store literals"""
 
+    __slots__ = ()
+
     def __init__(self, type_, value):
         children = []
         if isinstance(type_, Node):
@@ -203,8 +168,13 @@ class Literal(Node):
 
         super().__init__("LITERAL", children=children, data=(type_, value))
 
-        self.type_ = type_
-        self.value = value
+    @property
+    def type_(self):
+        return self.data[0]
+
+    @property
+    def value(self):
+        return self.data[1]
 
     def data_str(self):
         return f"type: {self.type_}, value: {self.value}"
@@ -216,6 +186,8 @@ class Literal(Node):
 class Import(Node):
     """Node to store imports"""
 
+    __slots__ = ()
+
     def __init__(self, pkg_name, import_path):
         # import_path is a STRING_LIT, so it has ("string", value)
         super().__init__("import", children=[], data=(pkg_name, import_path))
@@ -227,9 +199,12 @@ class Import(Node):
 class List(Node):
     """Node to store literals"""
 
+    __slots__ = ()
+
     def __init__(self, children):
         super().__init__("LIST", children=children)
-        self.append = self.add_child
+
+    append = Node.add_child
 
     def __iter__(self):
         return iter(self.children)
@@ -241,9 +216,14 @@ class List(Node):
 class Arguments(Node):
     """Node to store function arguments"""
 
+    __slots__ = ()
+
     def __init__(self, expression_list):
         super().__init__("arguments", children=[expression_list])
-        self.expression_list = expression_list
+
+    @property
+    def expression_list(self):
+        return self.children[0] if self.children else None
 
 
 class FunctionCall(Node):
@@ -251,22 +231,29 @@ class FunctionCall(Node):
 
     Is a part of PrimaryExpr in the grammar, but separated here"""
 
+    __slots__ = ("fn_sym", "type_")
+
     def __init__(self, fn_name: Any, arguments: Arguments):
         if (isinstance(fn_name, PrimaryExpr) and
                 isinstance(fn_name.data, tuple) and
                 fn_name.data[0] == "identifier"):
             fn_name = str(fn_name.data[1])
 
-        self.fn_name = fn_name
-        self.arguments = arguments
+        super().__init__("FunctionCall", children=[arguments], data=fn_name)
 
         self.fn_sym = symtab.get_symbol(str(fn_name))
         self.type_ = None
         if self.fn_sym is not None:
             if self.fn_sym.value is not None:
-                self.type_ = self.fn_sym.value.signature.ret_type
+                self.type_ = type_info(self.fn_sym.value.signature.ret_type)
 
-        super().__init__("FunctionCall", children=[arguments], data=fn_name)
+    @property
+    def fn_name(self):
+        return self.data
+
+    @property
+    def arguments(self):
+        return self.children[0] if self.children else None
 
     @staticmethod
     def get_fn_name(fn_name) -> str:
@@ -290,13 +277,12 @@ class FunctionCall(Node):
 class Signature(Node):
     """Node to store function signature"""
 
-    def __init__(self, parameters, result=None):
-        self.parameters = parameters
-        self.result = result
+    __slots__ = ("ret_type",)
 
+    def __init__(self, parameters, result=None):
         self.ret_type = None
-        if self.result is not None:
-            self.ret_type = get_typename(self.result)
+        if result is not None:
+            self.ret_type = get_typename(result)
 
         super().__init__("signature", children=[parameters, result])
 
@@ -304,16 +290,23 @@ class Signature(Node):
 class Function(Node):
     """Node to store function declaration"""
 
-    def __init__(self, name, signature, lineno: int, body=None):
+    __slots__ = ("scope_id", "body_scope_id")
+
+    def __init__(self,
+                 name,
+                 signature,
+                 lineno: int,
+                 body=None,
+                 scope_id: Optional[int] = None,
+                 body_scope_id: Optional[int] = None):
         super().__init__("FUNCTION",
                          children=[signature, body],
                          data=(name, lineno))
         self.data: tuple
 
-        self.fn_name = name
-        self.lineno = lineno
-        self.signature = signature
-        self.body = body
+        # scopes of the parameters and of the body
+        self.scope_id = scope_id
+        self.body_scope_id = body_scope_id
 
         if name is not None:
             symtab.update_info(name[1],
@@ -323,6 +316,22 @@ class Function(Node):
                                const=True,
                                value=self)
 
+    @property
+    def fn_name(self):
+        return self.data[0]
+
+    @property
+    def lineno(self) -> int:
+        return self.data[1]
+
+    @property
+    def signature(self) -> Signature:
+        return self.children[0]
+
+    @property
+    def body(self):
+        return self.children[1] if len(self.children) > 1 else None
+
     @staticmethod
     def add_func_to_symtab(name, lineno, value=None):
         symtab.declare_new_variable(name,
@@ -339,13 +348,22 @@ class Function(Node):
 class Keyword(Node):
     """Node to store a single keyword - like return, break, continue, etc."""
 
+    __slots__ = ("lineno",)
+
     def __init__(self, kw, ext=None, children=None, lineno=None):
-        self.kw = kw
-        self.ext = ext if ext is not None else ()
+        ext = ext if ext is not None else ()
         self.lineno = lineno
         children = [] if children is None else children
 
-        super().__init__(kw, children=children, data=(kw, *self.ext))
+        super().__init__(kw, children=children, data=(kw, *ext))
+
+    @property
+    def kw(self):
+        return self.data[0]
+
+    @property
+    def ext(self) -> tuple:
+        return self.data[1:]
 
     def data_str(self):
         return ""
@@ -354,31 +372,29 @@ class Keyword(Node):
 class Type(Node):
     """Parent class for all types"""
 
+    __slots__ = ()
+
 
 class Array(Type):
     """Node for an array type"""
 
+    __slots__ = ("type_info",)
+
     def __init__(self, eltype, length):
         super().__init__("ARRAY", children=[length], data=eltype)
-        eltype = eltype.data
-        self.eltype = eltype
-        self.length = length
-
-        # if hasattr(eltype, "type_"):
-        #     storage = self.length * type_table.get_type(eltype.type_).storage
-        # else:
-        #     storage = None
-        storage = self.length.value * type_table.get_type(eltype).storage
-
-        self.typename = f"ARRAY_{eltype}"
-        type_table.add_type(
-            self.typename,
-            lineno=None,
-            col_num=None,
-            storage=storage,
-            eltype=eltype,
-            check=False,
-        )
+        self.type_info = type_table.array_type(eltype.data, length.value)
+
+    @property
+    def eltype(self):
+        return self.data.data
+
+    @property
+    def length(self):
+        return self.children[0]
+
+    @property
+    def typename(self) -> str:
+        return self.type_info.name
 
     def data_str(self):
         return f"eltype: {self.eltype}"
@@ -387,19 +403,19 @@ class Array(Type):
 class Slice(Type):
     """Node for a slice type"""
 
+    __slots__ = ("type_info",)
+
     def __init__(self, eltype):
         super().__init__("SLICE", children=[], data=eltype)
-        eltype = eltype.data
-        self.eltype = eltype
-        self.typename = f"SLICE_{eltype}"
-        type_table.add_type(
-            self.typename,
-            lineno=None,
-            col_num=None,
-            storage=None,
-            eltype=eltype,
-            check=False,
-        )
+        self.type_info = type_table.slice_type(eltype.data)
+
+    @property
+    def eltype(self):
+        return self.data.data
+
+    @property
+    def typename(self) -> str:
+        return self.type_info.name
 
     def data_str(self):
         return f"eltype: {self.eltype}"
@@ -408,23 +424,38 @@ class Slice(Type):
 class Index(Node):
     """Node for array/slice indexing"""
 
+    __slots__ = ()
+
     def __init__(self, expr):
         super().__init__("INDEX", children=[expr], data=None)
 
-        self.expr = expr
+    @property
+    def expr(self):
+        return self.children[0]
 
 
 class Identifier(Node):
     """Node for identifiers"""
 
+    __slots__ = ()
+
     def __init__(self, ident_tuple, lineno):
         super().__init__("IDENTIFIER",
                          children=[],
                          data=(ident_tuple[1], lineno, ident_tuple[2]))
         # symtab.add_if_not_exists(ident_tuple[1])
-        self.ident_name = ident_tuple[1]
-        self.lineno = lineno
-        self.col_num = ident_tuple[2]
+
+    @property
+    def ident_name(self) -> str:
+        return self.data[0]
+
+    @property
+    def lineno(self):
+        return self.data[1]
+
+    @property
+    def col_num(self):
+        return self.data[2]
 
     def add_symtab(self):
         symtab.add_if_not_exists(self.ident_name)
@@ -436,6 +467,8 @@ class Identifier(Node):
 class QualifiedIdent(Node):
     """Node for qualified identifiers"""
 
+    __slots__ = ()
+
     def __init__(self, package_name, identifier):
         super().__init__("IDENTIFIER",
                          children=[],
@@ -448,17 +481,19 @@ class QualifiedIdent(Node):
 class VarDecl(Node):
     """Node to store one variable or const declaration"""
 
+    __slots__ = ("declared", "type_checked", "symbol")
+
     def __init__(self,
                  ident: Identifier,
                  type_=None,
                  value=None,
-                 const: bool = False):
-        self.ident = ident
-        self.type_ = type_
-        self.value = value
-        self.const = const
+                 const: bool = False,
+                 declared: bool = True):
+        # False if this is a re-declaration (the symbol is the old one)
+        self.declared = declared
+        self.type_checked = False
         self.symbol: Optional[SymbolInfo] = symtab.get_symbol(
-            self.ident.ident_name)
+            ident.ident_name)
 
         children = []
 
@@ -476,11 +511,32 @@ class VarDecl(Node):
                          children=children,
                          data=(ident, type_, value, const))
 
+    @property
+    def ident(self) -> Identifier:
+        return self.data[0]
+
+    @property
+    def type_(self):
+        return self.data[1]
+
+    @type_.setter
+    def type_(self, type_):
+        # set once, when the type is inferred by check_types
+        self.data = (self.data[0], type_, *self.data[2:])
+
+    @property
+    def value(self):
+        return self.data[2]
+
+    @property
+    def const(self) -> bool:
+        return self.data[3]
+
     def data_str(self):
         s = f"name: {self.ident.ident_name}"
 
         if not isinstance(self.type_, Node) and self.type_ is not None:
-            s += f", type: {self.type_}"
+            s += f", type: {type_name(self.type_)}"
 
         if not isinstance(self.value, Node) and self.value is not None:
             s += f", value: {self.value}"
@@ -490,13 +546,25 @@ class VarDecl(Node):
         return s
 
 
+# declarations whose type is inferred by check_types, in case some of them
+# are not in the final AST (dropped during error recovery)
+declarations: list = []
+
+
 def make_variable_decls(
     identifier_list: List,
     type_=None,
     expression_list: Optional[List] = None,
     const: bool = False,
+    reuse_identifier_list: bool = False,
 ):
-    var_list = List([])
+    """Declare the identifiers and return the List of their VarDecls
+
+    If reuse_identifier_list is set, the VarDecls replace the identifiers in
+    identifier_list, which is returned (when the identifier list is not kept
+    anywhere, so no new List is needed).
+    """
+    var_list = []
 
     if expression_list is None:
         # TODO: implement default values
@@ -514,52 +582,9 @@ def make_variable_decls(
         ident: Identifier
         expr: Node
 
-        orig_type = type_
-
+        # the type is inferred from the expression by check_types
         for ident, expr in zip(identifier_list, expression_list):
-            # type inference
-            inf_type = "unknown"
-            if isinstance(expr, BinOp) or isinstance(expr, UnaryOp):
-                inf_type = expr.type_
-                if type_ != None:
-                    inf_type = type_
-
-            elif isinstance(expr, Literal):
-                inf_type = expr.type_
-
-            elif isinstance(expr, PrimaryExpr):
-                if len(expr.children) > 0 and isinstance(
-                        expr.children[0], Index):
-                    inf_type = symtab.get_symbol(expr.data[1]).type_.eltype
-
-                else:
-                    inf_type = symtab.get_symbol(expr.data[1]).type_.name
-
-            else:
-                print("Could not determine type: ", ident, expr)
-
-            if inf_type is None:
-                inf_type = "unknown"
-
-            inf_typename = get_typename(inf_type)
-
-            # now check if the LHS and RHS types match
-            if type_ is None:
-                type_ = inf_type
-            else:
-                # get just the type name
-                typename = get_typename(type_)
-
-                if typename != inf_typename:
-                    # special case for literal
-                    if not isinstance(expr, Literal):
-                        print_error("Type Mismatch", kind="TYPE ERROR")
-                        print(
-                            f"Cannot use expression of type {inf_typename} as "
-                            f"assignment to type {typename}")
-                        print_line_marker_nowhitespace(ident.lineno)
-
-            symtab.declare_new_variable(
+            declared = symtab.declare_new_variable(
                 ident.ident_name,
                 ident.lineno,
                 ident.col_num,
@@ -568,34 +593,75 @@ def make_variable_decls(
                 const=const,
             )
 
-            var_list.append(VarDecl(ident, type_, expr, const))
-            type_ = orig_type
+            var_decl = VarDecl(ident, type_, expr, const, declared)
+            declarations.append(var_decl)
+            var_list.append(var_decl)
     else:
         raise NotImplementedError(
             "Declaration with unpacking not implemented yet")
 
-    return var_list
+    if reuse_identifier_list:
+        identifier_list.children[:] = var_list
+        return identifier_list
+
+    return List(var_list)
 
 
 class ParameterDecl(Node):
 
+    __slots__ = ("var_decl",)
+
     def __init__(self, type_, vararg=False, ident_list=None):
         super().__init__("PARAMETERS",
                          children=[type_, ident_list],
                          data=vararg)
-        self.type_ = type_
-        self.vararg = vararg
-        self.ident_list = ident_list
+        self.var_decl = None
         if ident_list is not None:
             self.var_decl = make_variable_decls(ident_list, type_=type_)
 
+    @property
+    def type_(self):
+        return self.children[0]
+
+    @property
+    def vararg(self) -> bool:
+        return self.data
+
+    @property
+    def ident_list(self):
+        return self.children[1] if len(self.children) > 1 else None
+
     def data_str(self):
         return f"is_vararg: {self.vararg}"
 
 
 class IfStmt(Node):
 
-    def __init__(self, body, expr, statement=None, next_=None, lineno=None):
+    # the children are consumed while generating the intermediate code, so
+    # the parts of the statement are stored separately
+    __slots__ = (
+        "statement",
+        "expr",
+        "body",
+        "next_",
+        "lineno",
+        "scope_id",
+        "body_scope_id",
+        "else_scope_id",
+    )
+
+    # signal the AST optimizer to not optimize these children
+    _no_optim = True
+
+    def __init__(self,
+                 body,
+                 expr,
+                 statement=None,
+                 next_=None,
+                 lineno=None,
+                 scope_id: Optional[int] = None,
+                 body_scope_id: Optional[int] = None,
+                 else_scope_id: Optional[int] = None):
         super().__init__("IF", children=[statement, expr, body, next_])
         self.statement = statement
         self.expr = expr
@@ -604,45 +670,43 @@ class IfStmt(Node):
 
         self.lineno = lineno
 
-        # signal the AST optimizer to not optimize these children
-        self._no_optim = True
-
-        if isinstance(self.expr, BinOp):
-            if self.expr.type_ != "bool":
-                print_error("Invalid operator in condition", kind="ERROR")
-                print("Cannot use non-boolean binary operator "
-                      f"{self.expr.operator}"
-                      " in a condition")
-                print_line_marker_nowhitespace(lineno)
-        elif hasattr(self.expr, "type_") and getattr(self.expr, "type_") != "bool":
-            print_error("Invalid condition", kind="TYPE ERROR")
-            print("Cannot use non-binary expression in condition")
-            print_line_marker_nowhitespace(lineno)
+        # scope of the statement and condition, of the body and of the
+        # else block (an else if has its own scopes)
+        self.scope_id = scope_id
+        self.body_scope_id = body_scope_id
+        self.else_scope_id = else_scope_id
 
 
 class ForStmt(Node):
 
-    def __init__(self, body, clause, lineno):
+    __slots__ = ("body", "clause", "lineno", "scope_id", "body_scope_id")
+
+    # signal the AST optimizer to not optimize these children
+    _no_optim = True
+
+    def __init__(self,
+                 body,
+                 clause,
+                 lineno,
+                 scope_id: Optional[int] = None,
+                 body_scope_id: Optional[int] = None):
         super().__init__("FOR", children=[body, clause])
         self.body = body
         self.clause = clause
         self.lineno = lineno
 
-        # signal the AST optimizer to not optimize these children
-        self._no_optim = True
-
-        if hasattr(clause, "type_") and getattr(clause, "type_") == "bool":
-            pass
-        elif isinstance(clause, ForClause):
-            pass
-        else:
-            print_error("Invalid condition", kind="TYPE ERROR")
-            print("Cannot use non-binary expression in for loop")
-            print_line_marker_nowhitespace(lineno)
+        # scope of the clause and of the body
+        self.scope_id = scope_id
+        self.body_scope_id = body_scope_id
 
 
 class ForClause(Node):
 
+    __slots__ = ("init", "cond", "post", "lineno")
+
+    # signal the AST optimizer to not optimize these children
+    _no_optim = True
+
     def __init__(self, init, cond, post, lineno):
         super().__init__("FOR_CLAUSE", children=[init, cond, post])
         self.init = init
@@ -650,17 +714,11 @@ class ForClause(Node):
         self.post = post
         self.lineno = lineno
 
-        # signal the AST optimizer to not optimize these children
-        self._no_optim = True
-
-        if hasattr(cond, "type_") and getattr(cond, "type_") != "bool":
-            print_error("Invalid condition", kind="TYPE ERROR")
-            print("Cannot use non-binary expression in for loop")
-            print_line_marker_nowhitespace(lineno)
-
 
 class RangeClause(Node):
 
+    __slots__ = ("ident_list", "expr_list", "var_decl")
+
     def __init__(self, expr, ident_list=None, expr_list=None):
         if ident_list is not None:
             self.var_decl = make_variable_decls(ident_list, expr)
@@ -668,47 +726,68 @@ class RangeClause(Node):
             self.var_decl = None
         super().__init__("RANGE",
                          children=[expr, ident_list, expr_list, self.var_decl])
-        self.expr = expr
         self.ident_list = ident_list
         self.expr_list = expr_list
 
+    @property
+    def expr(self):
+        return self.children[0]
+
 
 class Struct(Type):
 
+    __slots__ = ()
+
     def __init__(self, field_decl_list):
-        self.fields = []
+        fields = []
 
         for i in field_decl_list:
             i: StructFieldDecl
             if i.ident_list is not None:
                 for ident in i.ident_list:
                     ident: Identifier
-                    self.fields.append(
+                    fields.append(
                         StructField(ident.ident_name, i.type_, i.tag))
             elif i.embed_field is not None:
                 # TODO: handle pointer type here
-                self.fields.append(StructField(i.embed_field[1], None, i.tag))
+                fields.append(StructField(i.embed_field[1], None, i.tag))
+
+        super().__init__("Struct", children=fields)
 
-        super().__init__("Struct", children=self.fields)
+    @property
+    def fields(self) -> list:
+        return self.children
 
 
 class StructField(Node):
 
-    def __init__(self, name, type_, tag):
-        self.f_name = name
-        self.type_ = type_
-        self.tag = tag
+    __slots__ = ()
 
+    def __init__(self, name, type_, tag):
         super().__init__("StructField",
                          children=[type_],
                          data=(name, type_, tag))
 
+    @property
+    def f_name(self):
+        return self.data[0]
+
+    @property
+    def type_(self):
+        return self.data[1]
+
+    @property
+    def tag(self):
+        return self.data[2]
+
     def data_str(self):
         return f"name: {self.f_name}, type: {self.type_}, tag: {self.tag}"
 
 
 class StructFieldDecl:
 
+    __slots__ = ("ident_list", "embed_field", "type_", "tag")
+
     def __init__(self, ident_list_or_embed_field, type_=None, tag=None):
         if isinstance(ident_list_or_embed_field, List):
             self.ident_list = ident_list_or_embed_field
@@ -723,14 +802,21 @@ class StructFieldDecl:
 
 class TypeDef(Node):
 
-    def __init__(self, typename, type_: Type, type_table, lineno):
-        self.typename = typename
-        self.type_ = type_
+    __slots__ = ()
 
+    def __init__(self, typename, type_: Type, type_table, lineno):
         super().__init__(name="TypeDef", children=[type_], data=typename)
 
         type_table.add_type(typename[1], lineno, typename[2], None)
 
+    @property
+    def typename(self):
+        return self.data
+
+    @property
+    def type_(self) -> Type:
+        return self.children[0]
+
 
 def get_typename(type_) -> str:
     """Returns just the typename from given type"""
@@ -746,57 +832,400 @@ def get_typename(type_) -> str:
     raise Exception("Could not determine type from given:", type_)
 
 
-def _optimize(node: Node) -> Node:
-    num_list_childs = 0
+def type_info(type_) -> Optional[TypeInfo]:
+    """The TypeInfo of a type name, a Type node or a TypeInfo (None if the
+    type is not defined)
 
-    # a _no_optim attribute set to True signals this to not touch
-    # the node's immediate children. Deeper children are optimized anyway.
-    if not (hasattr(node, "_no_optim") and getattr(node, "_no_optim")):
-        for i, child in enumerate(node.children):
-            if isinstance(child, List):
-                num_list_childs += 1
+    The type table has a single TypeInfo for every type, so the types
+    returned can be compared with is.
+    """
+    if isinstance(type_, Array) or isinstance(type_, Slice):
+        return type_.type_info
+    if isinstance(type_, Type):
+        if isinstance(type_, Struct):
+            return None
+        return type_table.resolve(str(type_.data))
 
-                # if List has only one child, remove the list
-                if len(child) == 1:
-                    node.children[i] = child.children[0]
-                    if not isinstance(node.children[i], List):
-                        num_list_childs -= 1
+    return type_table.resolve(type_)
 
-        # if List has all List children, flatten out the nesting
-        if isinstance(node, List) and num_list_childs == len(node.children):
-            new_children = List([])
 
-            for child in node.children:
-                child: List
-                for child_child in child.children:
-                    new_children.append(child_child)
+def expr_type(node) -> Optional[TypeInfo]:
+    """The TypeInfo of an expression (None if it has no type)"""
+    return type_info(getattr(node, "type_", None))
 
-            node = new_children
 
-    for i, child in enumerate(node.children):
-        node.children[i] = _optimize(child)
+def type_name(type_) -> str:
+    """Name of a type, as shown in the errors"""
+    if isinstance(type_, TypeInfo):
+        return type_.name
+    return str(type_)
 
-    return node
+
+# The predefined types are the same TypeInfo objects from one file to the
+# next, expression types are compared with them by identity
+BOOL = type_table.get_type("bool")
+INT = type_table.get_type("int")
+FLOAT64 = type_table.get_type("float64")
+STRING = type_table.get_type("string")
+UNKNOWN = type_table.get_type("unknown")
+
+
+def _enter(node: Node, pre):
+    # a frame is [node, generator returned by pre, children, results]
+    gen = None
+    if pre is not None:
+        ret = pre(node)
+        if isinstance(ret, Node):
+            node = ret
+        elif ret is not None:
+            gen = ret
+
+    return [node, gen, None, []]
+
+
+def walk(root: Node, pre=None, post=None, children=None):
+    """Walk the tree under root depth first, without recursion
+
+    pre(node) is called when a node is reached, before its children are
+    walked. It can return:
+
+    - None, to walk the children of node
+    - another node, which is walked in place of node
+    - a generator. Every node it yields is walked (with pre and post) and
+      the result is sent back to it. The children of node are walked once
+      it is exhausted, so it can take some of them out of node.children.
+
+    post(node, results) is called after the children of node, with the
+    list of their results, and returns the result for node (node itself if
+    there is no post). The result for root is returned.
+
+    children(node) returns the nodes to walk under node, in order. By
+    default, these are node.children.
+
+    Deep trees (long else if chains, long a + b + c + ... expressions)
+    are walked in linear time and never hit the recursion limit.
+    """
+    stack = [_enter(root, pre)]
+    # result of the last subtree, for the generator which asked for it
+    sent = None
+
+    while True:
+        frame = stack[-1]
+        node, gen, kids, results = frame
+
+        if gen is not None:
+            try:
+                child = gen.send(sent)
+            except StopIteration:
+                frame[1] = None
+            else:
+                stack.append(_enter(child, pre))
+                sent = None
+                continue
+
+        if kids is None:
+            kids = frame[2] = node.children if children is None else children(node)
+
+        if len(results) < len(kids):
+            stack.append(_enter(kids[len(results)], pre))
+            sent = None
+            continue
+
+        result = node if post is None else post(node, results)
+
+        stack.pop()
+        if not stack:
+            return result
+
+        parent = stack[-1]
+        if parent[1] is not None:
+            sent = result
+        else:
+            parent[3].append(result)
+
+
+def _optimize_children(node: Node):
+    """Remove the Lists with a single child under node. node is modified in
+    place.
+
+    The parser builds the statements and declarations of a block in a single
+    flat List, so Lists don't have to be flattened here."""
+    # _no_optim set to True signals this to not touch the node's
+    # immediate children. Deeper children are optimized anyway.
+    if node._no_optim:
+        return
+
+    children = node.children
+    for i, child in enumerate(children):
+        # if List has only one child, remove the list
+        if isinstance(child, List) and len(child.children) == 1:
+            children[i] = child.children[0]
 
 
 def optimize_AST(ast: Node):
-    return _optimize(ast)
+    # bottom up, so the children of a node are optimized before it
+    walk(ast, post=lambda node, results: _optimize_children(node))
+    return ast
 
 
-def _postprocess(node: Node) -> Node:
+class _UnknownType(Exception):
+    """The type of an operand could not be determined"""
 
-    if isinstance(node, FunctionCall):
-        if node.type_ is None:
-            if node.fn_sym is not None:
-                if node.fn_sym.value is not None:
-                    node.type_ = node.fn_sym.value.signature.ret_type
 
-    for i, child in enumerate(node.children):
-        node.children[i] = _postprocess(child)
+def _operand_type(child: Node) -> Optional[TypeInfo]:
+    if isinstance(child, PrimaryExpr):
+        if child.ident is None or child.ident.type_ is None:
+            raise _UnknownType(child)
 
-    return node
+        if len(child.children) > 0 and isinstance(child.children[0], Index):
+            return type_table.resolve(child.ident.type_.eltype)
+        return child.ident.type_
+
+    elif hasattr(child, "type_"):
+        return expr_type(child)
+
+    raise _UnknownType(child)
+
+
+def _check_BinOp(node: BinOp):
+    try:
+        x = _operand_type(node.children[0])
+        y = _operand_type(node.children[1])
+    except _UnknownType:
+        return
+
+    def check_type(x, y):
+        if x is INT:
+            if y is FLOAT64:
+                node.type_ = FLOAT64
+                return 1
+
+        return 0
+
+    if x is not y:
+        val1 = check_type(x, y)
+        val2 = check_type(y, x)
+        if (not isinstance(node.children[0], Literal) and
+                not isinstance(node.children[1], Literal)) or not (val1 | val2):
+            print_error(
+                "Type Mismatch",
+                kind="TYPE ERROR",
+            )
+            print(f"Cannot apply operation {node.operator}"
+                  f" on types {type_name(x)} and {type_name(y)}")
+            print_line_marker_nowhitespace(node.lineno)
+
+        if node.is_relop:
+            node.type_ = BOOL
+
+    else:
+        if node.is_relop:
+            node.type_ = BOOL
+
+        elif node.is_logical:
+            if x is BOOL:
+                node.type_ = BOOL
+            else:
+                print_error("Invalid Operation", kind="Operation Error")
+
+        else:
+            node.type_ = x
+
+
+def _check_UnaryOp(node: UnaryOp):
+    if hasattr(node.operand, "type_"):
+        node.type_ = expr_type(node.operand)
+    else:
+        node.type_ = type_info(node.operand.data[0])
+
+    if node.type_ is STRING:
+        print_error("Type Error", kind="Invalid Operation")
+
+    if node.operator == '!' and node.type_ is not BOOL:
+        print_error("Type Error", kind="Invalid Operation")
+
+
+def _check_FunctionCall(node: FunctionCall):
+    # the function may have been called before its declaration was complete
+    if node.type_ is None:
+        if node.fn_sym is not None:
+            if node.fn_sym.value is not None:
+                node.type_ = type_info(node.fn_sym.value.signature.ret_type)
+
+
+def _check_VarDecl(node: VarDecl):
+    node.type_checked = True
+
+    expr = node.value
+    if not isinstance(expr, Node):
+        return
+
+    # type inference
+    inf_type = None
+    if isinstance(expr, BinOp) or isinstance(expr, UnaryOp):
+        # an operation is not checked against the declared type
+        if node.type_ is not None:
+            return
+        inf_type = expr.type_
+
+    elif isinstance(expr, Literal):
+        inf_type = expr_type(expr)
+
+    elif isinstance(expr, PrimaryExpr):
+        try:
+            inf_type = _operand_type(expr)
+        except _UnknownType:
+            if expr.ident is None and isinstance(expr.data, tuple):
+                print_error("Undeclared identifier", kind="TYPE ERROR")
+                print(f"Cannot infer a type from undeclared identifier {expr.data[1]}")
+                print_line_marker_nowhitespace(node.ident.lineno)
+
+            # the declared type (if any) is kept, and not checked against
+            if node.type_ is None:
+                node.type_ = UNKNOWN
+                if node.declared and node.symbol is not None:
+                    symtab.set_type(node.symbol, UNKNOWN, node.ident.lineno)
+            return
+
+    else:
+        print("Could not determine type: ", node.ident, expr)
+
+    if inf_type is None:
+        inf_type = UNKNOWN
+
+    # now check if the LHS and RHS types match
+    if node.type_ is None:
+        node.type_ = inf_type
+
+        if node.declared and node.symbol is not None:
+            symtab.set_type(node.symbol, inf_type, node.ident.lineno)
+    else:
+        if type_info(node.type_) is not inf_type:
+            # special case for literal
+            if not isinstance(expr, Literal):
+                print_error("Type Mismatch", kind="TYPE ERROR")
+                print(
+                    f"Cannot use expression of type {inf_type.name} as "
+                    f"assignment to type {get_typename(node.type_)}")
+                print_line_marker_nowhitespace(node.ident.lineno)
+
+
+def _check_IfStmt(node: IfStmt):
+    if isinstance(node.expr, BinOp):
+        if node.expr.type_ is not BOOL:
+            print_error("Invalid operator in condition", kind="ERROR")
+            print("Cannot use non-boolean binary operator "
+                  f"{node.expr.operator}"
+                  " in a condition")
+            print_line_marker_nowhitespace(node.lineno)
+    elif hasattr(node.expr, "type_") and expr_type(node.expr) is not BOOL:
+        print_error("Invalid condition", kind="TYPE ERROR")
+        print("Cannot use non-binary expression in condition")
+        print_line_marker_nowhitespace(node.lineno)
+
+
+def _check_ForStmt(node: ForStmt):
+    if expr_type(node.clause) is BOOL:
+        pass
+    elif isinstance(node.clause, ForClause):
+        pass
+    else:
+        print_error("Invalid condition", kind="TYPE ERROR")
+        print("Cannot use non-binary expression in for loop")
+        print_line_marker_nowhitespace(node.lineno)
+
+
+def _check_ForClause(node: ForClause):
+    if hasattr(node.cond, "type_") and expr_type(node.cond) is not BOOL:
+        print_error("Invalid condition", kind="TYPE ERROR")
+        print("Cannot use non-binary expression in for loop")
+        print_line_marker_nowhitespace(node.lineno)
+
+
+_type_checks = {
+    BinOp: _check_BinOp,
+    Assignment: _check_BinOp,
+    UnaryOp: _check_UnaryOp,
+    FunctionCall: _check_FunctionCall,
+    VarDecl: _check_VarDecl,
+    IfStmt: _check_IfStmt,
+    ForStmt: _check_ForStmt,
+    ForClause: _check_ForClause,
+}
+
+
+def _children_in_source_order(node: Node) -> list:
+    # Lists are built by right recursive rules, so they are stored last
+    # element first. The body of a for loop is stored before its clause.
+    if isinstance(node, List):
+        return node.children[::-1]
+    if isinstance(node, ForStmt):
+        return node.children[::-1]
+    return node.children
+
+
+def check_types(ast: Node) -> Node:
+    """Infer and check the types of all expressions and declarations
+
+    The tree is walked once, in source order, and every node is checked
+    after its children, so a declaration is typed before it is used.
+    Types are stored on the nodes (and on the declared symbols) and errors
+    are printed as they are found.
+    """
+    walk(ast, post=_check_node, children=_children_in_source_order)
+    check_declarations()
+
+    return ast
+
+
+def _check_node(node: Node, results: list):
+    check = _type_checks.get(type(node))
+    if check is not None:
+        check(node)
+
+
+def check_declarations():
+    """Type check the variable declarations left out of the AST (dropped
+    because of a syntax error), so that their symbols still get a type"""
+    for var_decl in declarations:
+        if not var_decl.type_checked:
+            walk(var_decl, post=_check_node, children=_children_in_source_order)
+    declarations.clear()
+
+
+def _postprocess_node(node: Node, results: list):
+    _check_node(node, results)
+    _optimize_children(node)
 
 
 def postprocess_AST(ast: Node):
-    ast = _postprocess(ast)
-    return _optimize(ast)
+    """Type check and optimize the AST in a single walk
+
+    Does the work of check_types and optimize_AST together. Every node is
+    type checked after its children, and only then are the Lists right under
+    it unwrapped, so the checks see the tree as it was parsed.
+    """
+    walk(ast, post=_postprocess_node, children=_children_in_source_order)
+    check_declarations()
+
+    return ast
+
+
+def _no_children(node: Node) -> list:
+    return []
+
+
+def postprocess_subtree(node: Node, shallow: bool = False) -> Node:
+    """Type check and optimize the subtree under node as postprocess_AST does
+    for the whole AST (without check_declarations)
+
+    If shallow is set, only node itself is done: its children are taken as
+    already type checked and optimized.
+    """
+    walk(
+        node,
+        post=_postprocess_node,
+        children=_no_children if shallow else _children_in_source_order,
+    )
+
+    return node
@@ -1,10 +1,9 @@
 import abc
+import marshal
 from collections import defaultdict
 
-from symbol_table import SymbolInfo
-from typing import Any, Dict, List, Optional, Tuple
-
-from tabulate import tabulate
+from symbol_table import ROOT_SCOPE, SymbolInfo
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 
 import syntree
 from go_lexer import symtab, type_table
@@ -17,7 +16,8 @@ class Quad:
         self.op1 = op1
         self.op2 = op2
         self.operator = operator
-        self.scope_id = symtab.cur_scope
+        # set by IntermediateCode when the quad is added to the code
+        self.scope_id: Optional[int] = None
 
     def __str__(self):
         return f"{self.dest} = {self.op1} {self.operator} {self.op2}"
@@ -29,9 +29,9 @@ class Quad:
 class Assign(Quad):
     """An assignment operation (to a single value)"""
 
-    def __init__(self, dest, value, scope_id="1"):
-        self.scope_id = scope_id
+    def __init__(self, dest, value, scope_id=None):
         super().__init__(dest, None, value, "=")
+        self.scope_id = scope_id
 
     def __str__(self):
         return f"{self.dest} = {self.op2}"
@@ -139,9 +139,11 @@ class Operand(metaclass=abc.ABCMeta):
 
 
 class TempVar(Operand):
-    def __init__(self, id: int, value: Any = None, type_: Any = None):
+    def __init__(
+        self, id: int, value: Any = None, type_: Any = None, scope_id=ROOT_SCOPE
+    ):
         self.__name = "t" + str(id)
-        self.symbol = symtab.add_if_not_exists(self.name)
+        self.symbol = symtab.add_to_scope(self.name, scope_id)
         self.symbol.const_flag = True if value is not None else False
         self.symbol.value = value
         self.symbol.type_ = type_
@@ -183,16 +185,11 @@ class TempVar(Operand):
         return f"<Temp {self.name}>"
 
     def __hash__(self):
-        return hash(self.symbol.name + self.symbol.scope_id)
+        return self.symbol.uid
 
     def __eq__(self, other):
         if isinstance(other, ActualVar):
-            if (
-                self.symbol.name == other.symbol.name
-                and self.symbol.scope_id == self.symbol.scope_id
-            ):
-                return True
-            return False
+            return self.symbol is other.symbol
         return False
 
 
@@ -242,16 +239,11 @@ class ActualVar(Operand):
         self.symbol.type_ = value
 
     def __hash__(self):
-        return hash(self.symbol.name + self.symbol.scope_id)
+        return self.symbol.uid
 
     def __eq__(self, other):
         if isinstance(other, ActualVar):
-            if (
-                self.symbol.name == other.symbol.name
-                and self.symbol.scope_id == self.symbol.scope_id
-            ):
-                return True
-            return False
+            return self.symbol is other.symbol
         return False
 
     def __repr__(self):
@@ -262,20 +254,37 @@ class IntermediateCode:
     def __init__(self):
         self.code_list: List[Quad] = []
         self.temp_var_count = 0
-        self.label_prefix_counts: Dict[str, int] = defaultdict(lambda: 0)
+        self.label_prefix_counts: Dict[str, int] = defaultdict(int)
         self.label_map: Dict[str, Label] = {}
         self.loop_stack: List[Tuple[str, str]] = []
+        # scopes (recorded on the AST by the parser) that the code being
+        # generated is in
+        self.scope_stack: List[int] = [ROOT_SCOPE]
 
         # BUILT-IN functions (or labels)
         self._add_label(self.get_fn_label("fmt__Println"))
         self._add_label(self.get_fn_label("fmt__Printf"))
         self._add_label(self.get_fn_label("fmt__Print"))
 
+    @property
+    def cur_scope(self) -> int:
+        return self.scope_stack[-1]
+
+    def enter_scope(self, scope_id: Optional[int]):
+        """Generate the following code in scope_id
+        (or in the current scope, if it is None)"""
+        self.scope_stack.append(self.cur_scope if scope_id is None else scope_id)
+
+    def leave_scope(self):
+        self.scope_stack.pop()
+
     def get_new_temp_var(self, value: Any = None):
         self.temp_var_count += 1
-        return TempVar(self.temp_var_count, value)
+        return TempVar(self.temp_var_count, value, scope_id=self.cur_scope)
 
     def add_to_list(self, code: Quad):
+        if code.scope_id is None:
+            code.scope_id = self.cur_scope
         self.code_list.append(code)
 
     # generating labels
@@ -302,7 +311,7 @@ class IntermediateCode:
 
         label = self._add_label(label_name, len(self.code_list))
 
-        self.code_list.append(label)
+        self.add_to_list(label)
 
         return label
 
@@ -353,6 +362,8 @@ class IntermediateCode:
             print(i)
 
     def __str__(self) -> str:
+        from tabulate import tabulate
+
         return str(
             tabulate(
                 [
@@ -365,6 +376,156 @@ class IntermediateCode:
         )
 
 
+# Compact form of the intermediate code
+#
+# Quads and their operands are converted to tuples of strings and numbers so
+# that the code can be sent to another process (or saved) without pickling the
+# Quad/TempVar/SymbolInfo object graphs.
+#
+# A packed operand is None or (kind, text, typename) where kind is one of
+# "t" (TempVar), "v" (ActualVar), "l" (Literal) or "c" (anything else).
+# A packed quad is (quad class, dest, op1, operator, op2, scope_id).
+
+_packed_quad_classes = (
+    Quad,
+    Assign,
+    Label,
+    GoTo,
+    Call,
+    ConditionalGoTo,
+    Single,
+    Double,
+)
+_packed_quad_class_ids = {cls: i for i, cls in enumerate(_packed_quad_classes)}
+
+
+def _type_name(type_) -> Optional[str]:
+    if type_ is None:
+        return None
+    return str(getattr(type_, "name", type_))
+
+
+def _pack_operand(op):
+    if op is None:
+        return None
+    if isinstance(op, TempVar):
+        return ("t", op.name, _type_name(op.type_))
+    if isinstance(op, ActualVar):
+        return ("v", op.name, _type_name(op.type_))
+    if isinstance(op, syntree.Literal):
+        return ("l", str(op), _type_name(op.type_))
+    return ("c", str(op), None)
+
+
+class PackedQuad(NamedTuple):
+    """A quad as stored by pack_ic, printed like the original quad"""
+
+    cls: int
+    dest: Optional[tuple]
+    op1: Optional[tuple]
+    operator: Any
+    op2: Optional[tuple]
+    scope_id: int
+
+    @staticmethod
+    def _text(op) -> str:
+        return "None" if op is None else op[1]
+
+    def __str__(self):
+        cls = _packed_quad_classes[self.cls]
+        dest, op1, op2 = self._text(self.dest), self._text(self.op1), self._text(self.op2)
+
+        if cls is Assign:
+            return f"{dest} = {op2}"
+        elif cls is Label:
+            return f"LABEL {dest}:"
+        elif cls is GoTo:
+            return f"goto {dest}"
+        elif cls is Call:
+            return f"{dest} = call {op2}"
+        elif cls is ConditionalGoTo:
+            if self.op2 is None:
+                return f"if {op1} goto {dest}"
+            return f"if {op1} goto {dest} else goto {op2}"
+        elif cls is Single:
+            return str(self.operator)
+        elif cls is Double:
+            if self.dest is None:
+                return f"{self.operator} {op2}"
+            return f"{dest} = {self.operator} {op2}"
+
+        return f"{dest} = {op1} {self.operator} {op2}"
+
+
+def pack_ic(ic: IntermediateCode) -> bytes:
+    """Serialize the code list of ic into a compact byte string"""
+    return marshal.dumps(
+        [
+            (
+                _packed_quad_class_ids.get(type(q), 0),
+                _pack_operand(q.dest),
+                _pack_operand(q.op1),
+                q.operator,
+                _pack_operand(q.op2),
+                q.scope_id,
+            )
+            for q in ic.code_list
+        ]
+    )
+
+
+def unpack_ic(data: bytes) -> List[PackedQuad]:
+    """Read back the code list written by pack_ic"""
+    return [PackedQuad(*q) for q in marshal.loads(data)]
+
+
+# code generation functions for each class of node, called before (pre) and
+# after (post) the children of a node are walked
+_pre_handlers: Dict[type, Callable] = {}
+_post_handlers: Dict[type, Callable] = {}
+
+# (pre, post) functions for every class of node seen so far. A node which
+# has no function of its own uses the one of its nearest parent class.
+_dispatch: Dict[type, Tuple[Optional[Callable], Optional[Callable]]] = {}
+
+
+def pre_handler(node_class: type):
+    """Register the decorated function to be called before the children of
+    nodes of node_class"""
+
+    def register(fn: Callable) -> Callable:
+        _pre_handlers[node_class] = fn
+        _dispatch.clear()
+        return fn
+
+    return register
+
+
+def post_handler(node_class: type):
+    """Register the decorated function to be called after the children of
+    nodes of node_class"""
+
+    def register(fn: Callable) -> Callable:
+        _post_handlers[node_class] = fn
+        _dispatch.clear()
+        return fn
+
+    return register
+
+
+def _resolve_handlers(node_class: type):
+    pre = next(
+        (_pre_handlers[c] for c in node_class.__mro__ if c in _pre_handlers), None
+    )
+    post = next(
+        (_post_handlers[c] for c in node_class.__mro__ if c in _post_handlers), None
+    )
+    _dispatch[node_class] = (pre, post)
+
+    return pre, post
+
+
+@post_handler(syntree.Assignment)
 def tac_Assignment(
     ic: IntermediateCode,
     node: syntree.Assignment,
@@ -383,6 +544,7 @@ def tac_Assignment(
     return_val.append(node)
 
 
+@post_handler(syntree.BinOp)
 def tac_BinOp(
     ic: IntermediateCode,
     node: syntree.BinOp,
@@ -392,7 +554,7 @@ def tac_BinOp(
     temp = ic.get_new_temp_var()
     temp.type_ = node.type_
 
-    # the children can be temporaries made in the _recur_codegen call above
+    # the children can be temporaries made while walking the children
     # so they are stored in new_children which is used here
     # each return value is a list, so the second [0] is needed
     ic.add_to_list(Quad(temp, new_children[0][0], new_children[1][0], node.operator))
@@ -400,6 +562,7 @@ def tac_BinOp(
     return_val.append(temp)
 
 
+@post_handler(syntree.UnaryOp)
 def tac_UnaryOp(
     ic: IntermediateCode,
     node: syntree.UnaryOp,
@@ -424,6 +587,7 @@ def tac_UnaryOp(
         return_val.append(temp)
 
 
+@post_handler(syntree.Literal)
 def tac_Literal(
     ic: IntermediateCode,
     node: syntree.Literal,
@@ -449,6 +613,7 @@ def tac_Literal(
             return_val.append(new_children[0][0])
 
 
+@post_handler(syntree.Keyword)
 def tac_Keyword(
     ic: IntermediateCode,
     node: syntree.Keyword,
@@ -471,6 +636,7 @@ def tac_Keyword(
     return_val.append(node)
 
 
+@post_handler(syntree.PrimaryExpr)
 def tac_PrimaryExpr(
     ic: IntermediateCode,
     node: syntree.PrimaryExpr,
@@ -492,7 +658,7 @@ def tac_PrimaryExpr(
             ident: Optional[SymbolInfo] = node.ident
 
             base_addr_t = ic.get_new_temp_var()
-            base_addr_t.type_ = "int"
+            base_addr_t.type_ = syntree.INT
             ic.add_to_list(Assign(base_addr_t, f"base({arr_name})"))
             # return_val.append(base_addr_t)
 
@@ -503,15 +669,15 @@ def tac_PrimaryExpr(
                 )
 
                 offset_t = ic.get_new_temp_var()
-                offset_t.type_ = "int"
+                offset_t.type_ = syntree.INT
                 ic.add_to_list(Quad(offset_t, ind, width, "*"))
 
                 index_t = ic.get_new_temp_var()
-                index_t.type_ = "int"
+                index_t.type_ = syntree.INT
                 ic.add_to_list(Quad(index_t, base_addr_t, offset_t, "+"))
 
                 res_t = ic.get_new_temp_var()
-                res_t.type_ = ident.type_.eltype
+                res_t.type_ = type_table.resolve(ident.type_.eltype)
                 ic.add_to_list(Quad(res_t, arr_name, index_t, "[]"))
 
                 return_val.append(res_t)
@@ -537,7 +703,7 @@ def tac_PrimaryExpr(
 
         # temp1 = ic.get_new_temp_var()
         base_addr_t = ic.get_new_temp_var()
-        base_addr_t.type_ = "int"
+        base_addr_t.type_ = syntree.INT
         ic.add_to_list(Assign(base_addr_t, f"base({arr_name})"))
         return_val.append(base_addr_t)
 
@@ -552,6 +718,7 @@ def tac_PrimaryExpr(
         return_val.append(node)
 
 
+@post_handler(syntree.Index)
 def tac_Index(
     ic: IntermediateCode,
     node: syntree.Index,
@@ -561,6 +728,7 @@ def tac_Index(
     return_val.append(new_children[0])
 
 
+@pre_handler(syntree.VarDecl)
 def tac_pre_VarDecl(ic: IntermediateCode, node: syntree.VarDecl):
     if len(node.children) > 1 and isinstance(node.children[1], syntree.BinOp):
         op = node.children[1]
@@ -572,14 +740,14 @@ def tac_pre_VarDecl(ic: IntermediateCode, node: syntree.VarDecl):
                 )
                 node.children.remove(op)
             elif isinstance(op.children[1], syntree.PrimaryExpr):
-                right = _recur_codegen(op.children[1], ic)[0]
+                right = (yield op.children[1])[0]
                 ic.add_to_list(
                     Quad(ActualVar(node.symbol), op.left, right, op.operator)
                 )
                 node.children.remove(op)
 
         elif isinstance(op.children[0], syntree.PrimaryExpr):
-            left = _recur_codegen(op.children[0], ic)[0]
+            left = (yield op.children[0])[0]
 
             if isinstance(op.right, syntree.Literal):
                 ic.add_to_list(
@@ -588,11 +756,12 @@ def tac_pre_VarDecl(ic: IntermediateCode, node: syntree.VarDecl):
                 node.children.remove(op)
 
             elif isinstance(op.children[1], syntree.PrimaryExpr):
-                right = _recur_codegen(op.children[1], ic)[0]
+                right = (yield op.children[1])[0]
                 ic.add_to_list(Quad(ActualVar(node.symbol), left, right, op.operator))
                 node.children.remove(op)
 
 
+@post_handler(syntree.VarDecl)
 def tac_VarDecl(
     ic: IntermediateCode,
     node: syntree.VarDecl,
@@ -605,6 +774,7 @@ def tac_VarDecl(
         return_val.append(node.ident.ident_name)
 
 
+@post_handler(syntree.List)
 def tac_List(
     ic: IntermediateCode,
     node: syntree.List,
@@ -614,15 +784,16 @@ def tac_List(
     return_val.extend(new_children)
 
 
+@pre_handler(syntree.Function)
 def tac_pre_Function(ic: IntermediateCode, node: syntree.Function):
-    symtab.enter_scope()
-    symtab.enter_scope()
+    ic.enter_scope(node.body_scope_id)
 
     fn_name = syntree.FunctionCall.get_fn_name(node.fn_name)
     fn_label = ic.get_fn_label(fn_name)
     ic.add_label(fn_label)
 
 
+@post_handler(syntree.Function)
 def tac_Function(
     ic: IntermediateCode,
     node: syntree.Function,
@@ -633,10 +804,10 @@ def tac_Function(
     fn_label = ic.get_fn_end_label(fn_name)
     ic.add_label(fn_label)
 
-    symtab.leave_scope()
-    symtab.leave_scope()
+    ic.leave_scope()
 
 
+@post_handler(syntree.Arguments)
 def tac_Arguments(
     ic: IntermediateCode,
     node: syntree.Arguments,
@@ -658,6 +829,7 @@ def tac_Arguments(
             return_val.append(child[0])
 
 
+@post_handler(syntree.FunctionCall)
 def tac_FunctionCall(
     ic: IntermediateCode,
     node: syntree.FunctionCall,
@@ -671,11 +843,12 @@ def tac_FunctionCall(
     return_val.append(temp)
 
 
+@pre_handler(syntree.IfStmt)
 def tac_pre_IfStmt(
     ic: IntermediateCode,
     node: syntree.IfStmt,
 ):
-    symtab.enter_scope()
+    ic.enter_scope(node.scope_id)
 
     # there can be a statement to be executed just before
     # the condition. specified as "if a := 10; a > 5 {...}"
@@ -683,7 +856,7 @@ def tac_pre_IfStmt(
     # it from the children
     before_statement = node.statement
     if before_statement is not None:
-        _recur_codegen(before_statement, ic)
+        yield before_statement
         node.children.remove(before_statement)
 
     # we'll process the condition here
@@ -691,9 +864,9 @@ def tac_pre_IfStmt(
     condition = node.expr
     node.children.remove(condition)
 
-    condition_res = _recur_codegen(condition, ic)[0]
+    condition_res = (yield condition)[0]
 
-    symtab.enter_scope()
+    ic.enter_scope(node.body_scope_id)
 
     # now add the actual if statement
     true_label = ic.get_new_increment_label("if_true")
@@ -705,25 +878,26 @@ def tac_pre_IfStmt(
     # now the body (after true label)
     body = node.body
     node.children.remove(body)
-    _recur_codegen(body, ic)
+    yield body
     # false label after body
     ic.add_label(false_label)
 
-    symtab.leave_scope()
+    ic.leave_scope()
 
     # else part
     next_ = node.next_
     if next_ is not None:
-        symtab.enter_scope()
+        ic.enter_scope(node.else_scope_id)
 
         node.children.remove(next_)
-        _recur_codegen(next_, ic)
+        yield next_
 
-        symtab.leave_scope()
+        ic.leave_scope()
 
-    symtab.leave_scope()
+    ic.leave_scope()
 
 
+@post_handler(syntree.IfStmt)
 def tac_IfStmt(
     ic: IntermediateCode,
     node: syntree.IfStmt,
@@ -733,10 +907,11 @@ def tac_IfStmt(
     pass
 
 
+@pre_handler(syntree.ForStmt)
 def tac_pre_ForStmt(ic: IntermediateCode, node: syntree.ForStmt):
-    symtab.enter_scope()
+    ic.enter_scope(node.scope_id)
 
-    if hasattr(node.clause, "type_") and getattr(node.clause, "type_") == "bool":
+    if syntree.expr_type(node.clause) is syntree.BOOL:
         # start of loop
         start_label = ic.get_new_increment_label("for_simple_start")
         ic.add_label(start_label)
@@ -745,12 +920,12 @@ def tac_pre_ForStmt(ic: IntermediateCode, node: syntree.ForStmt):
         condition = node.clause
         node.children.remove(condition)
 
-        condition_res = _recur_codegen(condition, ic)[0]
+        condition_res = (yield condition)[0]
 
         true_label = ic.get_new_increment_label("for_simple_true")
         end_label = ic.get_new_increment_label("for_simple_end")
 
-        symtab.enter_scope()
+        ic.enter_scope(node.body_scope_id)
 
         # actual if else
         g1 = ConditionalGoTo(true_label, condition_res, end_label)
@@ -763,7 +938,7 @@ def tac_pre_ForStmt(ic: IntermediateCode, node: syntree.ForStmt):
         body = node.body
         if body is not None:
             node.children.remove(body)
-            _recur_codegen(body, ic)
+            yield body
         # loop back to start label
         ic.add_goto(start_label)
         # end label after body
@@ -776,7 +951,7 @@ def tac_pre_ForStmt(ic: IntermediateCode, node: syntree.ForStmt):
 
         # init statement (first part of for)
         if clause.init is not None:
-            _recur_codegen(clause.init, ic)
+            yield clause.init
             clause.children.remove(clause.init)
 
         # start of loop (just before condition)
@@ -786,12 +961,12 @@ def tac_pre_ForStmt(ic: IntermediateCode, node: syntree.ForStmt):
         # the condition
         condition = clause.cond
         clause.children.remove(condition)
-        condition_res = _recur_codegen(condition, ic)[0]
+        condition_res = (yield condition)[0]
 
         true_label = ic.get_new_increment_label("for_cmpd_true")
         end_label = ic.get_new_increment_label("for_cmpd_end")
 
-        symtab.enter_scope()
+        ic.enter_scope(node.body_scope_id)
 
         # actual if else
         g1 = ConditionalGoTo(true_label, condition_res, end_label)
@@ -804,10 +979,10 @@ def tac_pre_ForStmt(ic: IntermediateCode, node: syntree.ForStmt):
         body = node.body
         if body is not None:
             node.children.remove(body)
-            _recur_codegen(body, ic)
+            yield body
         # the post statement (increment/decrement)
         if clause.post is not None:
-            _recur_codegen(clause.post, ic)
+            yield clause.post
             clause.children.remove(clause.post)
         # loop back to start label
         ic.add_goto(start_label)
@@ -818,61 +993,62 @@ def tac_pre_ForStmt(ic: IntermediateCode, node: syntree.ForStmt):
 
     else:
         print("Could not determine clause type")
+        ic.enter_scope(node.body_scope_id)
 
-    symtab.leave_scope()
+    ic.leave_scope()
 
 
+@post_handler(syntree.ForStmt)
 def tac_ForStmt(
     ic: IntermediateCode,
     node: syntree.ForStmt,
     new_children: List[List[Any]],
     return_val: List[Any],
 ):
-    symtab.leave_scope()
-
-
-ignored_nodes = {"Identifier", "Type", "Array"}
-
-
-def _recur_codegen(node: syntree.Node, ic: IntermediateCode):
-    # process all child nodes before parent
-    # ast is from right to left, so need to traverse in reverse order
+    ic.leave_scope()
 
-    node_class_name = node.__class__.__name__
 
-    # call TAC functions before processing children
-    # these have the prefix tac_pre_
-    tac_pre_fn_name = f"tac_pre_{node_class_name}"
-    if tac_pre_fn_name in globals():
-        globals()[tac_pre_fn_name](ic, node)
+def _codegen(node: syntree.Node, ic: IntermediateCode) -> List[Any]:
+    """Generate the code for the subtree under node
 
-    # recurse over children
-    new_children = []
-    for child in reversed(node.children):
-        new_children.append(_recur_codegen(child, ic))
-    new_children.reverse()
+    Returns the list of values the subtree evaluates to.
+    """
 
-    return_val = []
+    # call the pre function before processing children
+    # it generates the code for the parts of the node that have to be
+    # placed around its children (conditions, bodies of loops, etc.) by
+    # yielding them, and gets back their return values
+    def pre(node: syntree.Node):
+        node_class = node.__class__
+        handlers = _dispatch.get(node_class) or _resolve_handlers(node_class)
+        if handlers[0] is not None:
+            return handlers[0](ic, node)
+        return None
 
-    # call appropriate TAC functions after processing children
+    # call the post function after processing children
     # at this point, the children are already in the IC
-    tac_fn_name = f"tac_{node_class_name}"
-    if tac_fn_name in globals():
-        globals()[tac_fn_name](ic, node, new_children, return_val)
+    def post(node: syntree.Node, new_children: List[List[Any]]):
+        # ast is from right to left, so the children are walked in
+        # reverse order
+        new_children.reverse()
 
-    elif node_class_name in ignored_nodes:
-        return_val.append(node)
+        return_val = []
 
-    else:
+        node_class = node.__class__
+        handler = (_dispatch.get(node_class) or _resolve_handlers(node_class))[1]
+        if handler is not None:
+            handler(ic, node, new_children, return_val)
+        else:
+            return_val.append(node)
 
-        return_val.append(node)
+        return return_val
 
-    return return_val
+    return syntree.walk(node, pre, post, children=lambda node: node.children[::-1])
 
 
 def intermediate_codegen(ast: syntree.Node) -> IntermediateCode:
     ic = IntermediateCode()
 
-    _recur_codegen(ast, ic)
+    _codegen(ast, ic)
 
     return ic
@@ -1,8 +1,15 @@
-from typing import List
-from collections import defaultdict
+"""Visualize the AST in Graphviz/dot format
+
+The dot file is written while walking the tree (level by level), so no graph
+object is built in memory and no external library is needed. Graphviz itself
+is only run if a picture is requested.
+"""
+import subprocess
+from collections import defaultdict, deque
+from typing import Optional, TextIO
+
 from syntree import Node
 import syntree
-import pydot
 
 
 def get_node_name(node: Node, cache: defaultdict):
@@ -13,125 +20,160 @@ def get_node_label(node: Node, cache: defaultdict):
     return f"{node.name}\n{node.data_str()}"
 
 
-def _recur_draw(graph: pydot.Graph, cache: defaultdict, node: Node, rank: int = 0):
-    # cache[node.name] += 1
-
-    node_name = get_node_name(node, cache)
-    # graph.add_node(pydot.Node(node_name, label=node_name, color="blue"))
-
-    children: List[pydot.Node] = []
-
-    for child in node.children:
-        cache[child.name] += 1
+def get_node_colors(node: Node):
+    """Returns the fill color and border color of a node"""
+    if isinstance(node, syntree.List):
+        return "gray", "black"
 
-        child_name = get_node_name(child, cache)
-        child_label = get_node_label(child, cache)
+    elif isinstance(node, syntree.IfStmt) or isinstance(node, syntree.ForStmt):
+        return "coral", "blue"
 
-        fillcolor = "turquoise"
-        color = "red"
+    elif isinstance(node, syntree.Identifier) or isinstance(
+        node, syntree.QualifiedIdent
+    ):
+        return "lightpink", "red"
 
-        if isinstance(child, syntree.List):
-            fillcolor = "gray"
-            color = "black"
+    elif isinstance(node, syntree.Function):
+        return "palegreen", "blue"
 
-        elif isinstance(child, syntree.IfStmt) or isinstance(child, syntree.ForStmt):
-            fillcolor = "coral"
-            color = "blue"
+    elif isinstance(node, syntree.Literal):
+        return "thistle", "purple"
 
-        elif isinstance(child, syntree.Identifier) or isinstance(
-            child, syntree.QualifiedIdent
-        ):
-            fillcolor = "lightpink"
-            color = "red"
+    elif isinstance(node, syntree.BinOp) or isinstance(node, syntree.UnaryOp):
+        return "lightyellow", "orange"
 
-        elif isinstance(child, syntree.Function):
-            fillcolor = "palegreen"
-            color = "blue"
+    elif isinstance(node, syntree.Keyword):
+        return "lightblue", "navy"
 
-        elif isinstance(child, syntree.Literal):
-            fillcolor = "thistle"
-            color = "purple"
+    elif isinstance(node, syntree.FunctionCall):
+        return "orange", "red"
 
-        elif isinstance(child, syntree.BinOp) or isinstance(child, syntree.UnaryOp):
-            fillcolor = "lightyellow"
-            color = "orange"
+    return "turquoise", "red"
 
-        elif isinstance(child, syntree.Keyword):
-            fillcolor = "lightblue"
-            color = "navy"
 
-        elif isinstance(child, syntree.FunctionCall):
-            fillcolor = "orange"
-            color = "red"
-
-        child_node = pydot.Node(
-            child_name,
-            label=child_label,
-            group=node_name,
-            fillcolor=fillcolor,
-            color=color,
-        )
-        graph.add_node(child_node)
-        children.append(child_node)
+def quote(s: str) -> str:
+    """Quote a string as a dot ID"""
+    s = str(s).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{s}"'
 
-        graph.add_edge(pydot.Edge(node_name, child_name, weight=1.5))
 
-        _recur_draw(graph, cache, child, rank + 1)
+def write_node(out: TextIO, name: str, **attrs):
+    attr_str = ", ".join(f"{key}={quote(value)}" for key, value in attrs.items())
+    out.write(f"{quote(name)} [{attr_str}];\n")
 
-    # for child in node.children:
 
-    # for child in node.children:
-    # child_name = f"{child.name}_{cache[child.name]}"
+def write_edge(out: TextIO, src: str, dest: str, **attrs):
+    attr_str = ", ".join(f"{key}={quote(value)}" for key, value in attrs.items())
+    out.write(f"{quote(src)} -> {quote(dest)} [{attr_str}];\n")
 
-    # graph.add_edge(pydot.Edge(
 
-    # invis_nodes: List[pydot.Node] = []
-    # for i in range(0, len(node.children) + 1):
-    #     cache["invis"] += 1
-    #     invis_node = pydot.Node(
-    #         f"invis_{cache['invis']}", shape="point", width=0, height=0, rank=rank
-    #     )
+def count_nodes(node: Node) -> int:
+    """Number of nodes in the subtree under node (including it)"""
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
 
-    #     graph.add_node(invis_node)
+    return count
 
-    #     invis_nodes.append(invis_node)
 
-    # graph.add_edge(pydot.Edge(node_name, invis_nodes[0].get_name()))
+def find_function(ast: Node, fn_name: str) -> Optional[syntree.Function]:
+    """Find the declaration of the function named fn_name"""
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, syntree.Function) and node.fn_name is not None:
+            if syntree.FunctionCall.get_fn_name(node.fn_name) == fn_name:
+                return node
+        stack.extend(node.children)
 
-    # for i in range(1, len(node.children)):
-    #     child1 = invis_nodes[i]
-    #     child2 = invis_nodes[i + 1]
+    return None
 
-    #     # child_name1 = f"{child1.get_name()}_{cache[child1.get_name()]}"
-    #     # child_name2 = f"{child2.get_name()}_{cache[child2.get_name()]}"
-    #     child_name1 = child1.get_name()
-    #     child_name2 = child2.get_name()
 
-    #     graph.add_edge(
-    #         pydot.Edge(child_name1, child_name2, rank="same", style="invis", weight=100)
-    #     )
+def write_dot(ast: Node, out: TextIO, max_nodes: Optional[int] = None):
+    """Write the AST to out in dot format
 
-    # for i, j in zip(children, invis_nodes[1:]):
-    #     graph.add_edge(pydot.Edge(i.get_name(), j.get_name()))
+    Nodes are written level by level. Once max_nodes nodes have been
+    written, the remaining subtrees are each collapsed into a single node
+    showing how many nodes it hides.
+    """
+    out.write("digraph AST {\n")
+    out.write('graph [nodesep="1.0", ranksep="1.0", splines="ortho", overlap="False"];\n')
 
-
-def draw_AST(ast: Node):
-    graph = pydot.Dot(
-        "AST",
-        graph_type="digraph",
-        nodesep=1.0,
-        ranksep=1.0,
-        splines="ortho",
-        overlap=False,
-    )
     cache = defaultdict(lambda: 0)
 
-    node_name = get_node_name(ast, cache)
-    graph.add_node(pydot.Node(node_name, label="START", fillcolor="white"))
-
-    _recur_draw(graph, cache, ast)
-
-    graph.write("ast.dot")
-    graph.write("ast.png", format="png")
-
-    return graph
+    root_name = get_node_name(ast, cache)
+    if ast.name == "start":
+        write_node(out, root_name, label="START", fillcolor="white")
+    else:
+        fillcolor, color = get_node_colors(ast)
+        write_node(
+            out,
+            root_name,
+            label=get_node_label(ast, cache),
+            fillcolor=fillcolor,
+            color=color,
+        )
+    num_nodes = 1
+
+    queue = deque([(ast, root_name)])
+    while queue:
+        node, node_name = queue.popleft()
+
+        for child in node.children:
+            cache[child.name] += 1
+            child_name = get_node_name(child, cache)
+
+            if max_nodes is not None and num_nodes >= max_nodes:
+                write_node(
+                    out,
+                    child_name,
+                    label=f"{child.name}\n... {count_nodes(child)} nodes",
+                    group=node_name,
+                    style="dashed",
+                )
+            else:
+                fillcolor, color = get_node_colors(child)
+                write_node(
+                    out,
+                    child_name,
+                    label=get_node_label(child, cache),
+                    group=node_name,
+                    fillcolor=fillcolor,
+                    color=color,
+                )
+                num_nodes += 1
+                queue.append((child, child_name))
+
+            write_edge(out, node_name, child_name, weight=1.5)
+
+    out.write("}\n")
+
+
+def draw_AST(
+    ast: Node,
+    filename: str = "ast",
+    png: bool = True,
+    function: Optional[str] = None,
+    max_nodes: Optional[int] = None,
+):
+    """Write the AST to <filename>.dot and, if png is set, render
+    <filename>.png using Graphviz
+
+    If function is given, only the subtree of that function is drawn.
+    """
+    if function is not None:
+        fn_node = find_function(ast, function)
+        if fn_node is None:
+            raise ValueError(f"Function {function} not found in the AST")
+        ast = fn_node
+
+    with open(f"{filename}.dot", "wt", encoding="utf-8") as out:
+        write_dot(ast, out, max_nodes)
+
+    if png:
+        subprocess.run(
+            ["dot", "-Tpng", f"{filename}.dot", "-o", f"{filename}.png"], check=True
+        )
@@ -1,26 +1,168 @@
-from colorama import Fore, Style
+import bisect
+import mmap
+import os
+import re
+import sys
+from array import array
+from typing import Optional
 
-lines = []
 package_name = None
 
+# files at least this big are read through a memory map
+MMAP_THRESHOLD = 1 << 20
+
+
+class SourceFile:
+    """Source code being compiled, with the offsets of the starts of its lines
+
+    The text is kept once: lines are sliced out of it when they are printed in
+    diagnostics, and the line and column of a position are found by a binary
+    search in the line starts. Line numbers and columns start at 1.
+
+    A newline is added at the end of the text if it is missing (the lexer
+    needs it to insert the last semicolon).
+    """
+
+    def __init__(self, text: str, name: Optional[str] = None):
+        if not text.endswith("\n"):
+            text += "\n"
+
+        self.text = text
+        self.name = name
+
+        line_starts = array("Q", [0])
+        find = text.find
+        pos = find("\n")
+        while pos >= 0:
+            line_starts.append(pos + 1)
+            pos = find("\n", pos + 1)
+        self.line_starts = line_starts
+
+    @classmethod
+    def read(cls, path: str) -> "SourceFile":
+        """Read the file at path (as UTF-8, with universal newlines)
+
+        Big files are decoded straight from a memory map, without reading
+        them into a bytes object first.
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+                text = f.read().decode("utf-8")
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    text = str(data, "utf-8")
+
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+        return cls(text, path)
+
+    @property
+    def num_lines(self) -> int:
+        return len(self.line_starts)
+
+    def line(self, lineno: int) -> str:
+        """Text of the line lineno, without its newline
+
+        Out of range line numbers behave like indices of the list of lines
+        (0 is the last line).
+        """
+        line_starts = self.line_starts
+        index = lineno - 1
+        start = line_starts[index]
+        if index < 0:
+            index += len(line_starts)
+
+        if index + 1 < len(line_starts):
+            return self.text[start : line_starts[index + 1] - 1]
+        return self.text[start:]
+
+    def lineno(self, pos: int) -> int:
+        """Line of the character at position pos"""
+        return bisect.bisect_right(self.line_starts, pos)
+
+    def column(self, pos: int) -> int:
+        """Column of the character at position pos"""
+        line_start = self.line_starts[bisect.bisect_right(self.line_starts, pos) - 1]
+        return pos - line_start + 1
+
+
+# source code being compiled, set by go_lexer.set_input
+source = SourceFile("")
+
+_colors = None
+
+
+class _NoColor:
+    """Stands in for colorama's Fore and Style when colors are off"""
+
+    def __getattr__(self, name):
+        return ""
+
+
+def use_colors() -> bool:
+    """Whether errors are printed in color
+
+    This is decided from the terminal the compiler was started on
+    (sys.__stdout__), not from sys.stdout, which may be redirected to a log
+    or a buffer when the first colored line is printed: the output is plain
+    text everywhere when it is not a terminal.
+    """
+    return sys.__stdout__ is not None and sys.__stdout__.isatty()
+
+
+def colors():
+    """Returns colorama's Fore and Style, or stand-ins printing nothing
+
+    colorama is imported (and initialized) the first time something is
+    printed in color, not when the compiler starts.
+    """
+    global _colors
+
+    if _colors is None:
+        if use_colors():
+            import colorama
+
+            # the escape codes are kept as they are, colorama only has to
+            # convert them on Windows consoles
+            colorama.init(strip=False)
+            _colors = (colorama.Fore, colorama.Style)
+        else:
+            _colors = (_NoColor(), _NoColor())
+
+    return _colors
+
+
+# ANSI escape codes setting the colors printed by colors()
+COLOR_CODE_RE = re.compile(r"\x1b\[[0-9;]*m")
+
+
+def strip_colors(text: str) -> str:
+    """text without its color escape codes"""
+    return COLOR_CODE_RE.sub("", text)
+
 
 def print_lexer_error(err_str=""):
+    Fore, Style = colors()
     print(f"{Fore.RED}ERROR: {err_str}{Style.RESET_ALL}")
 
 
 def print_error(err_str="", kind="SYNTAX ERROR"):
+    Fore, Style = colors()
     print(f"{Fore.RED}{kind}: {err_str}{Style.RESET_ALL}")
 
 
 def print_line(lineno):
+    Fore, Style = colors()
     print(
         f"{Fore.GREEN}{lineno:>10}:\t{Style.RESET_ALL}",
-        lines[lineno - 1].expandtabs(1),
+        source.line(lineno).expandtabs(1),
         sep="",
     )
 
 
 def print_marker(pos, width=1):
+    Fore, Style = colors()
     print(
         Fore.YELLOW,
         " " * 10,
@@ -33,7 +175,7 @@ def print_marker(pos, width=1):
 
 
 def print_line_marker_nowhitespace(lineno):
-    line = lines[lineno - 1]
+    line = source.line(lineno)
     line = line.expandtabs(1)
     leading_spaces = len(line) - len(line.lstrip(" "))
     ending_spaces = len(line) - len(line.rstrip(" "))